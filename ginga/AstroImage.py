@@ -10,18 +10,198 @@
 #
 import sys, os
 import math
+import copy
 import logging
+import threading, Queue
+import gzip
+import warnings
+import mmap
 
-from ginga import iqcalc, wcs
+from ginga import iqcalc, wcs, RegionReader, TileCompress
 # TEMP
 import time
 
 import pyfits
 import numpy
 
-from ginga.BaseImage import BaseImage, ImageError
+from ginga.BaseImage import BaseImage, ImageError, ProgressFile
 from ginga.misc import Bunch
 
+# FITS files are made of blocks of 2880 bytes; headers of 80-char cards
+fits_block_size = 2880
+fits_card_size = 80
+
+# Default number of files read at once when scanning headers in bulk
+default_scan_threads = 8
+
+# Default number of files remembered as having passed verification
+default_verified_files = 10000
+
+# Default size (in bytes) of the chunks in which memory-mapped data is
+# converted to native byte order
+default_native_chunk = 16 * 1024 * 1024
+
+# Keywords that make pywcs read lookup tables from other HDUs of the file,
+# so that the WCS has to be made while the file is still open
+wcs_fobj_keywords = ('CPDIS1', 'CPDIS2', 'D2IMFILE', 'AXISCORR')
+
+
+class LazyHeader(dict):
+    """The keywords of a FITS header, as a dict of upper-case keyword
+    to value.
+
+    The cards of the pyfits _header_ are only copied in on the first
+    call that needs all of them (keys(), items(), len(), a change, etc.).
+    Until then single keywords are looked up directly in _header_, so
+    that loading an image and showing it need not wait on the copying of
+    a long header.  keys() gives the keywords in the order of the file.
+    """
+
+    # keywords of which there may be many cards
+    commentary_keywords = ('', 'COMMENT', 'HISTORY')
+
+    def __init__(self, header=None):
+        dict.__init__(self)
+        self._header = header
+        self._pending = (header != None)
+        self._keyorder = []
+
+    def _fill(self):
+        if not self._pending:
+            return
+        header, self._header = self._header, None
+        self._pending = False
+        for kwd, val in header.items():
+            kwd = kwd.upper()
+            if not dict.__contains__(self, kwd):
+                self._keyorder.append(kwd)
+            dict.__setitem__(self, kwd, val)
+
+    def _can_peek(self, kwd):
+        # whether _kwd_ can be looked up in the pyfits header, with the
+        # same result as in the filled dict
+        return (self._pending and isinstance(kwd, str) and
+                (kwd == kwd.upper()) and
+                (not kwd in self.commentary_keywords))
+
+    def __getitem__(self, kwd):
+        if self._can_peek(kwd):
+            try:
+                return self._header[kwd]
+            except (KeyError, IndexError):
+                raise KeyError(kwd)
+        self._fill()
+        return dict.__getitem__(self, kwd)
+
+    def get(self, kwd, default=None):
+        try:
+            return self[kwd]
+        except KeyError:
+            return default
+
+    def __contains__(self, kwd):
+        if self._can_peek(kwd):
+            return kwd in self._header
+        self._fill()
+        return dict.__contains__(self, kwd)
+
+    def has_key(self, kwd):
+        return self.__contains__(kwd)
+
+    def __setitem__(self, kwd, value):
+        self._fill()
+        if not dict.__contains__(self, kwd):
+            self._keyorder.append(kwd)
+        dict.__setitem__(self, kwd, value)
+
+    def __delitem__(self, kwd):
+        self._fill()
+        dict.__delitem__(self, kwd)
+
+    def update(self, *args, **kwds):
+        for other in args + (kwds,):
+            if hasattr(other, 'keys'):
+                other = [ (kwd, other[kwd]) for kwd in other.keys() ]
+            for kwd, value in other:
+                self[kwd] = value
+
+    def setdefault(self, kwd, default=None):
+        if not kwd in self:
+            self[kwd] = default
+        return self[kwd]
+
+    def pop(self, kwd, *args):
+        self._fill()
+        return dict.pop(self, kwd, *args)
+
+    def popitem(self):
+        self._fill()
+        return dict.popitem(self)
+
+    def clear(self):
+        self._fill()
+        dict.clear(self)
+        self._keyorder = []
+
+    def keys(self):
+        self._fill()
+        keys = filter(lambda kwd: dict.__contains__(self, kwd),
+                      self._keyorder)
+        if len(keys) != dict.__len__(self):
+            # keywords that were deleted and set again go where they
+            # were last set
+            seen = set([])
+            keys = [ kwd for kwd in reversed(keys)
+                     if not (kwd in seen or seen.add(kwd)) ]
+            keys.reverse()
+            self._keyorder = keys
+        return list(keys)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    def items(self):
+        return [ (kwd, dict.__getitem__(self, kwd)) for kwd in self.keys() ]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def values(self):
+        return [ dict.__getitem__(self, kwd) for kwd in self.keys() ]
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def __len__(self):
+        self._fill()
+        return dict.__len__(self)
+
+    def copy(self):
+        if self._pending:
+            # (the pyfits header is only ever read)
+            return LazyHeader(self._header)
+        hdr = LazyHeader()
+        hdr.update(self)
+        return hdr
+
+    def __repr__(self):
+        self._fill()
+        return dict.__repr__(self)
+
+    def __eq__(self, other):
+        self._fill()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __reduce__(self):
+        return (LazyHeader, (), None, None, self.iteritems())
+
+
 class AstroImage(BaseImage):
     """
     Abstraction of an astronomical data (image).
@@ -33,6 +213,8 @@ class AstroImage(BaseImage):
                  logger=None):
         if not wcsclass:
             wcsclass = wcs.WCS
+        # header from which the WCS is still to be made, and its file
+        self._wcs_pending = None
         self.wcs = wcsclass()
 
         BaseImage.__init__(self, data_np=data_np, metadata=metadata,
@@ -40,9 +222,28 @@ class AstroImage(BaseImage):
         
         self.iqcalc = iqcalc.IQCalc(logger=logger)
 
-
-    def load_hdu(self, hdu, fobj=None, naxispath=None):
-        data = hdu.data
+        # FITS file held open while a memory-mapped image is in use
+        self.fits_f = None
+        # reader of an image whose data is read on demand
+        self.reader = None
+
+
+    def load_hdu(self, hdu, fobj=None, naxispath=None, data=None,
+                 native=False, unscaled=False):
+        """Load the image from _hdu_.  If _native_ is True the (big-endian)
+        FITS data is converted once to native byte order, so that later
+        operations on it take the fast paths.  Any BSCALE/BZERO scaling
+        still in the data (i.e. if the file was opened with pyfits'
+        do_not_scale_image_data) is applied as part of the conversion, to
+        only the plane selected by _naxispath_.
+
+        If _unscaled_ is True (the file was opened with
+        do_not_scale_image_data) any scaling is applied to the plane
+        selected even if _native_ is False; data that needs no scaling is
+        left as it is (e.g. memory-mapped).
+        """
+        if data == None:
+            data = hdu.data
         if len(data.shape) < 2:
             # Expand 1D arrays into 1xN array
             data = data.reshape((1, data.shape[0]))
@@ -53,33 +254,202 @@ class AstroImage(BaseImage):
             for idx in naxispath:
                 data = data[idx]
 
-        self.set_data(data)
-
-        # Load in FITS header
-        self.update_keywords(hdu.header)
-        # Preserve the ordering of the FITS keywords in the FITS file
-        keyorder = [ key for key, val in hdu.header.items() ]
-        self.set(keyorder=keyorder)
+        header = hdu.header
+        if (native or unscaled) and isinstance(data, numpy.ndarray):
+            data, scaled = self._to_native(data, header, swap=native)
+            if scaled:
+                # keywords no longer apply to the data
+                header = header.copy()
+                for kwd in ('BSCALE', 'BZERO', 'BLANK'):
+                    if kwd in header:
+                        del header[kwd]
 
-        # Try to make a wcs object on the header
-        self.wcs.load_header(hdu.header, fobj=fobj)
+        self.set_data(data)
 
-    def load_file(self, filepath, numhdu=None, naxispath=None):
+        # Load in FITS header.  The cards are copied in (and the keyword
+        # order of the file kept) only when the whole header is wanted,
+        # and the WCS is made on the first coordinate conversion.
+        self.metadata['header'] = LazyHeader(header)
+        self.metadata.pop('keyorder', None)
+        self.set_wcs_header(header, fobj=fobj)
+
+    def set_wcs_header(self, header, fobj=None):
+        """Make the WCS from _header_ when it is first used.  (If pywcs
+        needs to read other HDUs of the file _fobj_ for the WCS, it is
+        made right away, while the file is still open.)
+        """
+        if (fobj != None) and \
+               (len(filter(lambda kwd: kwd in header, wcs_fobj_keywords)) > 0):
+            self._wcs_pending = None
+            self._wcs.load_header(header, fobj=fobj)
+        else:
+            self._wcs_pending = (header, None)
+
+    def get_wcs(self):
+        pending = self._wcs_pending
+        if pending != None:
+            self._wcs_pending = None
+            header, fobj = pending
+            self._wcs.load_header(header, fobj=fobj)
+        return self._wcs
+
+    def set_wcs(self, wcsobj):
+        self._wcs_pending = None
+        self._wcs = wcsobj
+
+    wcs = property(get_wcs, set_wcs)
+
+    def _to_native(self, data, header, swap=True):
+        """Returns _data_ in native byte order, scaled by the BSCALE and
+        BZERO of _header_ (and with any BLANK values made NaN), and
+        whether any scaling was done.  In-memory data is byte-swapped in
+        place; memory-mapped data is copied a chunk at a time.  If _swap_
+        is False data that needs no scaling is returned as it is.
+        """
+        bscale = header.get('BSCALE', 1)
+        bzero = header.get('BZERO', 0)
+        blank = header.get('BLANK', None)
+        if data.dtype.kind not in 'iuf':
+            return data, False
+        if data.dtype.kind == 'f':
+            # BLANK only applies to integer data
+            blank = None
+        dtype = RegionReader.scaled_dtype(data.dtype, bscale, bzero,
+                                          blank=blank)
+        scaled = (bscale != 1) or (bzero != 0) or (blank != None)
+        if (not scaled) and (data.dtype.isnative or not swap):
+            return data, False
+
+        if (not scaled) and data.flags.writeable and not is_memmap(data):
+            data.byteswap(True)
+            return data.view(dtype), False
+
+        out = numpy.empty(data.shape, dtype=dtype)
+        rowbytes = max(1, data[:1].nbytes)
+        chunk = max(1, default_native_chunk // rowbytes)
+        for i in xrange(0, data.shape[0], chunk):
+            out[i:i+chunk] = RegionReader.scale_data(data[i:i+chunk], dtype,
+                                                     bscale, bzero,
+                                                     blank=blank)
+        return out, scaled
+
+    def load_file(self, filepath, numhdu=None, naxispath=None,
+                  memmap=None, ondemand=False, progress_cb=None,
+                  native=False, verify=True):
+        """Load the image from FITS file _filepath_.  If _memmap_ is True
+        the data is memory-mapped and paged in from the file only as it
+        is accessed, so that very large images can be opened quickly; the
+        file is then held open until close() is called.  Scaled data
+        (i.e. with BSCALE/BZERO/BLANK, which pyfits cannot memory-map) is
+        read unscaled and the plane used scaled into memory, as with
+        _native_.  If _memmap_ is None pyfits' default is used.
+
+        If _ondemand_ is True the data is not loaded at all; instead a
+        RegionReader reads just the regions that are asked for from the
+        file (scaling them as they are read).  This is for images too
+        large to map into memory.
+
+        Tile-compressed (e.g. fpack'ed) image HDUs are decompressed by a
+        TileCompress.TileReader, which spreads the tiles over a pool of
+        processes; with _ondemand_ only the tiles overlapping the regions
+        asked for are decompressed.
+
+        If _progress_cb_ is given (and neither _memmap_ nor _ondemand_)
+        the file is read through a ProgressFile, calling
+        progress_cb(nread, total) after each chunk; the load can be
+        abandoned by raising an exception from it.
+
+        If _native_ is True the data is converted to native byte order
+        at load (see load_hdu()).  Scaled data is then left unscaled by
+        pyfits, so that only the plane used is scaled (to float32 where
+        that is exact).  A memory-mapped image is copied into memory by
+        the conversion, unless its data needs none.
+
+        If _verify_ is True the file is checked (and any errors fixed) by
+        pyfits' verify, unless it was found to be clean at an earlier
+        load and has not changed since (see verified_clean()).  If it is
+        False, or the file is known to be clean, verification is only
+        done if loading the image fails.
+        """
         self.logger.debug("Loading file '%s' ..." % (filepath))
-        self.set(path=filepath)
-        fits_f = pyfits.open(filepath, 'readonly')
-
-        # this seems to be necessary now for some fits files...
+        # release any file held by a previous memory-mapped load
+        self.close()
+        self.set(path=filepath, memmap=bool(memmap), ondemand=ondemand)
+        if (progress_cb != None) and not (memmap or ondemand):
+            # the data is read (into the arrays of pyfits) as it is
+            # loaded, reporting the progress
+            fileobj = ProgressFile(filepath, progress_cb=progress_cb)
+        else:
+            fileobj = filepath
+        kwdargs = {}
+        unscaled = (native or memmap) and not ondemand
+        if unscaled:
+            kwdargs['do_not_scale_image_data'] = True
         try:
-            fits_f.verify('fix')
+            fits_f = pyfits.open(fileobj, 'readonly', memmap=memmap,
+                                 **kwdargs)
         except Exception, e:
-            raise ImageError("Error loading fits file '%s': %s" % (
-                fitspath, str(e)))
+            if fileobj is not filepath:
+                fileobj.close()
+            raise
 
+        # this seems to be necessary now for some fits files...
+        if verify and not verified_clean(filepath):
+            verify_fits(fits_f, filepath)
+            memmap = self._load_hdulist(fits_f, filepath, numhdu, naxispath,
+                                        memmap, ondemand, native, unscaled)
+        else:
+            try:
+                memmap = self._load_hdulist(fits_f, filepath, numhdu,
+                                            naxispath, memmap, ondemand,
+                                            native, unscaled)
+            except Exception, e:
+                if getattr(fileobj, 'abandoned', None) != None:
+                    # the load was abandoned, e.g. cancelled
+                    fits_f.close()
+                    raise
+                self.logger.debug("Verifying '%s' after load error: %s" % (
+                    filepath, str(e)))
+                forget_verified(filepath)
+                verify_fits(fits_f, filepath)
+                memmap = self._load_hdulist(fits_f, filepath, numhdu,
+                                            naxispath, memmap, ondemand,
+                                            native, unscaled)
+
+        # Set the name to the filename (minus extension) if no name
+        # currently exists for this image
+        name = self.get('name', None)
+        if name == None:
+            dirpath, filename = os.path.split(filepath)
+            name, ext = os.path.splitext(filename)
+            self.set(name=name)
+
+        if memmap:
+            self.fits_f = fits_f
+        else:
+            fits_f.close()
+
+    def _load_hdulist(self, fits_f, filepath, numhdu, naxispath, memmap,
+                      ondemand, native, unscaled):
+        # load the image from HDU _numhdu_ (or the first one with image
+        # data) of the opened file _fits_f_; returns whether the data is
+        # still memory-mapped
         if numhdu == None:
             found_valid_hdu = False
             for i in range(len(fits_f)):
                 hdu = fits_f[i]
+                numhdu = i
+                if isinstance(hdu, pyfits.CompImageHDU):
+                    # tile-compressed image--decompressed below
+                    found_valid_hdu = True
+                    break
+                if ondemand:
+                    # decide from the header, without reading the data
+                    if (isinstance(hdu, (pyfits.PrimaryHDU, pyfits.ImageHDU))
+                        and (hdu.header.get('NAXIS', 0) > 0)):
+                        found_valid_hdu = True
+                        break
+                    continue
                 if hdu.data == None:
                     # compressed FITS file or non-pixel data hdu?
                     continue
@@ -97,17 +467,80 @@ class AstroImage(BaseImage):
         else:
             hdu = fits_f[numhdu]
         
-        self.load_hdu(hdu, fobj=fits_f, naxispath=naxispath)
-
-        # Set the name to the filename (minus extension) if no name
-        # currently exists for this image
-        name = self.get('name', None)
-        if name == None:
-            dirpath, filename = os.path.split(filepath)
-            name, ext = os.path.splitext(filename)
-            self.set(name=name)
-        
-        fits_f.close()
+        if isinstance(hdu, pyfits.CompImageHDU):
+            # Decompress the tiles ourselves, in parallel.  The reader
+            # needs the header of the tile table (hdu._header), which
+            # pyfits alters once it has decompressed the data.
+            offset = fits_f.fileinfo(numhdu)['datLoc']
+            reader = TileCompress.TileReader(filepath, offset, hdu._header,
+                                             naxispath=naxispath,
+                                             logger=self.logger)
+            if ondemand:
+                self.reader = reader
+                data = reader
+            else:
+                data = reader[:, :]
+                reader.close()
+            self.set(memmap=False)
+            self.load_hdu(hdu, fobj=fits_f, data=data)
+        elif ondemand:
+            offset = fits_f.fileinfo(numhdu)['datLoc']
+            self.reader = RegionReader.RegionReader(filepath, offset,
+                                                    hdu.header,
+                                                    naxispath=naxispath,
+                                                    logger=self.logger)
+            self.load_hdu(hdu, fobj=fits_f, data=self.reader)
+        else:
+            self.load_hdu(hdu, fobj=fits_f, naxispath=naxispath,
+                          native=native, unscaled=unscaled)
+            if memmap and not is_memmap(self.get_data()):
+                # the data was copied to convert it
+                self.set(memmap=False)
+                memmap = False
+        return memmap
+
+    def close(self):
+        """Release the FITS file held open by a memory-mapped image, or
+        by an image read on demand.  The data remains usable.
+        """
+        if self.reader != None:
+            self.reader.close()
+            self.reader = None
+        if self.fits_f != None:
+            try:
+                self.fits_f.close()
+            except Exception, e:
+                self.logger.warn("Error closing '%s': %s" % (
+                    self.get('path', 'N/A'), str(e)))
+            self.fits_f = None
+
+    def share(self):
+        """Returns a new image that shares the data of this one, e.g.
+        for showing the same image in another channel.  It starts with
+        copies of the header, metadata, WCS and statistics (min/max, cut
+        levels) of this one, which are then its own.  The shared data
+        must not be modified.
+        """
+        other = self.__class__(logger=self.logger)
+        other.set_data(self.get_data())
+        other.metadata = self.metadata.copy()
+        if self.metadata.has_key('header'):
+            other.metadata['header'] = self.get_header().copy()
+        # (a WCS is loaded again by replacing its parts, not in place)
+        other._wcs = copy.copy(self._wcs)
+        other._wcs_pending = self._wcs_pending
+        other.cutcache = self.cutcache.copy()
+        # products of the (read-only) data alone
+        other._inthist = self._inthist
+        other.ingest = self.ingest
+        # the file stays open until the last image sharing it is closed
+        other.fits_f = self.fits_f
+        if self._have_minmax:
+            other.minval, other.maxval = self.minval, self.maxval
+            other.minval_noinf = self.minval_noinf
+            other.maxval_noinf = self.maxval_noinf
+            other._have_minmax = True
+        return other
 
     def load_buffer(self, data, dims, dtype, byteswap=False,
                     metadata=None, redraw=True):
@@ -174,7 +607,7 @@ class AstroImage(BaseImage):
             hdr[kwd.upper()] = val
 
         # Try to make a wcs object on the header
-        self.wcs.load_header(hdr)
+        self.set_wcs_header(hdr)
 
     def set_keywords(self, **kwds):
         """Set an item in the fits header, if any."""
@@ -194,14 +627,14 @@ class AstroImage(BaseImage):
 
         # refresh the WCS
         header = self.get_header()
-        self.wcs.load_header(header)
+        self.set_wcs_header(header)
 
     def update_hdu(self, hdu, fobj=None, astype=None):
         self.update_data(hdu.data, astype=astype)
         self.update_keywords(hdu.header)
 
         # Try to make a wcs object on the header
-        self.wcs.load_header(hdu.header, fobj=fobj)
+        self.set_wcs_header(hdu.header, fobj=fobj)
 
     def update_file(self, path, index=0, astype=None):
         fits_f = pyfits.open(path, 'readonly')
@@ -311,6 +744,9 @@ class AstroImage(BaseImage):
     def radectopix(self, ra_deg, dec_deg, coords='data'):
         return self.wcs.radectopix(ra_deg, dec_deg, coords=coords)
 
+    def radectopix_arrays(self, ra_deg, dec_deg, coords='data'):
+        return self.wcs.radectopix_arrays(ra_deg, dec_deg, coords=coords)
+
     def dispos(self, dra0, decd0, dra, decd):
         """
         Source/credit: Skycat
@@ -660,6 +1096,10 @@ class AstroImage(BaseImage):
         
         # drop each image in the right place in the new data array
         newdata = self.get_data()
+        if not newdata.flags.writeable:
+            # e.g. shared with other images (see share())
+            newdata = newdata.copy()
+            self.set_data(newdata)
         for image in imagelist:
             name = image.get('name', 'NoName')
             wd, ht = image.get_size()
@@ -730,4 +1170,218 @@ class AstroImage(BaseImage):
                            value=value)
         return info
                            
+
+def _parse_card_value(text):
+    """Parse the value field of a FITS header card."""
+    text = text.strip()
+    if text.startswith("'"):
+        # string value: runs to the next lone quote ('' is an escaped quote)
+        i, chars = 1, []
+        while i < len(text):
+            if text[i] == "'":
+                if text[i+1:i+2] == "'":
+                    chars.append("'")
+                    i += 2
+                    continue
+                break
+            chars.append(text[i])
+            i += 1
+        return ''.join(chars).rstrip()
+
+    # strip any comment
+    text = text.split('/', 1)[0].strip()
+    if text == 'T':
+        return True
+    elif text == 'F':
+        return False
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text.replace('D', 'E'))
+    except ValueError:
+        return text
+
+def _read_header_cards(in_f):
+    """Read one header from the current position of file object _in_f_.
+    Returns a list of (keyword, value) pairs, or None at end of file.
+    """
+    cards = []
+    while True:
+        block = in_f.read(fits_block_size)
+        if len(block) < fits_block_size:
+            if len(cards) == 0:
+                return None
+            raise ImageError("Truncated FITS header")
+        if (len(cards) == 0) and (block[:8].rstrip() not in ('SIMPLE',
+                                                             'XTENSION')):
+            raise ImageError("Not a FITS header")
+
+        for i in xrange(0, fits_block_size, fits_card_size):
+            card = block[i:i+fits_card_size]
+            kwd = card[:8].rstrip()
+            if kwd == 'END':
+                return cards
+            if kwd == 'HIERARCH':
+                kwd, sep, text = card[9:].partition('=')
+                if sep:
+                    cards.append((kwd.strip(), _parse_card_value(text)))
+            elif kwd == 'CONTINUE':
+                # long string value continued from the previous card
+                if (len(cards) > 0) and isinstance(cards[-1][1], str):
+                    kwd, val = cards[-1]
+                    if val.endswith('&'):
+                        val = val[:-1]
+                    cards[-1] = (kwd, val + _parse_card_value(card[8:]))
+            elif card[8:10] == '= ':
+                cards.append((kwd, _parse_card_value(card[10:])))
+
+def _data_size(header):
+    """Size in bytes (padded to whole blocks) of the data following
+    a header.
+    """
+    naxis = header.get('NAXIS', 0)
+    if naxis == 0:
+        return 0
+    dims = [ header.get('NAXIS%d' % (i+1), 0) for i in xrange(naxis) ]
+    if (dims[0] == 0) and header.get('GROUPS', False):
+        # random groups
+        dims = dims[1:]
+    size = 1
+    for dim in dims:
+        size *= dim
+    size = (abs(header.get('BITPIX', 8)) // 8) * header.get('GCOUNT', 1) * \
+           (header.get('PCOUNT', 0) + size)
+    nblocks = (size + fits_block_size - 1) // fits_block_size
+    return nblocks * fits_block_size
+
+def read_header(filepath, numhdu=None):
+    """Read only the header of HDU _numhdu_ of FITS file _filepath_,
+    seeking past the data of any HDUs before it.  If _numhdu_ is None
+    the first HDU with data is used, as in AstroImage.load_file().
+
+    Returns a dict of the keywords and values (commentary cards are
+    skipped); the HDU number is stored under '_numhdu' and the order of
+    the keywords under '_keyorder'.
+    """
+    if filepath.endswith('.gz'):
+        in_f = gzip.open(filepath, 'rb')
+    else:
+        in_f = open(filepath, 'rb')
+    try:
+        idx = 0
+        while True:
+            cards = _read_header_cards(in_f)
+            if cards == None:
+                raise ImageError("No data HDU found in '%s'" % (filepath))
+            header = dict(cards)
+            size = _data_size(header)
+            if (numhdu == idx) or ((numhdu == None) and (size > 0)):
+                header['_numhdu'] = idx
+                header['_keyorder'] = [ kwd for kwd, val in cards ]
+                return header
+            in_f.seek(size, 1)
+            idx += 1
+    finally:
+        in_f.close()
+
+def is_memmap(data):
+    """Returns True if numpy array _data_ is (a view of) a memory-mapped
+    file.
+    """
+    while isinstance(data, numpy.ndarray):
+        if isinstance(data, numpy.memmap):
+            return True
+        data = data.base
+    return isinstance(data, mmap.mmap)
+
+# path -> (mtime, size) of files that passed verification unchanged.
+# (This lasts only for the life of the process: files are verified again
+# when they are first loaded in a new session.)
+_verified = {}
+_verified_lock = threading.Lock()
+
+def _file_stamp(filepath):
+    st = os.stat(filepath)
+    return (st.st_mtime, st.st_size)
+
+def verified_clean(filepath):
+    """Returns True if FITS file _filepath_ passed verification at an
+    earlier load, and has not been modified since.
+    """
+    try:
+        stamp = _file_stamp(filepath)
+    except OSError:
+        return False
+    with _verified_lock:
+        return _verified.get(os.path.abspath(filepath), None) == stamp
+
+def forget_verified(filepath):
+    with _verified_lock:
+        _verified.pop(os.path.abspath(filepath), None)
+
+def verify_fits(fits_f, filepath):
+    """Verify the opened FITS file _fits_f_ (from _filepath_), fixing
+    any errors that can be fixed.  A file with no errors is remembered
+    as clean, so that later loads of it can skip verification.
+    """
+    # check first, so that a clean file (the usual case) takes one pass;
+    # whether anything was fixed can't be told from the pass that fixes
+    # it without catching its warnings, which are global state
+    try:
+        fits_f.verify('exception')
+    except pyfits.verify.VerifyError:
+        try:
+            fits_f.verify('fix')
+        except Exception, e:
+            raise ImageError("Error loading fits file '%s': %s" % (
+                filepath, str(e)))
+        return
+    except Exception, e:
+        raise ImageError("Error loading fits file '%s': %s" % (
+            filepath, str(e)))
+
+    try:
+        stamp = _file_stamp(filepath)
+    except OSError:
+        return
+    with _verified_lock:
+        if len(_verified) >= default_verified_files:
+            _verified.clear()
+        _verified[os.path.abspath(filepath)] = stamp
+
+def scan_headers(paths, numhdu=None, numthreads=default_scan_threads,
+                 logger=None):
+    """Read the headers (see read_header()) of many FITS files, with at
+    most _numthreads_ files being read at once.  Returns a dict mapping
+    each path to its header, or to None if it could not be read.
+    """
+    queue = Queue.Queue()
+    for path in paths:
+        queue.put(path)
+    results = {}
+
+    def _worker():
+        while True:
+            try:
+                path = queue.get(block=False)
+            except Queue.Empty:
+                return
+            try:
+                results[path] = read_header(path, numhdu=numhdu)
+            except Exception, e:
+                if logger != None:
+                    logger.warn("Error reading header of '%s': %s" % (
+                        path, str(e)))
+                results[path] = None
+
+    threads = [ threading.Thread(target=_worker)
+                for i in xrange(max(1, min(numthreads, len(paths)))) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
 #END
@@ -9,17 +9,17 @@
 #
 import numpy
 import time
+import threading
 
 from ginga.misc import Bunch
 
 have_scipy = True
-autocut_methods = ('minmax', 'median', 'histogram', 'stddev')
+autocut_methods = ('minmax', 'median', 'histogram', 'stddev', 'percentile')
 try:
     import scipy.ndimage.filters
     #import scipy.misc
 except ImportError:
     have_scipy = False
-    autocut_methods = ('minmax', 'histogram', 'stddev')
 
 default_autocuts_method = 'histogram'
 
@@ -31,6 +31,20 @@ default_autocuts_bins = 2048
 # the calculation of the autocuts histogram for algorithm "histogram"
 default_autocuts_hist_pct = 0.999
 
+# Maximum number of values examined by algorithm "percentile"; larger
+# inputs are sampled at a regular stride so that results are repeatable
+default_autocuts_percentile_samples = 4 * 1024 * 1024
+
+# Side length of the tiles whose medians are taken for algorithm "median"
+default_autocuts_median_length = 7
+
+# Fewest tiles from which cut levels are taken for algorithm "median"
+default_autocuts_median_min_tiles = 16
+
+# Arrays larger than this (in bytes) are histogrammed by walking them in
+# blocks of rows of about this size, rather than all at once
+default_stream_block_bytes = 64 * 1024 * 1024
+
 # Constants used to calculate the lo and hi cut levels using the
 # "stddev" algorithm (from the old SOSS fits viewer)
 hensa_lo = 35.0
@@ -45,15 +59,48 @@ class AutoCuts(object):
     def get_algorithms(self):
         return autocut_methods
     
-    def calc_cut_levels(self, image,
-                        method='histogram', pct=None, numbins=None,
-                        usecrop=True, cropradius=512):
+    def get_cache_key(self, method=None, pct=None, numbins=None,
+                      usecrop=True, cropradius=512):
+        """Returns the key under which the cut levels calculated with
+        these parameters are kept in an image's cutcache.
+        """
         if not method:
             method = default_autocuts_method
         if not pct:
             pct = default_autocuts_hist_pct
         if not numbins:
             numbins = default_autocuts_bins
+        return (method, pct, numbins, usecrop, cropradius)
+
+    def get_crop_bounds(self, width, height, cropradius=512):
+        """Returns the bounds (x0, y0, x1, y1) of the crop of an image of
+        _width_ x _height_ pixels that cut levels are calculated on.
+        """
+        x, y = width // 2, height // 2
+        if x > cropradius:
+            x0 = x - cropradius
+            x1 = x0 + cropradius*2
+        else:
+            x0 = 0
+            x1 = width-1
+        if y > cropradius:
+            y0 = y - cropradius
+            y1 = y0 + cropradius*2
+        else:
+            y0 = 0
+            y1 = height-1
+        return (x0, y0, x1, y1)
+
+    def calc_cut_levels(self, image,
+                        method='histogram', pct=None, numbins=None,
+                        usecrop=True, cropradius=512):
+        # Reuse the levels if they were already calculated for this data,
+        # e.g. ahead of time by a prefetch
+        key = self.get_cache_key(method=method, pct=pct, numbins=numbins,
+                                 usecrop=usecrop, cropradius=cropradius)
+        method, pct, numbins = key[:3]
+        if image.cutcache.has_key(key):
+            return image.cutcache[key]
 
         start_time = time.time()
 
@@ -68,65 +115,136 @@ class AutoCuts(object):
             # image and calculate the histogram on that
             if usecrop:
                 height, width = data.shape[:2]
-                x, y = width // 2, height // 2
-                if x > cropradius:
-                    x0 = x - cropradius
-                    x1 = x0 + cropradius*2
-                else:
-                    x0 = 0
-                    x1 = width-1
-                if y > cropradius:
-                    y0 = y - cropradius
-                    y1 = y0 + cropradius*2
-                else:
-                    y0 = 0
-                    y1 = height-1
-
+                x0, y0, x1, y1 = self.get_crop_bounds(width, height,
+                                                      cropradius=cropradius)
                 data = data[y0:y1, x0:x1]
             else:
                 # Use the full data!
                 pass
-                
-            if method == 'median':
-                length = 7
-                xout = scipy.ndimage.filters.median_filter(data, size=length)
-                #data_f = numpy.ravel(data)
-                #xout = medfilt1(data_f, length)
-
-                loval = numpy.nanmin(xout)
-                hival = numpy.nanmax(xout)
-
-            elif method == 'stddev':
-                # This is the method used in the old SOSS fits viewer
-                mdata = numpy.ma.masked_array(data, numpy.isnan(data))
-                mean = numpy.mean(mdata)
-                sdev = numpy.std(mdata)
-
-                hensa_lo_factor = (hensa_lo - 50.0) / 10.0
-                hensa_hi_factor = (hensa_hi - 50.0) / 10.0
-                
-                loval = hensa_lo_factor * sdev + mean
-                hival = hensa_hi_factor * sdev + mean
-                
-            elif method == 'histogram':
-                bnch = self.calc_histogram(data, pct=pct, numbins=numbins)
-                loval, hival = bnch.loval, bnch.hival
+
+            loval, hival = self.calc_data_cut_levels(data, method=method,
+                                                     pct=pct, numbins=numbins)
 
         end_time = time.time()
         self.logger.debug("cut levels calculation time=%.4f" % (
             end_time - start_time))
 
         self.logger.debug("lo=%.2f hi=%.2f" % (loval, hival))
+        image.cutcache[key] = (loval, hival)
         return (loval, hival)
 
+    def calc_data_cut_levels(self, data, method='histogram', pct=None,
+                             numbins=None):
+        """Calculate the cut levels of array _data_ by any method but
+        'minmax'.
+        """
+        if not pct:
+            pct = default_autocuts_hist_pct
+        if not numbins:
+            numbins = default_autocuts_bins
+
+        if method == 'median':
+            length = default_autocuts_median_length
+            # Block-reduce the crop to the medians of small tiles;
+            # this rejects hot pixels and cosmic rays nearly as well
+            # as a full median filter at a fraction of the cost
+            xout = self.calc_median_blocks(data, length=length)
+
+            loval = numpy.nanmin(xout)
+            hival = numpy.nanmax(xout)
+
+        elif method == 'stddev':
+            # This is the method used in the old SOSS fits viewer
+            mdata = numpy.ma.masked_array(data, numpy.isnan(data))
+            mean = numpy.mean(mdata)
+            sdev = numpy.std(mdata)
+
+            hensa_lo_factor = (hensa_lo - 50.0) / 10.0
+            hensa_hi_factor = (hensa_hi - 50.0) / 10.0
+
+            loval = hensa_lo_factor * sdev + mean
+            hival = hensa_hi_factor * sdev + mean
+
+        elif method == 'histogram':
+            bnch = self.calc_histogram(data, pct=pct, numbins=numbins)
+            loval, hival = bnch.loval, bnch.hival
+
+        elif method == 'percentile':
+            loval, hival = self.calc_percentile_cuts(data, pct=pct)
+
+        else:
+            raise ValueError("Bad autocut method '%s'" % (method))
+
+        return (loval, hival)
+
+    def calc_median_blocks(self, data, length=7,
+                           min_tiles=default_autocuts_median_min_tiles):
+        """Return an array of the medians of the (length x length) tiles
+        of _data_.  Partial tiles at the right and bottom edges are
+        dropped.  If _data_ is too small to hold _min_tiles_ tiles (the
+        extremes of a few medians make poor cut levels) then a full
+        median filter is used if scipy is available; otherwise the tiles
+        are made smaller, down to single pixels.
+        """
+        height, width = data.shape[:2]
+        nx, ny = width // length, height // length
+        if nx * ny < min_tiles:
+            if have_scipy:
+                return scipy.ndimage.filters.median_filter(data, size=length)
+            while (length > 1) and \
+                      ((width // length) * (height // length) < min_tiles):
+                length -= 1
+            if length == 1:
+                return data
+            nx, ny = width // length, height // length
+
+        rest = data.shape[2:]
+        data = data[:ny*length, :nx*length]
+        # (ny, length, nx, length, ...) -> (ny, nx, length*length, ...)
+        tiles = data.reshape((ny, length, nx, length) + rest)
+        tiles = tiles.swapaxes(1, 2).reshape((ny, nx, length*length) + rest)
+        return numpy.median(tiles, axis=2)
+
+    def calc_percentile_cuts(self, data, pct=1.0,
+                             maxsamples=default_autocuts_percentile_samples):
+        """Calculate exact cut levels keeping _pct_ of the finite values
+        of _data_ inside the cut.  The two order statistics are found
+        with a partial selection (numpy.partition) in linear time,
+        without sorting.
+        """
+        values = numpy.ravel(data)
+        values = values[numpy.isfinite(values)]
+        num = len(values)
+        if num == 0:
+            return (0.0, 0.0)
+        if num > maxsamples:
+            # a fixed stride (not a random sample) makes the levels
+            # reproducible from run to run
+            stride = int(numpy.ceil(float(num) / maxsamples))
+            values = values[::stride]
+            num = len(values)
+
+        # (rounded, as e.g. 10 * (1.0 - 0.8) / 2.0 is just under 1)
+        k_lo = min(int(round(num * (1.0 - pct) / 2.0)), (num - 1) // 2)
+        k_hi = num - 1 - k_lo
+        values = numpy.partition(values, (k_lo, k_hi))
+        self.logger.debug("percentile cuts: n=%d k_lo=%d k_hi=%d" % (
+            num, k_lo, k_hi))
+        return (values[k_lo], values[k_hi])
+
     def calc_histogram(self, data, pct=1.0, numbins=2048):
+        if data.nbytes > default_stream_block_bytes:
+            # Probably memory-mapped or lazily loaded--don't try to
+            # bring it all into memory at once
+            return self.calc_histogram_streaming(data, pct=pct,
+                                                 numbins=numbins)
+
         self.logger.debug("Computing histogram, pct=%.4f numbins=%d" % (
         pct, numbins))
         height, width = data.shape[:2]
         self.logger.debug("Median analysis array is %dx%d" % (
             width, height))
 
-        total_px = width * height
         dsum = numpy.sum(data)
         if numpy.isnan(dsum) or numpy.isinf(dsum):
             # Oh crap, the array has a NaN or Inf value.
@@ -152,6 +270,27 @@ class AutoCuts(object):
             dist, bins = numpy.histogram(data, bins=numbins,
                                          density=False)
 
+        return self.calc_hist_cuts(dist, bins, pct=pct)
+
+    def calc_histogram_streaming(self, data, pct=1.0, numbins=2048,
+                                 block_bytes=default_stream_block_bytes):
+        """Like calc_histogram(), but walks _data_ in blocks of rows so
+        that only one block is in memory at a time.  Non-finite values
+        are left out of the histogram.
+        """
+        self.logger.debug("Computing streaming histogram, pct=%.4f numbins=%d" % (
+            pct, numbins))
+        sh = StreamingHistogram(numbins=numbins, block_bytes=block_bytes,
+                                logger=self.logger)
+        dist, bins = sh.calc(data)
+        return self.calc_hist_cuts(dist, bins, pct=pct)
+
+    def calc_hist_cuts(self, dist, bins, pct=1.0):
+        """Calculate the low and high cut levels from a distribution
+        _dist_ over the bin edges _bins_ (as returned by numpy.histogram),
+        keeping _pct_ of the pixels inside the cut.
+        """
+        total_px = numpy.sum(dist)
         cutoff = int((float(total_px)*(1.0-pct))/2.0)
         top = len(dist)-1
         self.logger.debug("top=%d cutoff=%d" % (top, cutoff))
@@ -217,4 +356,91 @@ class AutoCuts(object):
         data = f.clip(0.0, 1.0) * vmax
         return data
 
+
+class StreamingHistogram(object):
+    """Calculates the histogram of an array that may be too large to
+    bring into memory at once, such as a memory-mapped FITS HDU.
+
+    The array is walked along its first axis in blocks of whole rows of
+    about _block_bytes_ each, in two passes: the first discovers the
+    range of the finite values and the second bins them over that range,
+    adding up the partial histograms of the blocks.  stop() (e.g. from
+    another thread) abandons the calculation.
+    """
+
+    def __init__(self, numbins=default_autocuts_bins,
+                 block_bytes=default_stream_block_bytes, logger=None):
+        self.numbins = numbins
+        self.block_bytes = block_bytes
+        self.logger = logger
+        self.ev_stop = threading.Event()
+
+    def stop(self):
+        self.ev_stop.set()
+
+    def is_stopped(self):
+        return self.ev_stop.isSet()
+
+    def iter_blocks(self, data):
+        """Generator yielding (rows_done, rows_total, values) where
+        _values_ are the finite values of the next block of rows.
+        """
+        numrows = data.shape[0]
+        row_bytes = max(1, data[0:1].nbytes)
+        step = max(1, self.block_bytes // row_bytes)
+        for i in xrange(0, numrows, step):
+            if self.ev_stop.isSet():
+                return
+            block = numpy.asarray(data[i:i+step])
+            yield (min(i+step, numrows), numrows,
+                   block[numpy.isfinite(block)])
+
+    def find_range(self, data):
+        """First pass: return (minval, maxval) of the finite values of
+        _data_, or None if stopped.
+        """
+        minval, maxval = None, None
+        for n, total, values in self.iter_blocks(data):
+            if len(values) == 0:
+                continue
+            lo, hi = values.min(), values.max()
+            if minval == None:
+                minval, maxval = lo, hi
+            else:
+                minval, maxval = min(minval, lo), max(maxval, hi)
+        if self.ev_stop.isSet():
+            return None
+        if minval == None:
+            minval = maxval = 0.0
+        return (minval, maxval)
+
+    def accumulate(self, data, minval, maxval, callback=None):
+        """Second pass: return (dist, bins) of the histogram of _data_
+        over [minval, maxval], or None if stopped.  If given, _callback_
+        is called as callback(dist, bins, fraction) after each block.
+        """
+        dist = numpy.zeros(self.numbins, dtype='int64')
+        # (histogram bins must be increasing even for constant data)
+        bins = numpy.linspace(minval, max(maxval, minval + 1.0),
+                              self.numbins+1)
+        for n, total, values in self.iter_blocks(data):
+            part, _bins = numpy.histogram(values, bins=bins)
+            dist += part
+            if callback != None:
+                callback(dist, bins, float(n) / total)
+
+        if self.ev_stop.isSet():
+            return None
+        return (dist, bins)
+
+    def calc(self, data, callback=None):
+        """Return (dist, bins) of the histogram of _data_, or None if
+        stopped.
+        """
+        res = self.find_range(data)
+        if res == None:
+            return None
+        minval, maxval = res
+        return self.accumulate(data, minval, maxval, callback=callback)
+
 # END
@@ -7,16 +7,125 @@
 # This is open-source software licensed under a BSD license.
 # Please see the file LICENSE.txt for details.
 #
+import os
 import math
 import numpy
 import logging
 
 from ginga.misc import Bunch, Callback
-from ginga import AutoCuts
+from ginga import AutoCuts, IntegralHistogram
+
+# Default size (in bytes) of the reads made by a ProgressFile
+default_read_chunk = 4 * 1024 * 1024
 
 class ImageError(Exception):
     pass
 
+class ProgressFile(object):
+    """File-like object for reading _filepath_ that calls
+    progress_cb(nread, total) with the number of bytes read so far and
+    the size of the file as it is read, reading in chunks of at most
+    _chunk_size_ bytes so that progress is reported through a large
+    read too.  (For a reader such as pyfits, that copies what it reads
+    into its own arrays.)
+
+    An exception raised by _progress_cb_ abandons the read in progress;
+    it is kept as the _abandoned_ attribute, so that callers can tell it
+    from an error of the file.
+    """
+
+    def __init__(self, filepath, progress_cb=None,
+                 chunk_size=default_read_chunk):
+        self.name = filepath
+        self.mode = 'rb'
+        self.progress_cb = progress_cb
+        self.chunk_size = chunk_size
+        self.total = os.path.getsize(filepath)
+        self.abandoned = None
+        self.nread = 0
+        self.in_f = open(filepath, 'rb')
+
+    def _progress(self, count):
+        # (bytes read, rather than the file position, as the reader may
+        # seek ahead, e.g. to look for more HDUs)
+        self.nread = min(self.nread + count, self.total)
+        if self.progress_cb == None:
+            return
+        try:
+            self.progress_cb(self.nread, self.total)
+        except Exception, e:
+            self.abandoned = e
+            raise
+
+    def read(self, size=-1):
+        if (size < 0) or (size > self.total):
+            size = max(0, self.total - self.in_f.tell())
+        if size <= self.chunk_size:
+            buf = self.in_f.read(size)
+            self._progress(len(buf))
+            return buf
+
+        # fill a single buffer, a chunk at a time
+        buf = bytearray(size)
+        view = memoryview(buf)
+        nread = 0
+        while nread < size:
+            count = self.in_f.readinto(view[nread:nread+self.chunk_size])
+            if count == 0:
+                break
+            nread += count
+            self._progress(count)
+        return buffer(buf, 0, nread)
+
+    def seek(self, offset, whence=0):
+        self.in_f.seek(offset, whence)
+
+    def tell(self):
+        return self.in_f.tell()
+
+    @property
+    def closed(self):
+        return self.in_f.closed
+
+    def close(self):
+        self.in_f.close()
+
+def block_minmax(block):
+    """Returns the (min, max, finite min, finite max) of array _block_,
+    ignoring NaNs.
+    """
+    maxval = numpy.nanmax(block)
+    minval = numpy.nanmin(block)
+
+    # TODO: see if there is a faster way to ignore infinity
+    if numpy.isfinite(maxval):
+        maxval_noinf = maxval
+    else:
+        try:
+            maxval_noinf = numpy.nanmax(block[numpy.isfinite(block)])
+        except:
+            maxval_noinf = maxval
+
+    if numpy.isfinite(minval):
+        minval_noinf = minval
+    else:
+        try:
+            minval_noinf = numpy.nanmin(block[numpy.isfinite(block)])
+        except:
+            minval_noinf = minval
+
+    return (minval, maxval, minval_noinf, maxval_noinf)
+
+def combine_minmax(results):
+    """Combines the block_minmax() _results_ of the blocks of an array
+    into those of the whole array.
+    """
+    if len(results) == 1:
+        return results[0]
+    mins, maxs, mins_noinf, maxs_noinf = zip(*results)
+    return (numpy.nanmin(mins), numpy.nanmax(maxs),
+            numpy.nanmin(mins_noinf), numpy.nanmax(maxs_noinf))
+
 class BaseImage(Callback.Callbacks):
 
     def __init__(self, data_np=None, metadata=None, logger=None):
@@ -30,6 +139,11 @@ class BaseImage(Callback.Callbacks):
         if data_np == None:
             data_np = numpy.zeros((1, 1))
         self._data = data_np
+        self._inthist = None
+        # cut levels calculated for this data by AutoCuts, by parameters
+        self.cutcache = {}
+        # bunch of the products computed ahead of display (see Ingest)
+        self.ingest = None
         self.metadata = {}
         if metadata:
             self.update_metadata(metadata)
@@ -120,6 +234,11 @@ class BaseImage(Callback.Callbacks):
         else:
             data = data_np
         self._data = data
+        # any integral histogram, cut levels or ingest products are now
+        # stale
+        self._inthist = None
+        self.cutcache = {}
+        self.ingest = None
 
         if metadata:
             self.update_metadata(metadata)
@@ -129,28 +248,33 @@ class BaseImage(Callback.Callbacks):
         self.make_callback('modified')
 
     def _set_minmax(self):
+        # The min and max are calculated on demand by get_minmax(), so
+        # that setting (e.g. memory-mapped) data does not read all of it
+        self._have_minmax = False
+
+    def _calc_minmax(self):
         data = self.get_data()
-        self.maxval = numpy.nanmax(data)
-        self.minval = numpy.nanmin(data)
+        # Walk large data in blocks of rows to bound the memory used
+        # (most images are a single block)
+        row_bytes = max(1, data[0:1].nbytes)
+        step = max(1, AutoCuts.default_stream_block_bytes // row_bytes)
+        results = []
+        for i in xrange(0, data.shape[0], step):
+            block = numpy.asarray(data[i:i+step])
+            results.append(block_minmax(block))
+        self.set_minmax(*combine_minmax(results))
+
+    def set_minmax(self, minval, maxval, minval_noinf, maxval_noinf):
+        """Set the min and max of the data (e.g. calculated ahead of
+        time), with and without any infinite values.
+        """
+        self.minval, self.maxval = minval, maxval
+        self.minval_noinf, self.maxval_noinf = minval_noinf, maxval_noinf
+        self._have_minmax = True
 
-        # TODO: see if there is a faster way to ignore infinity
-        if numpy.isfinite(self.maxval):
-            self.maxval_noinf = self.maxval
-        else:
-            try:
-                self.maxval_noinf = numpy.nanmax(data[numpy.isfinite(data)])
-            except:
-                self.maxval_noinf = self.maxval
-        
-        if numpy.isfinite(self.minval):
-            self.minval_noinf = self.minval
-        else:
-            try:
-                self.minval_noinf = numpy.nanmin(data[numpy.isfinite(data)])
-            except:
-                self.minval_noinf = self.minval
-        
     def get_minmax(self, noinf=False):
+        if not self._have_minmax:
+            self._calc_minmax()
         if not noinf:
             return (self.minval, self.maxval)
         else:
@@ -169,6 +293,12 @@ class BaseImage(Callback.Callbacks):
         self.transfer(other, astype=astype)
         return other
         
+    def close(self):
+        """Release any resources (e.g. open files) held by the image.
+        Subclasses that hold such resources should override this.
+        """
+        pass
+
     def cutout_data(self, x1, y1, x2, y2, astype=None):
         """cut out data area based on coords. 
         """
@@ -214,21 +344,20 @@ class BaseImage(Callback.Callbacks):
 
         data = self.get_data()
         
-        # Is there a more efficient way to do this?
-        yi, xi = numpy.mgrid[0:new_ht, 0:new_wd]
         iscale_x = float(old_wd) / float(new_wd)
         iscale_y = float(old_ht) / float(new_ht)
             
-        xi *= iscale_x 
-        yi *= iscale_y
-        cutout = data[y1:y2+1, x1:x2+1]
-        ht, wd = cutout.shape[:2]
-        xi = xi.astype('int').clip(0, wd-1)
-        yi = yi.astype('int').clip(0, ht-1)
-        newdata = cutout[yi, xi]
+        # Index only the sampled rows and columns (numpy.ix_), rather
+        # than slicing out the whole cutout first, so that data read on
+        # demand (e.g. by a RegionReader) is read sparsely
+        ht = min(y2+1, data.shape[0]) - y1
+        wd = min(x2+1, data.shape[1]) - x1
+        xi = (numpy.arange(new_wd) * iscale_x).astype('int').clip(0, wd-1)
+        yi = (numpy.arange(new_ht) * iscale_y).astype('int').clip(0, ht-1)
+        newdata = data[numpy.ix_(yi + y1, xi + x1)]
         ht, wd = newdata.shape[:2]
-        scale_x = float(wd) / dx
-        scale_y = float(ht) / dy
+        scale_x = float(wd) / old_wd
+        scale_y = float(ht) / old_ht
         res = Bunch.Bunch(data=newdata, org_fac=1,
                           scale_x=scale_x, scale_y=scale_y)
         return res
@@ -246,18 +375,17 @@ class BaseImage(Callback.Callbacks):
 
         data = self.get_data()
         
-        # Is there a more efficient way to do this?
-        yi, xi = numpy.mgrid[0:new_ht, 0:new_wd]
         iscale_x = float(old_wd) / float(new_wd)
         iscale_y = float(old_ht) / float(new_ht)
             
-        xi *= iscale_x 
-        yi *= iscale_y
-        cutout = data[y1:y2+1, x1:x2+1]
-        ht, wd = cutout.shape[:2]
-        xi = xi.astype('int').clip(0, wd-1)
-        yi = yi.astype('int').clip(0, ht-1)
-        newdata = cutout[yi, xi]
+        # Index only the sampled rows and columns (numpy.ix_), rather
+        # than slicing out the whole cutout first, so that data read on
+        # demand (e.g. by a RegionReader) is read sparsely
+        ht = min(y2+1, data.shape[0]) - y1
+        wd = min(x2+1, data.shape[1]) - x1
+        xi = (numpy.arange(new_wd) * iscale_x).astype('int').clip(0, wd-1)
+        yi = (numpy.arange(new_ht) * iscale_y).astype('int').clip(0, ht-1)
+        newdata = data[numpy.ix_(yi + y1, xi + x1)]
         ht, wd = newdata.shape[:2]
         scale_x = float(wd) / old_wd
         scale_y = float(ht) / old_ht
@@ -281,8 +409,51 @@ class BaseImage(Callback.Callbacks):
         raise ImageError("Method not supported: '%s'" % (method))
 
     
-    def histogram(self, x1, y1, x2, y2, z=None, pct=1.0, numbins=2048):
+    def get_integral_histogram(self,
+                               numbins=IntegralHistogram.default_inthist_bins,
+                               cellsize=IntegralHistogram.default_inthist_cellsize,
+                               build=True):
+        """Return the integral histogram of this image's data, building
+        it first if necessary.  Only 2D data is supported.  If _build_ is
+        False, None is returned instead of building it; building takes a
+        while for large images, so it is best done on a non-gui thread.
+        """
+        inthist = self._inthist
+        if ((inthist == None) or (inthist.numbins != numbins) or
+            (inthist.cellsize != cellsize)):
+            if not build:
+                return None
+            data = self.get_data()
+            if len(data.shape) != 2:
+                raise ImageError("Integral histograms need 2D data")
+            minval, maxval = self.get_minmax(noinf=True)
+            inthist = IntegralHistogram.IntegralHistogram(data,
+                                                          numbins=numbins,
+                                                          cellsize=cellsize,
+                                                          minval=minval,
+                                                          maxval=maxval,
+                                                          logger=self.logger)
+            # (unless the data was replaced meanwhile)
+            if self.get_data() is data:
+                self._inthist = inthist
+        return inthist
+
+    def histogram(self, x1, y1, x2, y2, z=None, pct=1.0, numbins=2048,
+                  use_integral=False):
+        """Calculate the histogram of the region data[y1:y2, x1:x2].  If
+        _use_integral_ is True, the data is 2D and an integral histogram
+        with _numbins_ bins has been built (see get_integral_histogram()),
+        the result comes from that table; otherwise the region is binned
+        from the data.
+        """
         data = self.get_data()
+        if use_integral and (z == None) and (len(data.shape) == 2):
+            inthist = self._inthist
+            if (inthist != None) and (inthist.numbins == numbins):
+                res = inthist.histogram(x1, y1, x2, y2)
+                return self.autocuts.calc_hist_cuts(res.dist, res.bins,
+                                                    pct=pct)
+
         if z != None:
             data = data[y1:y2, x1:x2, z]
         else:
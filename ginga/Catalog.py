@@ -11,8 +11,10 @@ import re
 import urllib
 import urllib2
 
+import numpy
+
 from ginga.misc import Bunch
-from ginga import wcs
+from ginga import wcs, FitsTable
 
 
 star_attrs = ('name', 'ra', 'dec', 'ra_deg', 'dec_deg', 'mag', 'preference',
@@ -136,6 +138,131 @@ class Star(object):
     def has_key(self, key):
         return self.starInfo.has_key(key)
         
+class TableStarList(object):
+    """The rows of a catalog in a FITS table (a FitsTable.FitsTable), as
+    a list of Star objects.
+
+    The positions, magnitudes etc. are kept in the columns of the table
+    (read only as needed); a Star is made for a row only when that row
+    is asked for, e.g. when it is plotted.  _rows_ are the numbers of
+    the table rows in the list (all of them if None).
+    """
+
+    def __init__(self, table, rows=None, ra_col=None, dec_col=None,
+                 mag_col=None, name_col=None):
+        self.table = table
+        if rows is None:
+            rows = numpy.arange(table.get_nrows())
+        self.rows = rows
+
+        if ra_col == None:
+            ra_col = table.find_column(FitsTable.ra_colnames)
+        if dec_col == None:
+            dec_col = table.find_column(FitsTable.dec_colnames)
+        if (ra_col == None) or (dec_col == None):
+            raise FitsTable.TableError("No RA/DEC columns in table (columns are %s)" % (
+                ', '.join(table.get_colnames())))
+        if mag_col == None:
+            mag_col = table.find_column(FitsTable.mag_colnames)
+        if name_col == None:
+            name_col = table.find_column(FitsTable.name_colnames)
+        self.ra_col, self.dec_col = ra_col, dec_col
+        self.mag_col, self.name_col = mag_col, name_col
+
+        # index -> Star made so far
+        self.stars = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return map(self.__getitem__, xrange(*idx.indices(len(self))))
+        if idx < 0:
+            idx += len(self)
+        star = self.stars.get(idx, None)
+        if star == None:
+            star = self._make_star(idx)
+            self.stars[idx] = star
+        return star
+
+    def __iter__(self):
+        for idx in xrange(len(self)):
+            yield self[idx]
+
+    def index(self, star):
+        idx = star['index']
+        if self.stars.get(idx, None) != star:
+            raise ValueError("star is not in list")
+        return idx
+
+    def _make_star(self, idx):
+        row = self.rows[idx]
+        ra_deg = float(self.table.get_column(self.ra_col)[row])
+        dec_deg = float(self.table.get_column(self.dec_col)[row])
+        if self.name_col != None:
+            name = str(self.table.get_column(self.name_col)[row]).strip()
+        else:
+            name = str(row + 1)
+        mag = None
+        if self.mag_col != None:
+            mag = float(self.table.get_column(self.mag_col)[row])
+
+        ra_txt = wcs.raDegToString(ra_deg, format='%02d:%02d:%06.3f')
+        dec_txt = wcs.decDegToString(dec_deg, format='%s%02d:%02d:%05.2f')
+        return Star(name=name, ra_deg=ra_deg, dec_deg=dec_deg,
+                    ra=ra_txt, dec=dec_txt, mag=mag, flag=0,
+                    description='', index=idx, row=row)
+
+    def close(self):
+        """Release the file of the table (shared by the lists selected
+        from this one).  Stars already made remain usable.
+        """
+        self.table.close()
+
+    def get_radec(self):
+        """Returns arrays of the ra and dec (in degrees) of the rows."""
+        ra_deg = self.table.get_column(self.ra_col)[self.rows]
+        dec_deg = self.table.get_column(self.dec_col)[self.rows]
+        return (ra_deg, dec_deg)
+
+    def select(self, mask):
+        """Returns a new list of the rows for which boolean array _mask_
+        is True.
+        """
+        return TableStarList(self.table, rows=self.rows[mask],
+                             ra_col=self.ra_col, dec_col=self.dec_col,
+                             mag_col=self.mag_col, name_col=self.name_col)
+
+    def select_within(self, image, obj):
+        """Returns a new list of the rows that fall within canvas object
+        _obj_ on _image_.  The positions of all rows are converted at
+        once; rectangles are tested on the arrays.
+        """
+        ra_deg, dec_deg = self.get_radec()
+        x, y = image.radectopix_arrays(ra_deg, dec_deg)
+        if obj.kind == 'rectangle':
+            x1, x2 = min(obj.x1, obj.x2), max(obj.x1, obj.x2)
+            y1, y2 = min(obj.y1, obj.y2), max(obj.y1, obj.y2)
+            mask = (x >= x1) & (x <= x2) & (y >= y1) & (y <= y2)
+        else:
+            mask = numpy.array(map(obj.contains, x, y), dtype=numpy.bool)
+        return self.select(mask)
+
+
+def load_table(filepath, numhdu=None, logger=None):
+    """Load the catalog in table HDU _numhdu_ (or the first table HDU)
+    of FITS file _filepath_.  Returns a TableStarList of its rows and a
+    list of info lines (as for CatalogServer.search()).
+    """
+    table = FitsTable.FitsTable(logger=logger)
+    table.load_file(filepath, numhdu=numhdu)
+    starlist = TableStarList(table)
+    info = [ "%s[%d]: %d rows" % (filepath, table.numhdu,
+                                  table.get_nrows()) ]
+    return starlist, info
+
+
 class CatalogServer(URLServer):
 
     def __init__(self, logger, full_name, key, url, description):
@@ -20,16 +20,23 @@ import numpy
 
 # Local application imports
 from ginga import cmap, imap, Catalog, AstroImage, PythonImage, FitsImage
-from ginga.misc import Bunch, Datasrc, Callback
+from ginga import SpillCache, TileCompress, ThumbGen, ImageRegistry, Ingest
+from ginga.misc import Bunch, Datasrc, Callback, Future
 
 
 #pluginconfpfx = 'plugins'
 pluginconfpfx = None
 
+# Default number of files read at once by load_files()
+default_load_threads = 4
+
 
 class ControlError(Exception):
     pass
 
+class LoadCancelled(ControlError):
+    pass
+
 class GingaControl(Callback.Callbacks):
      
     def __init__(self, logger, threadPool, module_manager, preferences,
@@ -70,6 +77,31 @@ class GingaControl(Callback.Callbacks):
         
         # Number of images to keep around in memory
         self.default_datasrc_length = datasrc_length
+        # Memory (bytes) that the images of a channel may use (None=any)
+        self.default_datasrc_bytes = None
+
+        # Should FITS files be memory-mapped rather than read in full
+        self.fits_memmap = False
+        # Should FITS data be converted to native byte order at load
+        self.fits_native = False
+        # FITS files larger than this (bytes) are read on demand
+        self.fits_ondemand_size = None
+        # Should FITS files be verified at load (unless known to be clean)
+        self.fits_verify = True
+        # Should a FITS image already loaded (e.g. in another channel)
+        # share its (then read-only) data, rather than be loaded again
+        self.share_images = False
+        # Should the derived products of new images be computed ahead of
+        # their display (see ingest_image())
+        self.ingest_images = True
+        self.ingester = Ingest.Ingester(logger=self.logger)
+        # JPEG, PNG etc. images are loaded at a reduced resolution that
+        # fits this size (pixels) until zoomed in on (None=always full)
+        self.image_proxy_size = None
+        # Disk tier for images evicted from memory (see useSpill())
+        self.spill = None
+        # Number of files read at once when loading files in bulk
+        self.load_threads = default_load_threads
         
         self.cm = cmap.get_cmap("ramp")
         self.im = imap.get_imap("ramp")
@@ -126,6 +158,16 @@ class GingaControl(Callback.Callbacks):
         # Set size of coordinate areas (4 is "." + precision 3)
         readout.maxx = len(str(width)) + 4
         readout.maxy = len(str(height)) + 4
+        if image.get('memmap', False) or image.get('ondemand', False):
+            # Don't read through a whole memory-mapped image just to size
+            # the value field--allow for the widest value of its type
+            dtype = image.get_data().dtype
+            if dtype.kind in ('i', 'u'):
+                info = numpy.iinfo(dtype)
+            else:
+                info = numpy.finfo(dtype)
+            readout.maxv = max(len(str(info.min)), len(str(info.max)))
+            return True
         minval, maxval = image.get_minmax()
         readout.maxv = max(len(str(minval)), len(str(maxval)))
         return True
@@ -203,14 +245,35 @@ class GingaControl(Callback.Callbacks):
         We are called back with a URL and we attempt to load it if it
         names a file.
         """
+        paths = []
         for url in urls:
             match = re.match(r"^file://(.+)$", url)
             if match:
-                fitspath = match.group(1)
-                #self.load_file(fitspath)
-                chname = self.get_channelName(fitsimage)
-                self.nongui_do(self.load_file, fitspath, chname=chname,
-                               wait=False)
+                paths.append(match.group(1))
+        chname = self.get_channelName(fitsimage)
+        if len(paths) == 1:
+            # shows the progress of reading it
+            self.load_file_async(paths[0], chname=chname)
+        elif len(paths) > 1:
+            self.load_files(paths, chname=chname)
+
+    def load_full_cb(self, fitsimage, image):
+        """Called when a proxy (reduced resolution) image is zoomed in
+        on.  The full resolution image is read in the background and
+        then swapped in on the gui thread.
+        """
+        self.nongui_do(self._load_full_image, fitsimage, image)
+        return True
+
+    def _load_full_image(self, fitsimage, image):
+        self.logger.info("loading full resolution image")
+        try:
+            res = image.read_full()
+        except Exception, e:
+            self.logger.error("Error loading full resolution image: %s" % (
+                str(e)))
+            res = None
+        self.gui_do(fitsimage.set_full_image, image, res)
 
     def _match_cmap(self, fitsimage, colorbar):
         rgbmap = fitsimage.get_rgbmap()
@@ -256,6 +319,10 @@ class GingaControl(Callback.Callbacks):
 
     def stop(self):
         self.ev_quit.set()
+        if self.spill != None:
+            self.spill.clear()
+        TileCompress.shutdown()
+        ThumbGen.shutdown()
 
     # PLUGIN MANAGEMENT
 
@@ -310,10 +377,11 @@ class GingaControl(Callback.Callbacks):
         
     # BASIC IMAGE OPERATIONS
 
-    def load_image(self, filepath):
+    def load_image(self, filepath, progress_cb=None):
         # Create an image.  Assume type to be an AstroImage unless
         # the MIME association says it is something different.
         image = AstroImage.AstroImage(logger=self.logger)
+        key = None
         try:
             self.logger.info("Loading image from %s" % (filepath))
             typ, enc = mimetypes.guess_type(filepath)
@@ -323,9 +391,39 @@ class GingaControl(Callback.Callbacks):
                 if (typ == 'image') and (subtyp != 'fits'):
                     image = PythonImage.PythonImage(logger=self.logger)
 
-            image.load_file(filepath)
+            kwdargs = {}
+            if isinstance(image, PythonImage.PythonImage):
+                kwdargs['maxsize'] = self.image_proxy_size
+            if isinstance(image, AstroImage.AstroImage):
+                if self.fits_memmap:
+                    kwdargs['memmap'] = True
+                kwdargs['native'] = self.fits_native
+                kwdargs['verify'] = self.fits_verify
+                size = self.fits_ondemand_size
+                if (size != None) and (os.path.getsize(filepath) > size):
+                    kwdargs['ondemand'] = True
+                if self.share_images:
+                    key = ImageRegistry.get_key(filepath,
+                                                memmap=kwdargs.get('memmap',
+                                                                   None),
+                                                native=kwdargs['native'],
+                                                ondemand=kwdargs.get('ondemand',
+                                                                     False))
+                    shared = ImageRegistry.lookup(key)
+                    if shared != None:
+                        self.logger.info("Sharing the data of %s already loaded" % (
+                            filepath))
+                        return shared
+                kwdargs['progress_cb'] = progress_cb
+            image.load_file(filepath, **kwdargs)
+            if key != None:
+                ImageRegistry.register(key, image)
             #self.gui_do(chinfo.fitsimage.onscreen_message, "")
 
+        except LoadCancelled:
+            self.logger.info("Cancelled loading %s" % (filepath))
+            raise
+
         except Exception, e:
             errmsg = "Failed to load file '%s': %s" % (
                 filepath, str(e))
@@ -353,13 +451,14 @@ class GingaControl(Callback.Callbacks):
         # Sometimes there is a newline at the end of this..
         filepath = filepath.strip()
 
-        # TODO: need progress bar or other visual indicator
-        #self.gui_do(chinfo.fitsimage.onscreen_message, "Loading file...")
+        # (see load_file_async() for a load that shows its progress and
+        # can be cancelled)
         image = self.load_image(filepath)
 
         (path, filename) = os.path.split(filepath)
 
         image.set(name=filename, path=filepath, chname=chname)
+        self.ingest_image(image, chname)
 
         # Display image.  If the wait parameter is False then don't wait
         # for the image to load into the viewer
@@ -372,6 +471,193 @@ class GingaControl(Callback.Callbacks):
         # Return the image
         return image
 
+    def load_file_async(self, filepath, chname=None):
+        """Load _filepath_ into channel _chname_ on a non-gui thread.
+        Returns a Future that resolves to the image, or to the exception
+        if the load fails or is cancelled.
+
+        As the file is read 'progress' callbacks are made on the future
+        with the number of bytes read and the size of the file, and the
+        progress is shown in the channel's viewer.  Calling cancel() on
+        the future abandons the load.
+        """
+        chinfo = self.get_channelInfo(chname)
+        future = Future.Future(data=filepath)
+        future.freeze(self._load_file_future, future, filepath.strip(),
+                      chinfo.name)
+        self.nongui_do_future(future)
+        return future
+
+    def load_files(self, filepaths, chname=None):
+        """Load the files _filepaths_ into channel _chname_ on the thread
+        pool, reading up to self.load_threads of them at once.  The images
+        are added to the channel in the order of _filepaths_ as they are
+        read.  An image read ahead of one before it is held until that one
+        is added, and no more files are started while twice
+        self.load_threads images are being read or held.
+
+        Returns a Future that resolves to the list of the names of the
+        images (None for a file that failed to load).  'progress'
+        callbacks are made on the future with the number of files done
+        and the number of files; calling cancel() on it skips the files
+        not yet started.
+        """
+        chinfo = self.get_channelInfo(chname)
+        filepaths = [ filepath.strip() for filepath in filepaths ]
+        numfiles = len(filepaths)
+        future = Future.Future(data=filepaths)
+        if numfiles == 0:
+            future.resolve([])
+            return future
+
+        numworkers = max(1, min(self.load_threads, numfiles))
+        # nstarted: number of files started; nadded: of those whose
+        # images have been added (in order); ready: images of the files
+        # read but not yet added, by index
+        batch = Bunch.Bunch(future=future, filepaths=filepaths,
+                            chname=chinfo.name, names=[ None ] * numfiles,
+                            nstarted=0, nadded=0, ready={}, done=0,
+                            window=2 * numworkers, workers=numworkers,
+                            cond=threading.Condition(),
+                            start_time=time.time())
+        for i in xrange(numworkers):
+            self.nongui_do(self._load_files_worker, batch)
+        return future
+
+    def _load_files_worker(self, batch):
+        future = batch.future
+        chinfo = self.get_channelInfo(batch.chname)
+        fitsimage = chinfo.fitsimage
+        numfiles = len(batch.filepaths)
+        while True:
+            with batch.cond:
+                while (batch.nstarted - batch.nadded >= batch.window) and \
+                          (batch.nstarted < numfiles):
+                    batch.cond.wait()
+                if (batch.nstarted >= numfiles) or future.is_cancelled() or \
+                       self.ev_quit.isSet():
+                    break
+                i = batch.nstarted
+                batch.nstarted += 1
+
+            filepath = batch.filepaths[i]
+            image = None
+            try:
+                image = self.load_image(filepath)
+                (path, filename) = os.path.split(filepath)
+                image.set(name=filename, path=filepath, chname=batch.chname)
+                self.ingest_image(image, batch.chname)
+            except ControlError:
+                # already reported by load_image()
+                pass
+
+            with batch.cond:
+                batch.ready[i] = image
+                batch.done += 1
+                ndone = batch.done
+                # add the images that are next in order
+                items = []
+                while batch.ready.has_key(batch.nadded):
+                    image = batch.ready.pop(batch.nadded)
+                    if image != None:
+                        name = image.get('name')
+                        batch.names[batch.nadded] = name
+                        items.append((name, image))
+                    batch.nadded += 1
+                if len(items) > 0:
+                    # (queued under the lock, to keep them in order)
+                    self.gui_do(self.bulk_add_images, items, batch.chname)
+                batch.cond.notifyAll()
+            # (not held while the next file is read)
+            image = items = None
+            future.progress(ndone, numfiles)
+            self.gui_do(fitsimage.onscreen_message,
+                        "Loaded %d/%d files" % (ndone, numfiles))
+
+        with batch.cond:
+            batch.workers -= 1
+            if batch.workers > 0:
+                return
+        self.logger.info("Loaded %d files in %.3f sec" % (
+            batch.done, time.time() - batch.start_time))
+        self.gui_do(fitsimage.onscreen_message, None)
+        future.resolve(batch.names)
+
+    def _load_file_future(self, future, filepath, chname):
+        chinfo = self.get_channelInfo(chname)
+        fitsimage = chinfo.fitsimage
+        (path, filename) = os.path.split(filepath)
+        errmsg = "Loading of '%s' was cancelled" % (filepath)
+
+        def _progress(nread, total):
+            if future.is_cancelled():
+                raise LoadCancelled(errmsg)
+            future.progress(nread, total)
+            pct = 100.0 * nread / max(total, 1)
+            self.gui_do(fitsimage.onscreen_message,
+                        "Loading %s: %d%%" % (filename, pct))
+
+        try:
+            if future.is_cancelled():
+                raise LoadCancelled(errmsg)
+            image = self.load_image(filepath, progress_cb=_progress)
+            if future.is_cancelled():
+                # drop the data now rather than when the future goes
+                image.close()
+                image = None
+                raise LoadCancelled(errmsg)
+        finally:
+            self.gui_do(fitsimage.onscreen_message, None)
+
+        image.set(name=filename, path=filepath, chname=chname)
+        self.ingest_image(image, chname)
+        self.gui_do(self.add_image, filename, image, chname=chname)
+        return image
+
+    def ingest_image(self, image, chname=None):
+        """Compute the derived products of new _image_ (min/max, auto cut
+        levels, overview and thumbnail) in one pass over its data, with
+        the view settings of channel _chname_, so that showing it for the
+        first time needs no further passes.  This is meant to be called
+        on a non-gui thread, before the image is added to the channel.
+
+        Memory-mapped data is not read before it is shown: it is ingested
+        on a pool thread instead, or not at all if it was mapped at the
+        user's request (see useMemmap()).
+        """
+        if not self.ingest_images:
+            return None
+        cutparams, thumbparams = None, None
+        if (chname != None) and self.has_channel(chname):
+            chinfo = self.get_channelInfo(chname)
+            t_ = chinfo.fitsimage.get_settings()
+            if t_['autocuts'] != 'off':
+                cutparams = dict(method=t_['autocut_method'],
+                                 pct=t_['autocut_hist_pct'],
+                                 numbins=t_['autocut_bins'])
+            if chinfo.prefs.get('genthumb', False):
+                thumbparams = ThumbGen.get_view_params(chinfo.fitsimage)
+
+        if AstroImage.is_memmap(image.get_data()):
+            if image.get('memmap', False):
+                # memory-mapped so as not to read all of it
+                return None
+            # don't hold up showing it to read all of it; the products
+            # are there for the plugins (and any other channel) later
+            self.nongui_do(self._ingest_image, image, cutparams,
+                           thumbparams)
+            return None
+        return self._ingest_image(image, cutparams, thumbparams)
+
+    def _ingest_image(self, image, cutparams, thumbparams):
+        try:
+            return self.ingester.ingest(image, cutparams=cutparams,
+                                        thumbparams=thumbparams)
+        except Exception, e:
+            self.logger.warn("Error ingesting image '%s': %s" % (
+                image.get('name', 'Noname'), str(e)))
+            return None
+
     def zoom_in(self):
         fitsimage = self.getfocus_fitsimage()
         fitsimage.zoom_in()
@@ -486,6 +772,23 @@ class GingaControl(Callback.Callbacks):
         #self._add_image_update(chinfo, image)
 
         
+    def bulk_add_images(self, images, chname):
+        """Add the (name, image) pairs _images_ to channel _chname_, in
+        order, updating the gui once for all of them.
+        """
+        if not self.has_channel(chname):
+            chinfo = self.add_channel(chname)
+        else:
+            chinfo = self.get_channelInfo(chname)
+        for imname, image in images:
+            chinfo.datasrc[imname] = image
+        # only the last image can be switched to, and only those images
+        # still in the channel (i.e. not evicted to make room for the
+        # others) are announced
+        for imname, image in images:
+            if chinfo.datasrc.has_key(imname):
+                self._add_image_update(chinfo, image)
+
     def update_image(self, imname, image, chname):
         self.logger.debug("Updating image '%s' in channel %s" % (
             imname, chname))
@@ -516,6 +819,16 @@ class GingaControl(Callback.Callbacks):
             image = chinfo.datasrc[imname]
             self.change_channel(chname, image=image)
 
+        elif chinfo.spilling.has_key(imname) or \
+                 ((self.spill != None) and
+                  self.spill.has(chinfo.name, imname)):
+            self.logger.debug("Image '%s' is no longer in memory; restoring it from the spill area" % (
+                imname))
+            image = self._restore_image(chinfo, imname, None)
+            chinfo.datasrc[imname] = image
+            chinfo.evicted.pop(imname, None)
+            self.change_channel(chname, image=image)
+
         else:
             if path != None:
                 self.logger.debug("Image '%s' is no longer in memory; attempting to load from %s" % (
@@ -568,8 +881,117 @@ class GingaControl(Callback.Callbacks):
             finally:
                 pass
 
+        self.prefetch_neighbors(chinfo, image)
         return True
 
+    def prefetch_neighbors(self, chinfo, image):
+        """Start loading, in the background, the images on either side of
+        _image_ in the channel (in name order) that have been evicted
+        from memory, so that stepping through them does not wait on the
+        disk.  The number on each side is the channel's 'prefetch'
+        preference; if 'prefetchcuts' is set the cut levels for the
+        neighbors are also calculated ahead of time.
+        """
+        num = chinfo.prefs.get('prefetch', 0)
+        # don't let prefetched images push each other out of the buffer
+        num = min(num, (chinfo.datasrc.get_bufsize() - 1) // 2)
+        # a new prefetch supersedes any still in progress
+        chinfo.prefetch_gen += 1
+        if num <= 0:
+            return
+
+        imname = image.get('name', None)
+        names = set(chinfo.datasrc.keys())
+        names.update(chinfo.evicted.keys())
+        names = sorted(names)
+        if not imname in names:
+            return
+        idx = names.index(imname)
+        # nearest first, alternating forward and back
+        neighbors = []
+        for i in xrange(1, num+1):
+            neighbors.extend(names[idx+i:idx+i+1])
+            if idx-i >= 0:
+                neighbors.append(names[idx-i])
+
+        items = []
+        for name in neighbors:
+            if chinfo.datasrc.has_key(name):
+                items.append((name, False, None))
+            else:
+                items.append((name, True, chinfo.evicted[name]))
+
+        self.nongui_do(self._prefetch_images, chinfo, chinfo.prefetch_gen,
+                       items)
+
+    def _prefetch_images(self, chinfo, gen, items):
+        # This runs on a non-gui thread, one image at a time, so that a
+        # prefetch occupies at most one thread of the pool
+        fitsimage = chinfo.fitsimage
+        t_ = fitsimage.get_settings()
+        for name, evicted, path in items:
+            if chinfo.prefetch_gen != gen:
+                # cursor has moved on
+                return
+            try:
+                if not evicted:
+                    image = chinfo.datasrc[name]
+                else:
+                    self.logger.debug("Prefetching '%s'" % (name))
+                    image = self._restore_image(chinfo, name, path)
+                    self.gui_do(self._add_prefetched, chinfo, name, image)
+
+                if chinfo.prefs.get('prefetchcuts', False) and \
+                       (t_['autocuts'] != 'off'):
+                    # the levels are cached on the image for auto_levels()
+                    fitsimage.autocuts.calc_cut_levels(
+                        image, method=t_['autocut_method'],
+                        pct=t_['autocut_hist_pct'],
+                        numbins=t_['autocut_bins'])
+
+            except Exception, e:
+                self.logger.warn("Error prefetching '%s': %s" % (
+                    name, str(e)))
+
+    def _restore_image(self, chinfo, imname, path):
+        """Bring back an image that was evicted from a channel, from the
+        spill area if it is there or else by loading it from _path_.
+        """
+        image = chinfo.spilling.get(imname, None)
+        if image != None:
+            # evicted, but not yet (or not all) written to the spill area
+            return image
+        if (self.spill != None) and self.spill.has(chinfo.name, imname):
+            return self.spill.restore(chinfo.name, imname,
+                                      logger=self.logger)
+        if path == None:
+            raise ControlError("No path to reload image '%s' from" % (
+                imname))
+        image = self.load_image(path)
+        image.set(name=imname, path=path, chname=chinfo.name)
+        return image
+
+    def _add_prefetched(self, chinfo, name, image):
+        with self.lock:
+            if chinfo.datasrc.has_key(name):
+                return
+            # freshen the current image first, so that it cannot be the
+            # one evicted to make room
+            curimage = chinfo.fitsimage.get_image()
+            curname = None
+            if curimage != None:
+                curname = curimage.get('name', None)
+                if chinfo.datasrc.has_key(curname):
+                    chinfo.datasrc[curname] = curimage
+            chinfo.datasrc[name] = image
+            chinfo.evicted.pop(name, None)
+
+            # keep the cursor on the current image
+            try:
+                chinfo.cursor = chinfo.datasrc.index(curname)
+            except ValueError:
+                pass
+
 
     def change_channel(self, chname, image=None, raisew=True):
         name = chname.lower()
@@ -647,15 +1069,88 @@ class GingaControl(Callback.Callbacks):
                 self.logger.debug("Adding channel '%s'" % (chname))
                 if not num_images:
                     num_images = self.default_datasrc_length
-                datasrc = Datasrc.Datasrc(num_images)
+                datasrc = Datasrc.Datasrc(num_images,
+                                          maxbytes=self.default_datasrc_bytes,
+                                          sizefn=self._image_size)
 
                 chinfo = Bunch.Bunch(datasrc=datasrc,
-                                 name=chname, cursor=0)
+                                 name=chname, cursor=0,
+                                 evicted={}, spilling={},
+                                 prefetch_gen=0)
+                datasrc.add_callback('evicted', self._image_evicted_cb,
+                                     chinfo)
             
                 self.channel[name] = chinfo
         return chinfo
 
         
+    def _image_size(self, image):
+        # Memory-mapped data and data read on demand are paged in and
+        # out as needed, so they don't count against a channel's budget
+        if image.get('memmap', False) or image.get('ondemand', False):
+            return 0
+        return image.get_data().nbytes
+
+    def _image_evicted_cb(self, datasrc, imname, image, chinfo):
+        # An image has dropped out of a channel's buffer--release any
+        # file it holds open (e.g. if it is memory-mapped) and remember
+        # where it came from, so that it can be prefetched again
+        self.logger.debug("Image '%s' evicted" % (imname))
+        if not ImageRegistry.is_shared(image):
+            # (otherwise the last of the images sharing the file closes it)
+            image.close()
+        if datasrc.has_key(imname):
+            # replaced by another image of the same name, which any copy
+            # in the spill area no longer stands for
+            with self.lock:
+                chinfo.spilling.pop(imname, None)
+                chinfo.evicted.pop(imname, None)
+            if self.spill != None:
+                self.spill.remove(chinfo.name, imname)
+            return
+        path = image.get('path', None)
+        if (path != None) and not os.path.exists(path):
+            path = None
+
+        spillable = (self.spill != None) and \
+                    not image.get('ondemand', False)
+        if spillable and image.get('memmap', False):
+            # Memory-mapped data is still in its file, so evicting it
+            # only gives back the pages mapped in.  That includes an
+            # image restored from the spill area, whose data is mapped
+            # from its spill file; it is only written again if the cache
+            # has since dropped that file.
+            spillable = image.get('spilled', False) and \
+                        not self.spill.has(chinfo.name, imname)
+
+        if spillable:
+            # keep the image (data, header and cut levels) in the spill
+            # area; it is written on a pool thread, and until then the
+            # image is held here, for it to be restored from
+            with self.lock:
+                chinfo.spilling[imname] = image
+                chinfo.evicted[imname] = path
+            self.nongui_do(self._spill_image, chinfo, imname, image)
+        elif (path != None) or ((self.spill != None) and
+                                self.spill.has(chinfo.name, imname)):
+            chinfo.evicted[imname] = path
+
+    def _spill_image(self, chinfo, imname, image):
+        try:
+            self.spill.spill(chinfo.name, imname, image)
+            spilled = True
+        except Exception, e:
+            self.logger.error("Error spilling image '%s': %s" % (
+                imname, str(e)))
+            spilled = False
+        with self.lock:
+            if chinfo.spilling.get(imname, None) is image:
+                del chinfo.spilling[imname]
+                if (not spilled) and chinfo.evicted.has_key(imname) and \
+                       (chinfo.evicted[imname] == None):
+                    # no other way to bring it back
+                    del chinfo.evicted[imname]
+
     def add_channel(self, chname, datasrc=None, workspace=None,
                     num_images=None):
 
@@ -676,7 +1171,8 @@ class GingaControl(Callback.Callbacks):
 
         # Make sure these preferences are at least defined
         prefs.setDefaults(switchnew=True,
-                          raisenew=True, genthumb=True)
+                          raisenew=True, genthumb=True,
+                          prefetch=1, prefetchcuts=True)
 
         with self.lock:
             bnch = self.add_viewer(chname, prefs,
@@ -784,6 +1280,86 @@ class GingaControl(Callback.Callbacks):
     def followFocus(self, tf):
         self.channel_follows_focus = tf
 
+    def setBufferBytes(self, nbytes):
+        """Limit the images kept in memory by each channel to a total of
+        _nbytes_ bytes (None for no limit), besides the limit on their
+        number.  The least recently used images are dropped first.
+        """
+        self.default_datasrc_bytes = nbytes
+        with self.lock:
+            for chinfo in self.channel.values():
+                chinfo.datasrc.set_maxbytes(nbytes)
+
+    def useSpill(self, spilldir, maxbytes=SpillCache.default_spill_bytes):
+        """Keep images evicted from memory in directory _spilldir_ (a
+        temporary one if None), up to _maxbytes_ of them, instead of
+        dropping them.  They are restored (memory-mapped) when switched
+        to again.
+        """
+        self.spill = SpillCache.SpillCache(spilldir, maxbytes=maxbytes,
+                                           logger=self.logger)
+
+    def useMemmap(self, tf):
+        """Memory-map FITS files that are loaded (if _tf_ is True), so
+        that only the parts of an image that are viewed are read.
+        """
+        self.fits_memmap = tf
+
+    def useNativeOrder(self, tf):
+        """Convert the (big-endian) data of FITS files to native byte
+        order when they are loaded (if _tf_ is True).
+        """
+        self.fits_native = tf
+
+    def verifyFits(self, tf):
+        """Verify FITS files when they are loaded (if _tf_ is True), except
+        for those that passed verification before and have not changed.
+        If False, files are only verified if loading them fails.
+        """
+        self.fits_verify = tf
+
+    def shareImages(self, tf):
+        """Share the data of a FITS image that is loaded again while it
+        is still held (e.g. in another channel), rather than load it again
+        (if _tf_ is True).  Each image still has its own header and
+        metadata, but the shared data is made read-only.
+        """
+        self.share_images = tf
+
+    def ingestImages(self, tf):
+        """Compute the derived products of new images (min/max, cut
+        levels, overview and thumbnail) in the background before they are
+        shown (if _tf_ is True).  See ingest_image().
+        """
+        self.ingest_images = tf
+
+    def setProxySize(self, size):
+        """Load JPEG, PNG etc. images at a reduced resolution that fits
+        in _size_ x _size_ pixels, loading the full resolution only when
+        they are zoomed in on (None to always load them in full).
+        """
+        self.image_proxy_size = size
+
+    def setLoadThreads(self, num):
+        """Read up to _num_ files at once when loading files in bulk
+        (e.g. dropped files or files given on the command line).
+        """
+        self.load_threads = num
+
+    def readOnDemand(self, size):
+        """Read FITS files larger than _size_ bytes on demand, i.e. only
+        the regions that are viewed (None to never do so).
+        """
+        self.fits_ondemand_size = size
+
+    def setDecompressProcs(self, num):
+        """Decompress the tiles of tile-compressed FITS images in _num_
+        processes (1 to decompress them in the loading thread).  The
+        processes are those of the pool started at startup (see
+        TileCompress.start_pool()).
+        """
+        TileCompress.default_decomp_workers = num
+
     def showStatus(self, text):
         """Write a message to the status bar.  _text_ is the message.
         """
@@ -0,0 +1,178 @@
+#
+# CubePlayer.py -- play back the slices of a data cube
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import threading
+import time
+import logging
+import Queue
+
+from ginga.misc import Bunch, Callback
+from ginga import RegionReader
+
+# Default target frame rate (frames per second)
+default_fps = 10.0
+
+# Default number of slices decoded ahead of playback
+default_ring_slices = 16
+
+
+class CubePlayer(Callback.Callbacks):
+    """Plays back the 2D slices of a data cube along one axis.
+
+    _data_ is the cube (e.g. the memory-mapped data of an HDU), in numpy
+    axis order.  If _header_ is given _data_ is the raw data of its HDU
+    and each slice is scaled by any BSCALE/BZERO/BLANK in it.  Playback
+    starts at the slice given by _naxispath_ (as for AstroImage.load_hdu)
+    and steps along its _m_-th axis, wrapping around at the end.
+
+    produce() runs on a non-gui thread, decoding slices (to native byte
+    order) into a ring buffer of _bufsize_ slices ahead of playback.
+    get_frame() is called from a timer on the gui thread and returns the
+    slice that is due at the current time for the target frame rate.
+    When showing frames falls behind, the slices that are already late
+    are dropped (and not even decoded) rather than shown, so playback
+    keeps to time instead of lagging.
+
+    About once a second an 'fps' callback is made with the achieved
+    frame rate.  stop(wait=True) also waits for produce() to return, so
+    that _data_ can be released (e.g. its file closed) afterwards.
+    """
+
+    def __init__(self, data, naxispath, m, fps=default_fps,
+                 bufsize=default_ring_slices, header=None, logger=None):
+        Callback.Callbacks.__init__(self)
+
+        if logger != None:
+            self.logger = logger
+        else:
+            self.logger = logging.Logger('CubePlayer')
+        self.data = data
+        self.scaled = (header != None) and RegionReader.is_scaled(header)
+        if self.scaled:
+            self.bscale = header.get('BSCALE', 1)
+            self.bzero = header.get('BZERO', 0)
+            self.blank = header.get('BLANK', None)
+            self.dtype = RegionReader.scaled_dtype(data.dtype, self.bscale,
+                                                   self.bzero,
+                                                   blank=self.blank)
+        self.naxispath = list(naxispath)
+        self.m = m
+        self.dim = data.shape[m]
+        self.fps = float(fps)
+
+        self.ring = Queue.Queue(maxsize=bufsize)
+        self.ev_stop = threading.Event()
+        self.cond = threading.Condition()
+        self.producing = False
+        # sequence number of the frame due now
+        self.due = 0
+        # frame taken from the ring buffer that is not yet due
+        self.pending = None
+        self.t0 = None
+        self.shown = 0
+        self.dropped = 0
+        self.fps_time = None
+        self.fps_shown = 0
+        self.achieved = 0.0
+
+        self.enable_callback('fps')
+
+    def stop(self, wait=False):
+        with self.cond:
+            self.ev_stop.set()
+            if wait:
+                while self.producing:
+                    self.cond.wait()
+
+    def is_stopped(self):
+        return self.ev_stop.isSet()
+
+    def get_slice(self, index):
+        """Returns slice _index_ along the playback axis, decoded."""
+        data = self.data
+        path = list(self.naxispath)
+        path[self.m] = index
+        for idx in path:
+            data = data[idx]
+        if self.scaled:
+            return RegionReader.scale_data(data, self.dtype, self.bscale,
+                                           self.bzero, blank=self.blank)
+        return data.astype(data.dtype.newbyteorder('='))
+
+    def produce(self):
+        """Decode slices into the ring buffer until stopped."""
+        with self.cond:
+            # stopped before it got to run
+            if self.ev_stop.isSet():
+                return
+            self.producing = True
+        seq = 0
+        try:
+            while not self.ev_stop.isSet():
+                # skip any frames that are already too late to be shown
+                seq = max(seq, self.due)
+                index = (self.naxispath[self.m] + seq) % self.dim
+                frame = Bunch.Bunch(seq=seq, index=index,
+                                    data=self.get_slice(index))
+                while not self.ev_stop.isSet():
+                    try:
+                        self.ring.put(frame, timeout=0.1)
+                        break
+                    except Queue.Full:
+                        continue
+                seq += 1
+        except Exception, e:
+            self.logger.error("Error decoding slice for playback: %s" % (
+                str(e)))
+            self.ev_stop.set()
+        finally:
+            with self.cond:
+                self.producing = False
+                self.cond.notifyAll()
+
+    def get_frame(self):
+        """Returns the frame (a bunch of seq, index and data) due now, or
+        None if there is no new frame to show.
+        """
+        now = time.time()
+        if self.t0 == None:
+            self.t0 = self.fps_time = now
+        due = int((now - self.t0) * self.fps)
+        self.due = due
+
+        frame = None
+        while True:
+            if self.pending == None:
+                try:
+                    self.pending = self.ring.get(block=False)
+                except Queue.Empty:
+                    break
+            if self.pending.seq > due:
+                # not time for it yet
+                break
+            frame = self.pending
+            self.pending = None
+
+        if frame != None:
+            self.shown += 1
+        # every frame up to the one due should have been shown by now
+        self.dropped = max(0, due + 1 - self.shown)
+
+        if now - self.fps_time >= 1.0:
+            self.achieved = (self.shown - self.fps_shown) / (now - self.fps_time)
+            self.fps_time, self.fps_shown = now, self.shown
+            self.make_callback('fps', self.achieved)
+        return frame
+
+    def get_stats(self):
+        """Returns a bunch of the playback statistics."""
+        return Bunch.Bunch(fps=self.fps, achieved=self.achieved,
+                           shown=self.shown, dropped=self.dropped)
+
+#END
@@ -0,0 +1,140 @@
+#
+# CubeStats.py -- global statistics over all the planes of a data cube
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import threading
+import time
+import logging
+
+import numpy
+import pyfits
+
+from ginga.misc import Bunch, Callback
+from ginga import AutoCuts, RegionReader
+
+# Default limit on the amount of data (in bytes) that is examined at
+# once, so that memory use stays bounded for any size of cube
+default_chunk_bytes = 64 * 1024 * 1024
+
+
+class CubeStats(Callback.Callbacks):
+    """Calculates global statistics--value range, histogram and cut levels--
+    over all the planes of an N-dimensional (N > 2) image HDU.
+
+    The data is read from a memory-mapped HDU in chunks of whole planes
+    by a StreamingHistogram, in two passes: the first finds the range of
+    finite values and the second accumulates the histogram over that
+    range.  After every chunk of the second pass a 'progress' callback
+    is made with the statistics so far; a 'done' callback is made with
+    the final statistics.
+
+    Typical use is to call calc() on a non-gui thread and stop() to
+    abandon the calculation.
+    """
+
+    def __init__(self, path, numhdu, logger=None,
+                 numbins=AutoCuts.default_autocuts_bins,
+                 pct=AutoCuts.default_autocuts_hist_pct,
+                 chunk_bytes=default_chunk_bytes):
+        Callback.Callbacks.__init__(self)
+
+        if logger != None:
+            self.logger = logger
+        else:
+            self.logger = logging.Logger('CubeStats')
+        self.path = path
+        self.numhdu = numhdu
+        self.numbins = numbins
+        self.pct = pct
+        self.chunk_bytes = chunk_bytes
+
+        self.autocuts = AutoCuts.AutoCuts(self.logger)
+        self.streamer = AutoCuts.StreamingHistogram(numbins=numbins,
+                                                    block_bytes=chunk_bytes,
+                                                    logger=self.logger)
+        self.ev_stop = threading.Event()
+        self.result = None
+
+        # For callbacks
+        for name in ('progress', 'done'):
+            self.enable_callback(name)
+
+    def stop(self):
+        self.ev_stop.set()
+        self.streamer.stop()
+
+    def is_stopped(self):
+        return self.ev_stop.isSet()
+
+    def get_result(self):
+        return self.result
+
+    def calc(self):
+        """Open the file, calculate the statistics for the HDU and return
+        them (or None if stopped).
+        """
+        # (scaled data cannot be memory-mapped by pyfits; it is scaled
+        # a chunk at a time as it is read instead)
+        fits_f = pyfits.open(self.path, 'readonly', memmap=True,
+                             do_not_scale_image_data=True)
+        try:
+            hdu = fits_f[self.numhdu]
+            return self.calc_data(hdu.data, header=hdu.header)
+        finally:
+            fits_f.close()
+
+    def calc_data(self, data, header=None):
+        """Calculate the statistics of array _data_.  If _header_ is given,
+        _data_ is the raw data of its HDU, still to be scaled by any
+        BSCALE/BZERO/BLANK in it.
+        """
+        start_time = time.time()
+
+        # View the cube as a stack of planes, so that it is read in chunks
+        # of whole planes; reshaping a contiguous memmap makes no copy
+        planes = data.reshape((-1,) + data.shape[-2:])
+        if (header != None) and RegionReader.is_scaled(header):
+            planes = RegionReader.ScaledArray(planes, header)
+
+        # Pass 1: find the range of finite values
+        res = self.streamer.find_range(planes)
+        if res == None:
+            return None
+        minval, maxval = res
+
+        # Pass 2: accumulate the histogram over that range
+        def _progress(dist, bins, fraction):
+            res = self._make_result(dist.copy(), bins, minval, maxval)
+            res.fraction = fraction
+            self.make_callback('progress', res)
+
+        res = self.streamer.accumulate(planes, minval, maxval,
+                                       callback=_progress)
+        if res == None:
+            return None
+        dist, bins = res
+
+        res = self._make_result(dist, bins, minval, maxval)
+        res.fraction = 1.0
+        self.result = res
+        self.logger.debug("cube stats lo=%f hi=%f (%.3f sec)" % (
+            res.loval, res.hival, time.time() - start_time))
+        self.make_callback('done', res)
+        return res
+
+    def _make_result(self, dist, bins, minval, maxval):
+        if numpy.sum(dist) > 0:
+            res = self.autocuts.calc_hist_cuts(dist, bins, pct=self.pct)
+        else:
+            res = Bunch.Bunch(dist=dist, bins=bins, loval=minval,
+                              hival=maxval)
+        res.minval, res.maxval = minval, maxval
+        res.path, res.numhdu = self.path, self.numhdu
+        return res
+
+#END
@@ -132,7 +132,8 @@ class FitsImageBase(Callback.Callbacks):
         self.t_.getSetting('rot_deg').add_callback('set', self.rotation_change_cb)
 
         # misc
-        self.t_.addDefaults(use_embedded_profile=True, auto_orient=False)
+        self.t_.addDefaults(use_embedded_profile=True, auto_orient=False,
+                            load_full_on_zoom=True)
 
         # PRIVATE IMPLEMENTATION STATE
         
@@ -167,6 +168,8 @@ class FitsImageBase(Callback.Callbacks):
         # desired scale factors
         self._scale_x = 1.0
         self._scale_y = 1.0
+        # proxy image whose full resolution data is being loaded
+        self._loading_full = None
         # actual scale factors produced from desired ones
         self._org_scale_x = 0
         self._org_scale_y = 0
@@ -193,7 +196,7 @@ class FitsImageBase(Callback.Callbacks):
         # settings callbacks
         for name in ('cut-set', 'zoom-set', 'pan-set', 'transform',
                      'rotate', 'image-set', 'configure',
-                     'autocuts', 'autozoom'):
+                     'autocuts', 'autozoom', 'load-full'):
             self.enable_callback(name)
 
         
@@ -789,6 +792,18 @@ class FitsImageBase(Callback.Callbacks):
         self._scale_to(scale_x, scale_y, no_reset=no_reset, redraw=redraw)
 
     def _scale_to(self, scale_x, scale_y, no_reset=False, redraw=True):
+        # A proxy (reduced resolution) image is replaced by the full
+        # resolution one once it would be magnified
+        if (max(scale_x, scale_y) > 1.0) and self.image.get('proxy', False) \
+               and self.t_['load_full_on_zoom'] and \
+               (self._loading_full is not self.image):
+            # a handler of 'load-full' reads the image in the background
+            # and swaps it in with set_full_image(); without one it is
+            # read here
+            self._loading_full = self.image
+            if not self.make_callback('load-full', self.image):
+                scale_x, scale_y = self._load_full_image(scale_x, scale_y)
+
         # Check scale limits
         maxscale = max(scale_x, scale_y)
         if (maxscale > self.t_['scale_max']):
@@ -849,6 +864,65 @@ class FitsImageBase(Callback.Callbacks):
         if redraw:
             self.redraw()
 
+    def _load_full_image(self, scale_x, scale_y):
+        """Load the full resolution data of the (proxy) image, and return
+        the scale that shows it as _scale_x_, _scale_y_ showed the proxy.
+        The pan position is moved to match.
+        """
+        image = self.image
+        self.logger.info("loading full resolution image")
+        try:
+            res = image.read_full()
+        except Exception, e:
+            self.logger.error("Error loading full resolution image: %s" % (
+                str(e)))
+            return (scale_x, scale_y)
+        finally:
+            self._loading_full = None
+
+        fac_x, fac_y = self._set_full_pan(image, res)
+        image.set_full(res)
+        return (scale_x / fac_x, scale_y / fac_y)
+
+    def _set_full_pan(self, image, res):
+        # move the pan position to the same place in the full resolution
+        # data _res_ of the proxy _image_, returning the factors by which
+        # it is larger
+        old_wd, old_ht = image.get_size()
+        ht, wd = res.data.shape[:2]
+        fac_x = float(wd) / float(old_wd)
+        fac_y = float(ht) / float(old_ht)
+        # (the pan position is at pixel center + 0.5)
+        self._pan_x = (self._pan_x - 0.5) * fac_x + 0.5
+        self._pan_y = (self._pan_y - 0.5) * fac_y + 0.5
+        return (fac_x, fac_y)
+
+    def set_full_image(self, image, res):
+        """Swap in the full resolution data _res_ (see
+        PythonImage.read_full()) of the proxy _image_, keeping the view
+        the same; None if it could not be read.  Called on the gui thread
+        by the handler of the 'load-full' callback.
+        """
+        if self._loading_full is image:
+            self._loading_full = None
+        if (res == None) or (not image.get('proxy', False)):
+            return
+        if image is not self.image:
+            # no longer shown
+            image.set_full(res)
+            return
+
+        # fix the pan and scale first, so that the redraw when the data
+        # is replaced shows the same view
+        fac_x, fac_y = self._set_full_pan(image, res)
+        self._loading_full = image
+        try:
+            self._scale_to(self._scale_x / fac_x, self._scale_y / fac_y,
+                           no_reset=True, redraw=False)
+        finally:
+            self._loading_full = None
+        image.set_full(res)
+
     def get_scale(self):
         #scalefactor = max(self._org_scale_x, self._org_scale_y)
         scalefactor = max(self._scale_x, self._scale_y)
@@ -0,0 +1,128 @@
+#
+# FitsTable.py -- columns of a FITS table HDU, read as they are needed
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import logging
+
+import pyfits
+import numpy
+
+# Usual names of the columns of catalogs, in order of preference
+ra_colnames = ('RA', 'RA_DEG', 'RAJ2000', 'RA_J2000', 'ALPHA_J2000',
+               'ALPHAWIN_J2000', 'RADEG')
+dec_colnames = ('DEC', 'DEC_DEG', 'DEJ2000', 'DEC_J2000', 'DELTA_J2000',
+                'DELTAWIN_J2000', 'DECDEG')
+mag_colnames = ('MAG', 'MAG_AUTO', 'MAG_BEST', 'MAG_APER', 'VMAG', 'RMAG')
+name_colnames = ('NAME', 'ID', 'OBJID', 'SOURCE_ID', 'NUMBER')
+
+
+class TableError(Exception):
+    pass
+
+class FitsTable(object):
+    """The columns of a binary (or ASCII) table HDU of a FITS file.
+
+    The file is memory-mapped and held open; a column is only read (and
+    converted to a numpy array in native byte order) the first time it
+    is asked for, so that just the columns used of a large table are
+    ever read.
+    """
+
+    def __init__(self, logger=None):
+        if logger != None:
+            self.logger = logger
+        else:
+            self.logger = logging.Logger('FitsTable')
+        self.fits_f = None
+        self.hdu = None
+        self.path = None
+        self.numhdu = None
+        self.colnames = []
+        self.nrows = 0
+        # column name -> array of the columns read so far
+        self.columns = {}
+
+    def load_file(self, filepath, numhdu=None):
+        """Load table HDU _numhdu_ (or the first table HDU) of FITS file
+        _filepath_.
+        """
+        self.close()
+        fits_f = pyfits.open(filepath, 'readonly', memmap=True)
+        try:
+            if numhdu == None:
+                for i in range(len(fits_f)):
+                    if isinstance(fits_f[i], (pyfits.BinTableHDU,
+                                              pyfits.TableHDU)):
+                        numhdu = i
+                        break
+                if numhdu == None:
+                    raise TableError("No table HDU found in '%s'" % (
+                        filepath))
+            hdu = fits_f[numhdu]
+            if not isinstance(hdu, (pyfits.BinTableHDU, pyfits.TableHDU)):
+                raise TableError("HDU %d of '%s' is not a table" % (
+                    numhdu, filepath))
+        except Exception, e:
+            fits_f.close()
+            raise
+
+        self.fits_f = fits_f
+        self.hdu = hdu
+        self.path = filepath
+        self.numhdu = numhdu
+        self.colnames = list(hdu.columns.names)
+        self.nrows = hdu.header.get('NAXIS2', 0)
+        self.logger.debug("Table '%s'[%d]: %d rows, columns %s" % (
+            filepath, numhdu, self.nrows, self.colnames))
+
+    def close(self):
+        """Release the file.  Columns already read remain usable."""
+        if self.fits_f != None:
+            try:
+                self.fits_f.close()
+            except Exception, e:
+                self.logger.warn("Error closing '%s': %s" % (
+                    self.path, str(e)))
+            self.fits_f = None
+        self.hdu = None
+
+    def get_header(self):
+        return self.hdu.header
+
+    def get_colnames(self):
+        return list(self.colnames)
+
+    def get_nrows(self):
+        return self.nrows
+
+    def __len__(self):
+        return self.nrows
+
+    def find_column(self, names):
+        """Returns the name of the first column of the table that is one
+        of _names_ (ignoring case), or None.
+        """
+        upper = dict(map(lambda name: (name.upper(), name), self.colnames))
+        for name in names:
+            if upper.has_key(name.upper()):
+                return upper[name.upper()]
+        return None
+
+    def get_column(self, name):
+        """Returns column _name_ as a numpy array."""
+        if self.columns.has_key(name):
+            return self.columns[name]
+        if self.hdu == None:
+            raise TableError("Table is closed")
+        data = numpy.asarray(self.hdu.data.field(name))
+        if (data.dtype.kind in 'iuf') and not data.dtype.isnative:
+            data = data.astype(data.dtype.newbyteorder('='))
+        self.columns[name] = data
+        return data
+
+#END
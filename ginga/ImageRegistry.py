@@ -0,0 +1,98 @@
+#
+# ImageRegistry.py -- share the data of images loaded more than once
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import os
+import threading
+import weakref
+
+import numpy
+
+from ginga.misc import Bunch
+
+# key -> weak set of the live images loaded (or shared) with that key
+_images = {}
+_lock = threading.Lock()
+
+
+def get_key(filepath, numhdu=None, naxispath=None, **opts):
+    """Returns the key under which the image of HDU _numhdu_ and slice
+    _naxispath_ of file _filepath_ is registered.  The key includes the
+    modification time and size of the file, so that a file that has
+    changed is loaded again, and any load options _opts_ that make a
+    difference to the data.
+    """
+    st = os.stat(filepath)
+    if naxispath != None:
+        naxispath = tuple(naxispath)
+    return (os.path.abspath(filepath), numhdu, naxispath,
+            st.st_mtime, st.st_size, tuple(sorted(opts.items())))
+
+def is_shareable(image):
+    # only images whose data is all in an array (in memory or
+    # memory-mapped) can be shared; one read on demand holds a reader
+    # that is closed with the image
+    return (getattr(image, 'reader', None) == None) and \
+           isinstance(image.get_data(), numpy.ndarray)
+
+def register(key, image):
+    """Register _image_ (freshly loaded) under _key_ (from get_key()).
+    Its data is made read-only, as it may be shared.  The registry only
+    holds weak references: an image drops out of it when no channel
+    (or anything else) holds it any more.
+    """
+    if not is_shareable(image):
+        return
+    data = image.get_data()
+    data.flags.writeable = False
+    with _lock:
+        # drop the keys of images that are gone (e.g. of files since
+        # changed)
+        for oldkey, images in _images.items():
+            if len(images) == 0:
+                del _images[oldkey]
+        images = _images.get(key, None)
+        if images == None:
+            images = weakref.WeakSet()
+            _images[key] = images
+        images.add(image)
+
+def lookup(key):
+    """Returns a new image that shares the data of the live image
+    registered under _key_ (see AstroImage.share()), or None if there is
+    none.  The new image is registered too, so that the data stays
+    available for as long as any image that shares it lives.
+    """
+    with _lock:
+        images = _images.get(key, None)
+        if images == None:
+            return None
+        for image in list(images):
+            other = image.share()
+            images.add(other)
+            return other
+        # all gone
+        del _images[key]
+        return None
+
+def is_shared(image):
+    """Returns True if another live image shares the data of _image_
+    (i.e. they are registered under the same key).
+    """
+    with _lock:
+        for images in _images.values():
+            if image in images:
+                return len(images) > 1
+    return False
+
+def get_stats():
+    with _lock:
+        return Bunch.Bunch(keys=len(_images),
+                           images=sum(map(len, _images.values())))
+
+#END
@@ -0,0 +1,146 @@
+#
+# Ingest.py -- precompute the derived products of a new image
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import time
+import logging
+
+import numpy
+
+from ginga.misc import Bunch
+from ginga import AutoCuts, BaseImage, AstroImage, ThumbGen
+
+# Default length (in pixels) of the long side of the overview of an image
+default_overview_size = 512
+
+
+class Ingester(object):
+    """Computes the derived products of an image that the viewer and
+    plugins otherwise compute separately when it is first shown: the
+    min and max of the data, the auto cut levels, a reduced overview
+    of the image and a thumbnail.
+
+    All are computed in a single pass over the data, a block of rows
+    at a time (so that memory-mapped data is read just once, and never
+    all held in memory): each block adds to the min/max, gives up its
+    part of the crop the cut levels are taken from, and its every
+    n-th row and column to the overview.  The thumbnail is then rendered
+    from the overview.
+
+    ingest() is meant to be run on a non-gui thread, before the image is
+    added to a channel.  The min/max and cut levels are stored on the
+    image where get_minmax() and AutoCuts.calc_cut_levels() look for
+    them; a bunch of all the products is stored as the image's _ingest_
+    attribute, which marks it as ready.  (Not in its metadata, which is
+    pickled when the image is spilled to disk.)
+    """
+
+    def __init__(self, logger=None, overview_size=default_overview_size,
+                 block_bytes=AutoCuts.default_stream_block_bytes):
+        if logger != None:
+            self.logger = logger
+        else:
+            self.logger = logging.Logger('Ingest')
+        self.overview_size = overview_size
+        self.block_bytes = block_bytes
+        self.autocuts = AutoCuts.AutoCuts(self.logger)
+
+    def ingest(self, image, cutparams=None, thumbparams=None):
+        """Compute the products of _image_.  _cutparams_ is a dict of the
+        autocut 'method', 'pct' and 'numbins' of the viewer (None to skip
+        the cut levels); _thumbparams_ the view settings of thumbnails
+        (see ThumbGen.get_view_params(); None to skip the thumbnail).
+
+        Returns the bunch of the products, or None if the image cannot
+        be ingested (e.g. its data is read on demand).
+        """
+        data = image.get_data()
+        if not isinstance(data, numpy.ndarray) or (len(data.shape) < 2):
+            return None
+
+        cutkey = None
+        if cutparams != None:
+            cutkey = self.autocuts.get_cache_key(**cutparams)
+        res = image.ingest
+        if (res != None) and (res.cutkey == cutkey) and \
+               (res.thumb_params == thumbparams):
+            # already done, e.g. for an image sharing the same data
+            return res
+        start_time = time.time()
+
+        height, width = data.shape[:2]
+        stride = max(1, int(numpy.ceil(float(max(width, height)) /
+                                       self.overview_size)))
+
+        use_crop = False
+        if cutkey != None:
+            method = cutkey[0]
+            if method != 'minmax':
+                cropradius = cutkey[4]
+                x0, y0, x1, y1 = self.autocuts.get_crop_bounds(
+                    width, height, cropradius=cropradius)
+                crop = numpy.empty(data[y0:y1, x0:x1].shape,
+                                   dtype=data.dtype)
+                use_crop = True
+
+        # the single pass over the data
+        row_bytes = max(1, data[0:1].nbytes)
+        step = max(1, self.block_bytes // row_bytes)
+        minmaxes = []
+        rows = []
+        for i in xrange(0, height, step):
+            block = numpy.asarray(data[i:i+step])
+            minmaxes.append(BaseImage.block_minmax(block))
+            if use_crop:
+                lo, hi = max(i, y0), min(i + len(block), y1)
+                if lo < hi:
+                    crop[lo-y0:hi-y0] = block[lo-i:hi-i, x0:x1]
+            # rows of the overview are every stride-th row of the data
+            first = (-i) % stride
+            rows.append(numpy.array(block[first::stride, ::stride]))
+            del block
+
+        res = Bunch.Bunch(minmax=None, cuts=None, cutkey=cutkey,
+                          overview=None, stride=stride,
+                          thumb=None, thumb_params=thumbparams)
+
+        minmax = BaseImage.combine_minmax(minmaxes)
+        image.set_minmax(*minmax)
+        res.minmax = minmax
+
+        if cutkey != None:
+            if use_crop:
+                cuts = self.autocuts.calc_data_cut_levels(
+                    crop, method=cutkey[0], pct=cutkey[1], numbins=cutkey[2])
+            else:
+                cuts = (minmax[0], minmax[1])
+            image.cutcache[cutkey] = cuts
+            res.cuts = cuts
+
+        overview = numpy.concatenate(rows)
+        res.overview = overview
+
+        if (thumbparams != None) and (len(data.shape) == 2):
+            ovimage = AstroImage.AstroImage(data_np=overview,
+                                            logger=self.logger)
+            # (for auto orientation)
+            ovimage.set(header=image.get_header())
+            try:
+                res.thumb = ThumbGen.render_thumb(ovimage, thumbparams,
+                                                  self.logger)
+            except Exception, e:
+                self.logger.warn("Error rendering thumbnail: %s" % (
+                    str(e)))
+
+        res.time = time.time() - start_time
+        self.logger.debug("Ingested %dx%d image in %.3f sec" % (
+            width, height, res.time))
+        image.ingest = res
+        return res
+
+#END
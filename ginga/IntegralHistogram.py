@@ -0,0 +1,170 @@
+#
+# IntegralHistogram.py -- summed-area histograms for fast region histograms
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import numpy
+import time
+import logging
+
+from ginga.misc import Bunch
+
+# Default number of value bins in an integral histogram
+default_inthist_bins = 256
+
+# Default side length (in pixels) of the spatial cells of an integral
+# histogram
+default_inthist_cellsize = 128
+
+
+class IntegralHistogram(object):
+    """Integral (summed-area) histogram of a 2D array.
+
+    The array is divided into square cells of _cellsize_ pixels and the
+    value range [minval, maxval] into _numbins_ bins.  The cumulative
+    histogram of every cell corner is precomputed, so that the histogram
+    of any region lying on the cell grid is found with four lookups.  For
+    an arbitrary region, the partial cells around the edges are binned
+    exactly from the data and added in.
+    """
+
+    def __init__(self, data, numbins=default_inthist_bins,
+                 cellsize=default_inthist_cellsize,
+                 minval=None, maxval=None, logger=None):
+        if logger != None:
+            self.logger = logger
+        else:
+            self.logger = logging.Logger('IntegralHistogram')
+
+        if len(data.shape) != 2:
+            raise ValueError("integral histograms need a 2D array")
+        self.data = data
+        self.numbins = numbins
+        self.cellsize = cellsize
+
+        if (minval == None) or (maxval == None):
+            finite = data[numpy.isfinite(data)]
+            if len(finite) == 0:
+                minval, maxval = 0.0, 0.0
+            else:
+                minval, maxval = finite.min(), finite.max()
+        self.minval = float(minval)
+        self.maxval = float(maxval)
+        self.bins = numpy.linspace(self.minval, self.maxval, numbins+1)
+
+        self._build()
+
+    def _bin_index(self, data):
+        """Returns an array of the bin numbers of the values in _data_,
+        with -1 for non-finite values.
+        """
+        delta = self.maxval - self.minval
+        if delta > 0.0:
+            scale = self.numbins / delta
+        else:
+            scale = 0.0
+        finite = numpy.isfinite(data)
+        idx = ((numpy.where(finite, data, self.minval) - self.minval) *
+               scale).astype('int')
+        idx = idx.clip(0, self.numbins-1)
+        idx[numpy.logical_not(finite)] = -1
+        return idx
+
+    def _build(self):
+        start_time = time.time()
+        height, width = self.data.shape
+        cs, nb = self.cellsize, self.numbins
+        self.nx = (width + cs - 1) // cs
+        self.ny = (height + cs - 1) // cs
+
+        # Unsigned counts keep the table small; 32 bits is enough unless
+        # the array has more than 4G pixels
+        if width * height < 2**32:
+            dtype = numpy.uint32
+        else:
+            dtype = numpy.uint64
+
+        # integral[j, i] holds the histogram of all cells above and to
+        # the left of cell corner (i, j)
+        integral = numpy.zeros((self.ny+1, self.nx+1, nb), dtype=dtype)
+
+        xcell = (numpy.arange(width) // cs) * nb
+        for j in xrange(self.ny):
+            # Work one stripe of cells at a time to bound the memory
+            # needed for the index arrays
+            idx = self._bin_index(self.data[j*cs:(j+1)*cs])
+            good = (idx >= 0)
+            comb = (idx + xcell)[good]
+            counts = numpy.bincount(comb, minlength=self.nx*nb)
+            counts = counts.reshape((self.nx, nb))
+            integral[j+1, 1:] = integral[j, 1:] + numpy.cumsum(counts, axis=0)
+
+        self.integral = integral
+        self.logger.debug("integral histogram %dx%dx%d built in %.4f sec" % (
+            self.nx, self.ny, nb, time.time() - start_time))
+
+    def _cell_sum(self, cx1, cy1, cx2, cy2):
+        """Histogram of the cells [cx1:cx2, cy1:cy2] by four lookups."""
+        a = self.integral
+        dist = (a[cy2, cx2] - a[cy1, cx2]) - (a[cy2, cx1] - a[cy1, cx1])
+        return dist.astype('int64')
+
+    def _exact(self, data):
+        """Histogram of _data_ using the same bins as the table."""
+        idx = self._bin_index(data)
+        return numpy.bincount(idx[idx >= 0], minlength=self.numbins)
+
+    def histogram(self, x1, y1, x2, y2, exact=True):
+        """Return a bunch with the distribution (dist) and bin edges (bins)
+        of the values in the region data[y1:y2, x1:x2].  If _exact_ is
+        False the region is enlarged to the enclosing cell boundaries and
+        no data is touched.
+        """
+        height, width = self.data.shape
+        cs = self.cellsize
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(width, x2), min(height, y2)
+        if (x2 <= x1) or (y2 <= y1):
+            dist = numpy.zeros(self.numbins, dtype='int64')
+            return Bunch.Bunch(dist=dist, bins=self.bins)
+
+        if not exact:
+            cx1, cy1 = x1 // cs, y1 // cs
+            cx2, cy2 = (x2 + cs - 1) // cs, (y2 + cs - 1) // cs
+            dist = self._cell_sum(cx1, cy1, cx2, cy2)
+            return Bunch.Bunch(dist=dist, bins=self.bins)
+
+        # Cells lying wholly inside the region (the last, partial cell
+        # counts as whole if the region extends to the edge of the data)
+        cx1, cy1 = (x1 + cs - 1) // cs, (y1 + cs - 1) // cs
+        if x2 == width:
+            cx2 = self.nx
+        else:
+            cx2 = x2 // cs
+        if y2 == height:
+            cy2 = self.ny
+        else:
+            cy2 = y2 // cs
+
+        if (cx2 <= cx1) or (cy2 <= cy1):
+            # region is too small to contain a whole cell
+            dist = self._exact(self.data[y1:y2, x1:x2]).astype('int64')
+            return Bunch.Bunch(dist=dist, bins=self.bins)
+
+        dist = self._cell_sum(cx1, cy1, cx2, cy2)
+
+        # Add in the strips around the inner cells exactly
+        ix1, iy1 = cx1 * cs, cy1 * cs
+        ix2, iy2 = min(cx2 * cs, width), min(cy2 * cs, height)
+        for (a1, b1, a2, b2) in ((x1, y1, x2, iy1), (x1, iy2, x2, y2),
+                                 (x1, iy1, ix1, iy2), (ix2, iy1, x2, iy2)):
+            if (a2 > a1) and (b2 > b1):
+                dist += self._exact(self.data[b1:b2, a1:a2])
+
+        return Bunch.Bunch(dist=dist, bins=self.bins)
+
+#END
@@ -61,14 +61,52 @@ working_profile = os.path.join(basedir, "profiles", "working.icc")
 
 class PythonImage(BaseImage):
 
-    def load_file(self, filepath):
-        kwds = {}
-        metadata = { 'exif': {}, 'path': filepath }
+    def load_file(self, filepath, maxsize=None):
+        """Load the image in _filepath_.  If _maxsize_ is given the image
+        is loaded at a reduced resolution that fits in _maxsize_ x
+        _maxsize_ pixels, decoding at that scale where the format allows
+        (e.g. JPEG); the image is then a proxy (see is_proxy()).
+        """
+        self._set_loaded(self._read_file(filepath, maxsize=maxsize))
 
-        data_np = self._imload(filepath, kwds)
+    def _read_file(self, filepath, maxsize=None):
+        kwds = {}
+        info = {}
+        data_np = self._imload(filepath, kwds, maxsize=maxsize, info=info)
+
+        ht, wd = data_np.shape[:2]
+        full_wd, full_ht = info.get('full_size', (wd, ht))
+        return Bunch.Bunch(path=filepath, data=data_np, exif=kwds,
+                           full_size=(full_wd, full_ht),
+                           proxy=(full_wd > wd) or (full_ht > ht))
+
+    def _set_loaded(self, res):
+        metadata = { 'exif': {}, 'path': res.path }
+        self.set_data(res.data, metadata=metadata)
+        self.set(exif=res.exif, full_size=res.full_size, proxy=res.proxy)
+
+    def is_proxy(self):
+        """True if the data is a reduced resolution version of the
+        image."""
+        return self.get('proxy', False)
+
+    def load_full(self):
+        """Replace the data of a proxy with the full resolution image."""
+        if self.is_proxy():
+            self.set_full(self.read_full())
+
+    def read_full(self):
+        """Read the full resolution image of a proxy, leaving this image
+        as it is (reading takes a while, so it is best done on a non-gui
+        thread).  The result is swapped in with set_full().
+        """
+        return self._read_file(self.get('path'))
 
-        self.set_data(data_np, metadata=metadata)
-        self.set(exif=kwds)
+    def set_full(self, res):
+        """Replace the data of a proxy with the full resolution image
+        _res_, as returned by read_full().
+        """
+        self._set_loaded(res)
 
     def save_file_as(self, filepath):
         if not have_pil:
@@ -140,10 +178,13 @@ class PythonImage(BaseImage):
         return self.get_scaled_cutout_pil(x1, y1, x2, y2,
                                           scale_x, scale_y,
                                           method=method)
-    def _imload(self, filepath, kwds):
+    def _imload(self, filepath, kwds, maxsize=None, info=None):
         """Load an image file, guessing the format, and return a numpy
         array containing an RGB image.  If EXIF keywords can be read
-        they are returned in the dict _kwds_.
+        they are returned in the dict _kwds_.  If _maxsize_ is given (and
+        PIL is available) the image is reduced to fit in _maxsize_ pixels;
+        the full (width, height) is then returned under 'full_size' in
+        the dict _info_.
         """
         start_time = time.time()
         typ, enc = mimetypes.guess_type(filepath)
@@ -163,10 +204,15 @@ class PythonImage(BaseImage):
             # return EXIF info, where QImage will not.
             means = 'PIL'
             image = Image.open(filepath)
+            if maxsize != None:
+                if info != None:
+                    info['full_size'] = image.size
+                # decode at a reduced scale, for formats that can
+                image.draft(image.mode, (maxsize, maxsize))
 
             try:
-                info = image._getexif()
-                for tag, value in info.items():
+                exif = image._getexif()
+                for tag, value in exif.items():
                     kwd = TAGS.get(tag, tag)
                     kwds[kwd] = value
 
@@ -219,6 +265,9 @@ class PythonImage(BaseImage):
                     self.logger.error("Error converting from embedded color profile: %s" % (str(e)))
                     self.logger.warn("Leaving image unprofiled.")
                         
+            if maxsize != None:
+                # reduce any further to size (no-op if it already fits)
+                image.thumbnail((maxsize, maxsize), Image.ANTIALIAS)
             data_np = numpy.array(image)
 
         elif have_qtimage:
@@ -236,8 +285,8 @@ class PythonImage(BaseImage):
             means, end_time - start_time))
         return data_np
 
-    def imload(self, filepath, kwds):
-        return self._imload(filepath, kwds)
+    def imload(self, filepath, kwds, maxsize=None, info=None):
+        return self._imload(filepath, kwds, maxsize=maxsize, info=info)
 
     def _imresize(self, data, new_wd, new_ht, method='bilinear'):
         """Scale an image in numpy array _data_ to the specified width and
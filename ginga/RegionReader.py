@@ -0,0 +1,347 @@
+#
+# RegionReader.py -- read regions of a FITS image on demand
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import threading
+import logging
+import collections
+
+import numpy
+
+from ginga.misc import Bunch
+
+# Default dimensions (rows, columns) of the blocks read and cached
+default_block_rows = 128
+default_block_cols = 2048
+
+# Default limit on the memory (in bytes) used by the block cache
+default_cache_bytes = 128 * 1024 * 1024
+
+# Data types of the FITS BITPIX values
+bitpix_dtypes = {
+    8: '>u1', 16: '>i2', 32: '>i4', 64: '>i8', -32: '>f4', -64: '>f8',
+    }
+
+
+def scaled_dtype(filedtype, bscale, bzero, blank=None):
+    """Returns the data type of values of _filedtype_ scaled by
+    _bscale_ and _bzero_, as pyfits would make them.  Float32 is used
+    where it holds the values exactly (8 and 16 bit integers).  Integers
+    with a _blank_ value are made floats (so that blanks can be NaN), as
+    pyfits does.
+    """
+    itemsize = filedtype.itemsize
+    if (bscale == 1) and (bzero == 0) and \
+           ((blank == None) or (filedtype.kind not in 'iu')):
+        return filedtype.newbyteorder('=')
+    elif ((bscale == 1) and (filedtype.kind == 'i') and
+          (bzero == 2**(itemsize*8 - 1))):
+        # unsigned integers stored with an offset
+        return numpy.dtype('uint%d' % (itemsize*8))
+    elif (itemsize <= 2) or (filedtype.str[1:] == 'f4'):
+        return numpy.dtype('float32')
+    else:
+        return numpy.dtype('float64')
+
+def scale_data(raw, dtype, bscale, bzero, blank=None):
+    """Convert raw file values _raw_ to (native) data type _dtype_,
+    applying _bscale_ and _bzero_.  Integer values equal to _blank_
+    become NaN.
+    """
+    if (dtype.kind == 'u') and (raw.dtype.kind == 'i'):
+        # adding the offset just flips the sign bit
+        udtype = raw.dtype.str.replace('i', 'u')
+        signbit = numpy.array(bzero, dtype=dtype)
+        return (raw.view(udtype) ^ signbit).astype(dtype)
+    data = raw.astype(dtype)
+    bad = None
+    if (blank != None) and (raw.dtype.kind in 'iu') and (dtype.kind == 'f'):
+        bad = (raw == blank)
+    if (bscale != 1) or (bzero != 0):
+        data *= bscale
+        data += bzero
+    if bad is not None:
+        data[bad] = numpy.nan
+    return data
+
+def is_scaled(header):
+    """Returns True if the data of the HDU of _header_ is scaled by
+    pyfits (i.e. it has BSCALE/BZERO, or BLANK for integer data).
+    """
+    return (header.get('BSCALE', 1) != 1) or (header.get('BZERO', 0) != 0) \
+           or ((header.get('BLANK', None) != None) and
+               (header.get('BITPIX', 0) > 0))
+
+class ScaledArray(object):
+    """Array-like view of the raw (unscaled) data _raw_ of an HDU with
+    _header_, that scales the parts that are indexed as they are read.
+    (pyfits cannot memory-map data that it scales itself.)
+    """
+
+    def __init__(self, raw, header):
+        self.raw = raw
+        self.bscale = header.get('BSCALE', 1)
+        self.bzero = header.get('BZERO', 0)
+        self.blank = header.get('BLANK', None)
+        self.dtype = scaled_dtype(raw.dtype, self.bscale, self.bzero,
+                                  blank=self.blank)
+        self.shape = raw.shape
+        self.ndim = len(raw.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, idx):
+        raw = numpy.asarray(self.raw[idx])
+        return scale_data(raw, self.dtype, self.bscale, self.bzero,
+                          blank=self.blank)
+
+
+class RegionReader(object):
+    """Array-like object for a 2D image in the data unit of a FITS file,
+    that reads only the parts of the image that are asked for.
+
+    Indexing with integers or slices (with any step) returns a numpy
+    array (or scalar) read from the file.  Outer indexing with a pair of
+    integer index arrays, as made by numpy.ix_(), reads only the rows
+    that are indexed and, for each of those, only the span of columns
+    that is indexed; this serves strided cutouts of huge images.
+
+    Dense reads go through a cache of recently read blocks of
+    _block_rows_ x _block_cols_ pixels, so that panning around at high
+    zoom hits the disk only for newly exposed blocks.
+    """
+
+    def __init__(self, filepath, offset, header, naxispath=None,
+                 block_rows=default_block_rows,
+                 block_cols=default_block_cols,
+                 cache_bytes=default_cache_bytes, logger=None):
+        if logger != None:
+            self.logger = logger
+        else:
+            self.logger = logging.Logger('RegionReader')
+
+        bitpix = header['BITPIX']
+        naxis = header['NAXIS']
+        if naxis < 2:
+            raise ValueError("region reading needs at least a 2D image")
+        # FITS axes run fastest first
+        dims = [ header['NAXIS%d' % (i+1)] for i in xrange(naxis) ]
+        dims.reverse()
+        height, width = dims[-2:]
+
+        self.filedtype = numpy.dtype(bitpix_dtypes[bitpix])
+        itemsize = self.filedtype.itemsize
+
+        # Offset of the chosen plane of a cube
+        if not naxispath:
+            naxispath = [0] * (naxis - 2)
+        plane = 0
+        for idx, dim in zip(naxispath, dims[:-2]):
+            plane = plane * dim + idx
+        self.offset = offset + plane * height * width * itemsize
+
+        # Scaling of the raw values, as done by pyfits
+        self.bscale = header.get('BSCALE', 1)
+        self.bzero = header.get('BZERO', 0)
+        self.blank = header.get('BLANK', None)
+        self.dtype = scaled_dtype(self.filedtype, self.bscale, self.bzero,
+                                  blank=self.blank)
+
+        self.shape = (height, width)
+        self.ndim = 2
+        self.size = height * width
+        self.itemsize = self.dtype.itemsize
+        self.nbytes = self.size * self.itemsize
+
+        self.block_rows = block_rows
+        self.block_cols = block_cols
+        block_bytes = block_rows * block_cols * self.itemsize
+        self.cache_blocks = max(1, cache_bytes // block_bytes)
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.RLock()
+        self.filepath = filepath
+        self.in_f = open(filepath, 'rb')
+
+    def close(self):
+        """Close the file and empty the cache.  The file is reopened if
+        more data is read.
+        """
+        with self.lock:
+            if self.in_f != None:
+                self.in_f.close()
+                self.in_f = None
+            self.cache.clear()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None):
+        self.logger.warn("Reading all of %dx%d image '%s'" % (
+            self.shape[1], self.shape[0], self.filepath))
+        data = self[:, :]
+        if dtype != None:
+            data = data.astype(dtype)
+        return data
+
+    def copy(self):
+        return numpy.asarray(self)
+
+    def astype(self, dtype):
+        return numpy.asarray(self).astype(dtype)
+
+    def get_stats(self):
+        """Returns a bunch of the block cache usage."""
+        with self.lock:
+            return Bunch.Bunch(blocks=len(self.cache),
+                               maxblocks=self.cache_blocks,
+                               hits=self.hits, misses=self.misses)
+
+    def _read_span(self, row, x1, x2):
+        """Read columns [x1:x2] of one row from the file (unscaled)."""
+        itemsize = self.filedtype.itemsize
+        with self.lock:
+            if self.in_f == None:
+                # reopened after close()
+                self.in_f = open(self.filepath, 'rb')
+            self.in_f.seek(self.offset + (row * self.shape[1] + x1) * itemsize)
+            buf = self.in_f.read((x2 - x1) * itemsize)
+        return numpy.frombuffer(buf, dtype=self.filedtype)
+
+    def _scale(self, raw):
+        """Convert raw file values to the data type of the image."""
+        return scale_data(raw, self.dtype, self.bscale, self.bzero,
+                          blank=self.blank)
+
+    def _get_block(self, by, bx):
+        key = (by, bx)
+        with self.lock:
+            try:
+                block = self.cache.pop(key)
+                self.cache[key] = block
+                self.hits += 1
+                return block
+            except KeyError:
+                self.misses += 1
+
+        height, width = self.shape
+        y1 = by * self.block_rows
+        y2 = min(y1 + self.block_rows, height)
+        x1 = bx * self.block_cols
+        x2 = min(x1 + self.block_cols, width)
+        raw = numpy.empty((y2 - y1, x2 - x1), dtype=self.filedtype)
+        for row in xrange(y1, y2):
+            raw[row - y1] = self._read_span(row, x1, x2)
+        block = self._scale(raw)
+
+        with self.lock:
+            self.cache[key] = block
+            while len(self.cache) > self.cache_blocks:
+                self.cache.popitem(last=False)
+        return block
+
+    def _read_dense(self, y1, y2, x1, x2):
+        """Read the region [y1:y2, x1:x2] through the block cache."""
+        br, bc = self.block_rows, self.block_cols
+        data = numpy.empty((y2 - y1, x2 - x1), dtype=self.dtype)
+        for by in xrange(y1 // br, (y2 - 1) // br + 1):
+            for bx in xrange(x1 // bc, (x2 - 1) // bc + 1):
+                block = self._get_block(by, bx)
+                # intersection of the block and the region
+                a1, a2 = max(y1, by * br), min(y2, (by + 1) * br)
+                b1, b2 = max(x1, bx * bc), min(x2, (bx + 1) * bc)
+                data[a1-y1:a2-y1, b1-x1:b2-x1] = \
+                    block[a1-by*br:a2-by*br, b1-bx*bc:b2-bx*bc]
+        return data
+
+    def _read_rows(self, rows, x1, x2):
+        """Read columns [x1:x2] of the (increasing) _rows_."""
+        if len(rows) == 0 or x2 <= x1:
+            return numpy.zeros((len(rows), max(0, x2 - x1)), dtype=self.dtype)
+        y1, y2 = rows[0], rows[-1] + 1
+        if (y2 - y1) <= 2 * len(rows):
+            # rows are (nearly) contiguous--read the region via the cache
+            return self._read_dense(y1, y2, x1, x2)[rows - y1]
+
+        # sparse rows--read just the span of each one
+        raw = numpy.empty((len(rows), x2 - x1), dtype=self.filedtype)
+        for i, row in enumerate(rows):
+            raw[i] = self._read_span(row, x1, x2)
+        return self._scale(raw)
+
+    def _outer(self, rows, cols):
+        """Outer indexing by integer arrays _rows_ and _cols_."""
+        height, width = self.shape
+        rows = numpy.asarray(rows).ravel().astype('int64')
+        cols = numpy.asarray(cols).ravel().astype('int64')
+        rows[rows < 0] += height
+        cols[cols < 0] += width
+        if len(cols) == 0:
+            return numpy.zeros((len(rows), 0), dtype=self.dtype)
+        urows, rinv = numpy.unique(rows, return_inverse=True)
+        x1, x2 = cols.min(), cols.max() + 1
+        data = self._read_rows(urows, x1, x2)
+        return data[rinv][:, cols - x1]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        if len(key) != 2:
+            raise IndexError("too many indices")
+        ykey, xkey = key
+
+        if isinstance(ykey, numpy.ndarray) or isinstance(xkey, numpy.ndarray):
+            ykey, xkey = numpy.asarray(ykey), numpy.asarray(xkey)
+            if (ykey.ndim == 2) and (xkey.ndim == 2) and \
+                   (ykey.shape[1] == 1) and (xkey.shape[0] == 1):
+                # as made by numpy.ix_()
+                return self._outer(ykey, xkey)
+            raise IndexError("only outer (numpy.ix_) indexing by arrays is supported")
+
+        height, width = self.shape
+        scalar_y = not isinstance(ykey, slice)
+        scalar_x = not isinstance(xkey, slice)
+        if scalar_y:
+            ykey = int(ykey)
+            if ykey < 0:
+                ykey += height
+            if not (0 <= ykey < height):
+                raise IndexError("index %d out of range" % (ykey))
+            ykey = slice(ykey, ykey + 1)
+        if scalar_x:
+            xkey = int(xkey)
+            if xkey < 0:
+                xkey += width
+            if not (0 <= xkey < width):
+                raise IndexError("index %d out of range" % (xkey))
+            xkey = slice(xkey, xkey + 1)
+
+        ystart, ystop, ystep = ykey.indices(height)
+        xstart, xstop, xstep = xkey.indices(width)
+        rows = numpy.arange(ystart, ystop, ystep)
+        cols = numpy.arange(xstart, xstop, xstep)
+        if (ystep < 0) or (xstep < 0) or (len(rows) == 0) or \
+               (len(cols) == 0):
+            data = self._outer(rows.reshape((-1, 1)), cols.reshape((1, -1)))
+        else:
+            data = self._read_rows(rows, cols[0], cols[-1] + 1)
+            if xstep != 1:
+                data = data[:, ::xstep]
+
+        if scalar_y and scalar_x:
+            return data[0, 0]
+        elif scalar_y:
+            return data[0]
+        elif scalar_x:
+            return data[:, 0]
+        return data
+
+#END
@@ -0,0 +1,193 @@
+#
+# SliceCache.py -- cache of the images made from the HDUs of a FITS file
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import threading
+import logging
+import collections
+
+from ginga.misc import Bunch
+from ginga.AstroImage import AstroImage
+
+# Default limit on the memory (in bytes) used by the images in a cache
+default_cache_bytes = 256 * 1024 * 1024
+
+# Default number of slices prefetched ahead along the axis being stepped
+default_prefetch_slices = 8
+
+
+class SliceCache(object):
+    """Byte-bounded LRU cache of the images made from the HDUs, and from
+    the 2D slices of the data cubes, of an open FITS file.
+
+    get() returns the image for an HDU and a path through its extra axes
+    (as for AstroImage.load_hdu), making it if it is not in the cache.
+    A cached image holds a native byte order copy of its slice, so that
+    stepping back to it costs neither file access nor decoding, and it
+    keeps any cut levels calculated for it.  The least recently used
+    images are dropped when they take up more than _maxbytes_.
+
+    prefetch() fills the cache with the slices that follow a slice along
+    one axis; it is meant to be run on a non-gui thread.  close() stops
+    any prefetching and waits for it to finish, and must be called
+    before _fits_f_ is closed.
+
+    _fits_f_ must be opened with pyfits' do_not_scale_image_data (as it
+    cannot memory-map scaled data): any BSCALE/BZERO/BLANK scaling is
+    applied to each slice as its image is made.
+    """
+
+    def __init__(self, fits_f, path, maxbytes=default_cache_bytes,
+                 logger=None):
+        if logger != None:
+            self.logger = logger
+        else:
+            self.logger = logging.Logger('SliceCache')
+        self.fits_f = fits_f
+        self.path = path
+        self.maxbytes = maxbytes
+
+        self.lock = threading.RLock()
+        self.cond = threading.Condition(self.lock)
+        # (numhdu, naxispath) -> image, least recently used first
+        self.cache = collections.OrderedDict()
+        self.sizes = {}
+        self.totalbytes = 0
+        self.hits = 0
+        self.misses = 0
+        # incremented to abandon any prefetch in progress
+        self.prefetch_gen = 0
+        # number of prefetches running
+        self.prefetching = 0
+        self.closed = False
+
+    def clear(self):
+        with self.lock:
+            self.prefetch_gen += 1
+            self.cache.clear()
+            self.sizes = {}
+            self.totalbytes = 0
+
+    def close(self):
+        """Abandon any prefetch in progress, wait for it to finish and
+        clear the cache.  Prefetches started afterwards do nothing.
+        """
+        with self.cond:
+            self.closed = True
+            self.clear()
+            while self.prefetching > 0:
+                self.cond.wait()
+
+    def get_dims(self, numhdu):
+        """Returns the dimensions (fastest axis first) of the data of HDU
+        _numhdu_.
+        """
+        with self.lock:
+            data = self.fits_f[numhdu].data
+        dims = list(data.shape)
+        dims.reverse()
+        return dims
+
+    def _make_image(self, numhdu, naxispath):
+        with self.lock:
+            hdu = self.fits_f[numhdu]
+            data = hdu.data
+        for idx in naxispath:
+            data = data[idx]
+
+        # reads (and decodes and scales) the slice once, independent of
+        # the file
+        image = AstroImage(logger=self.logger)
+        image.set(path=self.path)
+        image.load_hdu(hdu, fobj=self.fits_f, data=data, native=True,
+                       unscaled=True)
+        return image
+
+    def get(self, numhdu, naxispath=None):
+        """Returns the image of HDU _numhdu_ and slice _naxispath_."""
+        if naxispath == None:
+            naxispath = []
+        key = (numhdu, tuple(naxispath))
+        with self.lock:
+            try:
+                image = self.cache.pop(key)
+                self.cache[key] = image
+                self.hits += 1
+                return image
+            except KeyError:
+                self.misses += 1
+
+        image = self._make_image(numhdu, naxispath)
+        size = image.get_data().nbytes
+
+        with self.lock:
+            if self.cache.has_key(key):
+                # made meanwhile by another thread
+                return self.cache[key]
+            self.cache[key] = image
+            self.sizes[key] = size
+            self.totalbytes += size
+            while (self.totalbytes > self.maxbytes) and \
+                      (len(self.cache) > 1):
+                oldkey, oldimage = self.cache.popitem(last=False)
+                self.totalbytes -= self.sizes.pop(oldkey)
+        return image
+
+    def prefetch(self, numhdu, naxispath, m, step=1,
+                 count=default_prefetch_slices, prepare=None):
+        """Load into the cache the _count_ slices following _naxispath_
+        in direction _step_ along its _m_-th axis, wrapping around at
+        the ends.  If _prepare_ is given it is called on each prefetched
+        image (e.g. to calculate its cut levels).  A later call of
+        prefetch() or clear() abandons this one.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.prefetch_gen += 1
+            gen = self.prefetch_gen
+            self.prefetching += 1
+        try:
+            self._prefetch(gen, numhdu, naxispath, m, step, count, prepare)
+        finally:
+            with self.cond:
+                self.prefetching -= 1
+                self.cond.notifyAll()
+
+    def _prefetch(self, gen, numhdu, naxispath, m, step, count, prepare):
+        # numpy order of the axes, slowest first
+        dims = self.get_dims(numhdu)
+        dims.reverse()
+        dim = dims[m]
+        # don't wrap around onto the current slice, nor prefetch more
+        # than fits in the cache alongside it
+        size = max(1, self.get(numhdu, naxispath).get_data().nbytes)
+        count = min(count, dim - 1, self.maxbytes // size - 1)
+        for i in xrange(1, count + 1):
+            if self.prefetch_gen != gen:
+                return
+            path = list(naxispath)
+            path[m] = (naxispath[m] + i * step) % dim
+            try:
+                image = self.get(numhdu, path)
+                if prepare != None:
+                    prepare(image)
+            except Exception, e:
+                self.logger.warn("Error prefetching HDU %d slice %s: %s" % (
+                    numhdu, str(path), str(e)))
+                return
+
+    def get_stats(self):
+        """Returns a bunch of the cache usage."""
+        with self.lock:
+            return Bunch.Bunch(count=len(self.cache),
+                               totalbytes=self.totalbytes,
+                               maxbytes=self.maxbytes,
+                               hits=self.hits, misses=self.misses)
+
+#END
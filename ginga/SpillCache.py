@@ -0,0 +1,168 @@
+#
+# SpillCache.py -- disk tier for images evicted from memory
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import os
+import threading
+import tempfile
+import hashlib
+import logging
+import collections
+import cPickle as pickle
+
+import numpy
+
+from ginga.misc import Bunch
+
+# Default limit on the disk space (in bytes) used by a spill cache
+default_spill_bytes = 4 * 1024 * 1024 * 1024
+
+
+class SpillCache(object):
+    """Scratch directory of images that have been evicted from memory.
+
+    spill() writes the data of an image as a raw .npy file, and its
+    metadata (FITS header etc.) and calculated cut levels to a pickle.
+    restore() makes a new image of the same class whose data is
+    memory-mapped (copy-on-write) from the .npy file, so that bringing an
+    image back costs next to nothing until its pixels are viewed.
+
+    When the files take up more than _maxbytes_ the least recently
+    spilled or restored images are deleted.  The files are only good for
+    the life of the cache; clear() deletes them all.
+    """
+
+    def __init__(self, spilldir=None, maxbytes=default_spill_bytes,
+                 logger=None):
+        if logger != None:
+            self.logger = logger
+        else:
+            self.logger = logging.Logger('SpillCache')
+
+        if spilldir == None:
+            spilldir = tempfile.mkdtemp(prefix='ginga-spill-')
+            self.own_dir = True
+        else:
+            if not os.path.isdir(spilldir):
+                os.makedirs(spilldir)
+            self.own_dir = False
+        self.spilldir = spilldir
+        self.maxbytes = maxbytes
+
+        self.lock = threading.RLock()
+        # (chname, imname) -> bunch of file paths and size, least
+        # recently used first
+        self.entries = collections.OrderedDict()
+        self.totalbytes = 0
+
+    def _basepath(self, key):
+        return os.path.join(self.spilldir,
+                            hashlib.sha1(repr(key)).hexdigest())
+
+    def has(self, chname, imname):
+        with self.lock:
+            return self.entries.has_key((chname, imname))
+
+    def spill(self, chname, imname, image):
+        """Write _image_ to the cache under (_chname_, _imname_).  Returns
+        False if the image data is not a plain numpy array.
+        """
+        data = image.get_data()
+        if not isinstance(data, numpy.ndarray):
+            return False
+        key = (chname, imname)
+        basepath = self._basepath(key)
+        datapath, metapath = basepath + '.npy', basepath + '.pkl'
+
+        klass = image.__class__
+        info = dict(module=klass.__module__, classname=klass.__name__,
+                    metadata=image.metadata, cutcache=image.cutcache)
+        # write under temporary names, so that a partly written image is
+        # never restored
+        with open(datapath + '.tmp', 'wb') as out_f:
+            numpy.save(out_f, numpy.ascontiguousarray(data))
+        with open(metapath + '.tmp', 'wb') as out_f:
+            pickle.dump(info, out_f, pickle.HIGHEST_PROTOCOL)
+        os.rename(datapath + '.tmp', datapath)
+        os.rename(metapath + '.tmp', metapath)
+        size = os.path.getsize(datapath) + os.path.getsize(metapath)
+
+        with self.lock:
+            if self.entries.has_key(key):
+                self.totalbytes -= self.entries.pop(key).size
+            self.entries[key] = Bunch.Bunch(datapath=datapath,
+                                            metapath=metapath, size=size)
+            self.totalbytes += size
+            while (self.totalbytes > self.maxbytes) and \
+                      (len(self.entries) > 1):
+                oldkey = self.entries.keys()[0]
+                self.remove(*oldkey)
+        self.logger.debug("spilled '%s' (%d bytes)" % (imname, size))
+        return True
+
+    def restore(self, chname, imname, logger=None):
+        """Return a new image made from the files of (_chname_, _imname_),
+        with its data memory-mapped.
+        """
+        key = (chname, imname)
+        with self.lock:
+            bnch = self.entries.pop(key)
+            self.entries[key] = bnch
+
+        with open(bnch.metapath, 'rb') as in_f:
+            info = pickle.load(in_f)
+        data = numpy.load(bnch.datapath, mmap_mode='c')
+
+        module = __import__(info['module'], fromlist=[info['classname']])
+        klass = getattr(module, info['classname'])
+        if logger == None:
+            logger = self.logger
+        image = klass(logger=logger)
+        image.set_data(data, metadata=info['metadata'])
+        image.cutcache.update(info['cutcache'])
+        # the data is paged in from (and out to) the spill file, so it
+        # takes no memory of its own; 'spilled' says it need not be
+        # written again while the files are in the cache
+        image.set(memmap=True, spilled=True)
+        return image
+
+    def remove(self, chname, imname):
+        key = (chname, imname)
+        with self.lock:
+            bnch = self.entries.pop(key, None)
+            if bnch == None:
+                return
+            self.totalbytes -= bnch.size
+        for path in (bnch.datapath, bnch.metapath):
+            try:
+                os.remove(path)
+            except OSError, e:
+                self.logger.warn("Error removing '%s': %s" % (path, str(e)))
+
+    def clear(self):
+        """Delete all the spilled images (and the directory, if it was
+        made by the cache).
+        """
+        with self.lock:
+            for key in self.entries.keys():
+                self.remove(*key)
+        if self.own_dir:
+            try:
+                os.rmdir(self.spilldir)
+            except OSError, e:
+                self.logger.warn("Error removing '%s': %s" % (
+                    self.spilldir, str(e)))
+
+    def get_stats(self):
+        """Returns a bunch of the cache usage."""
+        with self.lock:
+            return Bunch.Bunch(count=len(self.entries),
+                               totalbytes=self.totalbytes,
+                               maxbytes=self.maxbytes)
+
+#END
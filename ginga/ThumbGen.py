@@ -0,0 +1,199 @@
+#
+# ThumbGen.py -- make thumbnails in a pool of processes
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import threading
+import logging
+import mimetypes
+import multiprocessing
+
+import numpy
+
+from ginga.misc import Bunch
+from ginga import FitsImage, AstroImage, PythonImage
+
+# Default number of processes used to make thumbnails
+default_thumb_workers = multiprocessing.cpu_count()
+
+# Default length (in pixels) of the long side of a thumbnail
+default_thumb_width = 150
+
+# Process pool shared by all generators (see start_pool())
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def start_pool(numworkers=None):
+    """Start the (shared) pool of _numworkers_ thumbnail processes.
+    This must be done at startup, before any other threads are running
+    (see TileCompress.start_pool()).  Without a pool (or with
+    _numworkers_ <= 1) thumbnails are made in the calling process.
+    """
+    global _pool
+    if numworkers == None:
+        numworkers = default_thumb_workers
+    with _pool_lock:
+        if (_pool == None) and (numworkers > 1):
+            _pool = multiprocessing.Pool(numworkers)
+
+def get_pool(numworkers):
+    """Returns the pool of thumbnail processes for work to be spread
+    over _numworkers_ of them, or None for making thumbnails in the
+    calling process (e.g. if no pool was started).
+    """
+    if numworkers <= 1:
+        return None
+    with _pool_lock:
+        return _pool
+
+def shutdown():
+    """Stop the thumbnail processes."""
+    global _pool
+    with _pool_lock:
+        if _pool != None:
+            _pool.terminate()
+            _pool.join()
+            _pool = None
+
+
+class FitsImageHeadless(FitsImage.FitsImageBase):
+    """A viewer with no window, that renders only on request, through
+    get_rgb_object().
+    """
+
+    def __init__(self, logger=None, rgbmap=None, settings=None):
+        FitsImage.FitsImageBase.__init__(self, logger=logger, rgbmap=rgbmap,
+                                         settings=settings)
+        # a proxy image is as much as a thumbnail needs
+        self.t_.set(load_full_on_zoom=False)
+
+    def redraw(self, whence=0):
+        pass
+
+    def render_image(self, rgbobj, dst_x, dst_y):
+        pass
+
+    def update_image(self):
+        pass
+
+
+def get_view_params(fitsimage, width=default_thumb_width):
+    """Returns a dict of the view settings of _fitsimage_ (color map,
+    transforms, etc.) with which to make thumbnails of _width_ pixels.
+    """
+    t_ = fitsimage.get_settings()
+    rgbmap = fitsimage.get_rgbmap()
+    params = dict(width=width,
+                  color_map=rgbmap.get_cmap().name,
+                  intensity_map=rgbmap.get_imap().name,
+                  color_algorithm=rgbmap.get_hash_algorithm(),
+                  color_hashsize=rgbmap.get_hash_size())
+    for name in ('autocut_method', 'autocut_hist_pct', 'autocut_bins',
+                 'flip_x', 'flip_y', 'swap_xy'):
+        params[name] = t_[name]
+    return params
+
+def load_image(path, logger, maxsize=None):
+    # as Control.load_image(): an AstroImage, unless the MIME type says
+    # it is some other kind of image (which is loaded reduced to fit
+    # _maxsize_, if given)
+    typ, enc = mimetypes.guess_type(path)
+    if typ and typ.startswith('image/') and (typ != 'image/fits'):
+        image = PythonImage.PythonImage(logger=logger)
+        image.load_file(path, maxsize=maxsize)
+    else:
+        # (pyfits' default memory-maps the data if it can, i.e. if it is
+        # not scaled)
+        image = AstroImage.AstroImage(logger=logger)
+        image.load_file(path)
+    return image
+
+def render_thumb(image, params, logger):
+    """Returns an RGB array (height x width x 3, uint8) of a thumbnail of
+    _image_ made with view settings _params_ (see get_view_params()).
+    """
+    width = params.get('width', default_thumb_width)
+    viewer = FitsImageHeadless(logger=logger)
+    viewer.set_window_size(width, width, redraw=False)
+    viewer.enable_autozoom('on')
+    viewer.enable_autocuts('on')
+    viewer.enable_auto_orient(True)
+    settings = dict(params)
+    del settings['width']
+    viewer.get_settings().set(**settings)
+    viewer.set_image(image, redraw=False)
+
+    rgbobj = viewer.get_rgb_object(whence=0)
+    return numpy.dstack((rgbobj.r, rgbobj.g, rgbobj.b))
+
+def make_thumb(path, params, keywords=[]):
+    """Make the thumbnail of the image in file _path_.  (Runs in the worker
+    processes.)
+
+    Returns a tuple of the path, the thumbnail as an RGB array, a
+    dict of the values of the header _keywords_ (for a tooltip) and an
+    error message (None if there was no error).
+    """
+    logger = logging.Logger('ThumbGen')
+    logger.addHandler(logging.NullHandler())
+    try:
+        image = load_image(path, logger,
+                           maxsize=params.get('width', default_thumb_width))
+        rgb = render_thumb(image, params, logger)
+        header = image.get_header()
+
+        metadata = {}
+        for kwd in keywords:
+            metadata[kwd] = header.get(kwd, 'N/A')
+
+    except Exception, e:
+        return (path, None, {}, str(e))
+    return (path, rgb, metadata, None)
+
+def _make_thumb(args):
+    path, params, keywords = args
+    return make_thumb(path, params, keywords=keywords)
+
+
+class ThumbGenerator(object):
+    """Makes the thumbnails of a list of files in a pool of processes.
+
+    Each worker loads (decodes) an image, downsamples it to the thumbnail
+    size, calculates its cut levels and maps it to color, with a headless
+    viewer; only the small RGB arrays of the thumbnails are sent back.
+    generate() is meant to be run on a non-gui thread; it calls
+    _thumb_cb_ with a bunch of the result (see make_thumb()) of each file
+    as it comes in, in the order of the files.
+    """
+
+    def __init__(self, numworkers=default_thumb_workers, logger=None):
+        if logger != None:
+            self.logger = logger
+        else:
+            self.logger = logging.Logger('ThumbGen')
+        self.numworkers = numworkers
+
+    def generate(self, paths, params, thumb_cb, keywords=[]):
+        """Make the thumbnails of the files _paths_ with view settings
+        _params_.
+        """
+        args = map(lambda path: (path, params, keywords), paths)
+        pool = get_pool(min(self.numworkers, len(args)))
+        if pool == None:
+            results = (_make_thumb(arg) for arg in args)
+        else:
+            results = pool.imap(_make_thumb, args)
+
+        for path, rgb, metadata, errmsg in results:
+            if errmsg != None:
+                self.logger.error("Error generating thumbnail for '%s': %s" % (
+                    path, errmsg))
+            thumb_cb(Bunch.Bunch(path=path, rgb=rgb, metadata=metadata,
+                                 errmsg=errmsg))
+
+#END
@@ -0,0 +1,214 @@
+#
+# ThumbStore.py -- packed on-disk store of the thumbnails of a directory
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import os
+import threading
+import hashlib
+import logging
+import cPickle as pickle
+
+import numpy
+
+from ginga.misc import Bunch
+
+# Version of the index format; an index of any other version is ignored
+index_version = 1
+
+index_name = 'index'
+blob_name = 'thumbs.dat'
+
+
+def get_params_key(params):
+    """Returns a short key for the view settings _params_ (a dict) of a
+    thumbnail, e.g. from ThumbGen.get_view_params().
+    """
+    return hashlib.sha1(repr(sorted(params.items()))).hexdigest()[:16]
+
+
+class ThumbStore(object):
+    """Thumbnails of the images of one source directory, packed in a
+    single blob file in _thumbdir_.
+
+    The index file maps each image file name to its modification time
+    and size, the key of the view settings the thumbnail was made with,
+    its tooltip metadata and the offset and shape of its raw RGB pixels
+    in the blob.  A thumbnail is only good while the file's time and size
+    and the view settings match; stale thumbnails and those of files that
+    are gone are pruned from the index, and the blob is compacted when
+    more than half of it is dead.
+    """
+
+    def __init__(self, srcdir, thumbdir, logger=None):
+        if logger != None:
+            self.logger = logger
+        else:
+            self.logger = logging.Logger('ThumbStore')
+        self.srcdir = srcdir
+        self.thumbdir = thumbdir
+        self.indexpath = os.path.join(thumbdir, index_name)
+        self.blobpath = os.path.join(thumbdir, blob_name)
+
+        self.lock = threading.RLock()
+        # name -> (mtime, size, paramskey, metadata, offset, height, width)
+        self.index = {}
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.indexpath, 'rb') as in_f:
+                info = pickle.load(in_f)
+            if info.get('version', None) != index_version:
+                raise ValueError("index version mismatch")
+            index = info['entries']
+            blobsize = os.path.getsize(self.blobpath)
+        except (IOError, OSError), e:
+            # no store yet
+            return
+        except Exception, e:
+            self.logger.warn("Discarding thumb index '%s': %s" % (
+                self.indexpath, str(e)))
+            self.dirty = True
+            return
+
+        # prune thumbs of files that are gone, and of any beyond the end
+        # of the blob (e.g. if it was truncated)
+        try:
+            names = set(os.listdir(self.srcdir))
+        except OSError:
+            names = set([])
+        for name, entry in index.items():
+            offset, ht, wd = entry[4:7]
+            if (not name in names) or (offset + ht * wd * 3 > blobsize):
+                del index[name]
+                self.dirty = True
+        self.index = index
+
+    def _stat(self, name):
+        st = os.stat(os.path.join(self.srcdir, name))
+        return (st.st_mtime, st.st_size)
+
+    def lookup(self, names, paramskey):
+        """Look up the thumbnails of the files _names_ (in the source
+        directory) made with view settings _paramskey_.  Returns a dict of
+        name -> (rgb array, metadata) for the ones found; the stale ones
+        are pruned.
+        """
+        res = {}
+        with self.lock:
+            found = []
+            for name in names:
+                entry = self.index.get(name, None)
+                if entry == None:
+                    continue
+                try:
+                    mtime, size = self._stat(name)
+                except OSError:
+                    mtime, size = None, None
+                if (entry[0], entry[1]) != (mtime, size):
+                    del self.index[name]
+                    self.dirty = True
+                    continue
+                if entry[2] == paramskey:
+                    found.append((name, entry))
+            if len(found) == 0:
+                return res
+
+            # read all the thumbs through one mapping of the blob
+            blob = numpy.memmap(self.blobpath, dtype=numpy.uint8, mode='r')
+            try:
+                for name, entry in found:
+                    metadata, offset, ht, wd = entry[3:7]
+                    rgb = numpy.array(blob[offset:offset + ht * wd * 3])
+                    res[name] = (rgb.reshape((ht, wd, 3)), metadata)
+            finally:
+                del blob
+        return res
+
+    def add(self, items, paramskey):
+        """Add thumbnails to the store.  _items_ is a list of (name, rgb
+        array, metadata) for files in the source directory; the
+        thumbnails were made with view settings _paramskey_.
+        """
+        with self.lock:
+            with open(self.blobpath, 'ab') as out_f:
+                out_f.seek(0, 2)
+                for name, rgb, metadata in items:
+                    try:
+                        mtime, size = self._stat(name)
+                    except OSError:
+                        continue
+                    rgb = numpy.ascontiguousarray(rgb, dtype=numpy.uint8)
+                    ht, wd = rgb.shape[:2]
+                    offset = out_f.tell()
+                    out_f.write(rgb.tostring())
+                    self.index[name] = (mtime, size, paramskey, metadata,
+                                        offset, ht, wd)
+            self.dirty = True
+
+    def _compact(self, tmppath):
+        # write the live thumbs, packed, to _tmppath_ and return the
+        # index of them there; the store itself is left as it is
+        index = {}
+        blob = numpy.memmap(self.blobpath, dtype=numpy.uint8, mode='r')
+        try:
+            with open(tmppath, 'wb') as out_f:
+                for name, entry in self.index.items():
+                    offset, ht, wd = entry[4:7]
+                    newoffset = out_f.tell()
+                    out_f.write(blob[offset:offset + ht * wd * 3].tostring())
+                    index[name] = entry[:4] + (newoffset, ht, wd)
+        finally:
+            del blob
+        return index
+
+    def save(self):
+        """Write the index (compacting the blob first if need be), if it
+        has changed.
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            index = self.index
+            blobtmp = None
+            tmppath = self.indexpath + '.tmp'
+            try:
+                livebytes = sum(map(lambda entry: entry[5] * entry[6] * 3,
+                                    self.index.values()))
+                if os.path.exists(self.blobpath):
+                    blobsize = os.path.getsize(self.blobpath)
+                    if blobsize > 2 * livebytes:
+                        blobtmp = self.blobpath + '.tmp'
+                        index = self._compact(blobtmp)
+
+                info = dict(version=index_version, srcdir=self.srcdir,
+                            entries=index)
+                with open(tmppath, 'wb') as out_f:
+                    pickle.dump(info, out_f, pickle.HIGHEST_PROTOCOL)
+
+                # the compacted blob and its index are put in place only
+                # once both are written
+                if blobtmp != None:
+                    os.rename(blobtmp, self.blobpath)
+                    self.index = index
+                os.rename(tmppath, self.indexpath)
+                self.dirty = False
+
+            except (IOError, OSError), e:
+                self.logger.error("Error saving thumb index '%s': %s" % (
+                    self.indexpath, str(e)))
+                for path in (blobtmp, tmppath):
+                    if (path != None) and os.path.exists(path):
+                        os.remove(path)
+
+    def get_stats(self):
+        with self.lock:
+            return Bunch.Bunch(count=len(self.index), srcdir=self.srcdir)
+
+#END
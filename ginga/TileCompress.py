@@ -0,0 +1,394 @@
+#
+# TileCompress.py -- read tile-compressed FITS images
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import re
+import threading
+import logging
+import collections
+import multiprocessing
+import cStringIO
+
+import numpy
+import pyfits
+
+from ginga import RegionReader
+
+# Default number of processes used to decompress tiles.  (The pyfits
+# decompression code holds the interpreter lock, so threads would not
+# run it in parallel.)
+default_decomp_workers = multiprocessing.cpu_count()
+
+# Default limit on the memory (in bytes) used by the tile cache
+default_cache_bytes = 128 * 1024 * 1024
+
+fits_block_size = 2880
+
+# Sizes (in bytes) of the binary table column types; 'X' is in bits
+tform_sizes = {
+    'L': 1, 'X': 1, 'B': 1, 'I': 2, 'J': 4, 'K': 8, 'A': 1,
+    'E': 4, 'D': 8, 'C': 8, 'M': 16, 'P': 8, 'Q': 16,
+    }
+tform_re = re.compile(r'^\s*(\d*)([A-Z])(?:([A-Z])(?:\(\d*\))?)?')
+
+# Process pool shared by all readers (see start_pool())
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def start_pool(numworkers=None):
+    """Start the (shared) pool of _numworkers_ decompression processes.
+    This must be done at startup, before any other threads are running:
+    the processes are forked, and a process forked from one with other
+    threads can deadlock on locks those threads held.  Without a pool
+    (or with _numworkers_ <= 1) tiles are decompressed in the calling
+    process.
+    """
+    global _pool
+    if numworkers == None:
+        numworkers = default_decomp_workers
+    with _pool_lock:
+        if (_pool == None) and (numworkers > 1):
+            _pool = multiprocessing.Pool(numworkers)
+
+def get_pool(numworkers):
+    """Returns the pool of decompression processes for work to be
+    spread over _numworkers_ of them, or None for decompressing in the
+    calling process (e.g. if no pool was started).
+    """
+    if numworkers <= 1:
+        return None
+    with _pool_lock:
+        return _pool
+
+def shutdown():
+    """Stop the decompression processes."""
+    global _pool
+    with _pool_lock:
+        if _pool != None:
+            _pool.terminate()
+            _pool.join()
+            _pool = None
+
+def decompress(buf):
+    """Decompress the image of _buf_, a FITS file in a string holding a
+    compressed image HDU.  (Runs in the worker processes.)
+    """
+    fits_f = pyfits.open(cStringIO.StringIO(buf), 'readonly')
+    try:
+        return numpy.array(fits_f[1].data)
+    finally:
+        fits_f.close()
+
+def _pad(buf, fill):
+    rem = len(buf) % fits_block_size
+    if rem == 0:
+        return buf
+    return buf + fill * (fits_block_size - rem)
+
+
+class TileReader(RegionReader.RegionReader):
+    """Array-like object for a 2D image in a tile-compressed (e.g.
+    fpack'ed) image HDU, that decompresses only the tiles overlapping
+    the parts of the image that are asked for.
+
+    The tile table is not read by pyfits.  Instead, for each run of
+    needed tiles that makes up a rectangle of the image, the table rows
+    and their compressed bytes are read from the file and wrapped up as
+    a small compressed image HDU of their own, which pyfits decompresses.
+    The runs are decompressed in parallel by a pool of _numworkers_
+    processes.  Decompressed tiles are kept in a cache, so that panning
+    decompresses only the newly exposed tiles.
+
+    Indexing is as for a RegionReader.
+    """
+
+    def __init__(self, filepath, offset, header, naxispath=None,
+                 numworkers=None, cache_bytes=default_cache_bytes,
+                 logger=None):
+        if logger != None:
+            self.logger = logger
+        else:
+            self.logger = logging.Logger('TileReader')
+        if numworkers == None:
+            numworkers = default_decomp_workers
+        self.numworkers = numworkers
+
+        # header is the binary table header of the HDU
+        self.header = header.copy()
+        znaxis = header['ZNAXIS']
+        if znaxis < 2:
+            raise ValueError("region reading needs at least a 2D image")
+        dims = [ header['ZNAXIS%d' % (i+1)] for i in xrange(znaxis) ]
+        # tiles are whole rows unless given otherwise
+        tiles = [ header.get('ZTILE%d' % (i+1), 1) for i in xrange(znaxis) ]
+        tiles[0] = header.get('ZTILE1', dims[0])
+        for tile in tiles[2:]:
+            if tile != 1:
+                raise ValueError("tiles spanning planes are not supported")
+        width, height = dims[:2]
+        self.tile_cols, self.tile_rows = tiles[:2]
+        self.ntx = (width + self.tile_cols - 1) // self.tile_cols
+        self.nty = (height + self.tile_rows - 1) // self.tile_rows
+
+        # Tiles are decompressed and cached in blocks of whole tiles.
+        # Tiles that are whole rows of the image (as made by fpack) are
+        # grouped into blocks of about the rows of a RegionReader block.
+        if self.ntx == 1:
+            self.band = max(1, RegionReader.default_block_rows //
+                            self.tile_rows)
+        else:
+            self.band = 1
+        self.block_rows = self.band * self.tile_rows
+        self.block_cols = self.tile_cols
+        self.nby = (height + self.block_rows - 1) // self.block_rows
+
+        # Index of the first tile of the chosen plane of a cube
+        if not naxispath:
+            naxispath = [0] * (znaxis - 2)
+        plane = 0
+        for idx, dim in zip(naxispath, reversed(dims[2:])):
+            plane = plane * dim + idx
+        self.tile0 = plane * self.ntx * self.nty
+
+        # Data type of the image, as decompressed by pyfits
+        bitpix = header['ZBITPIX']
+        bscale = header.get('BSCALE', 1)
+        bzero = header.get('BZERO', 0)
+        if bitpix < 0:
+            self.dtype = numpy.dtype('float%d' % (abs(bitpix)))
+        elif (bscale == 1) and (bzero == 0):
+            self.dtype = numpy.dtype(RegionReader.bitpix_dtypes[bitpix]).newbyteorder('=')
+        elif (bscale == 1) and (bitpix > 8) and (bzero == 2**(bitpix - 1)):
+            self.dtype = numpy.dtype('uint%d' % (bitpix))
+        elif bitpix in (8, 16):
+            self.dtype = numpy.dtype('float32')
+        else:
+            self.dtype = numpy.dtype('float64')
+
+        self.shape = (height, width)
+        self.ndim = 2
+        self.size = height * width
+        self.itemsize = self.dtype.itemsize
+        self.nbytes = self.size * self.itemsize
+
+        # Layout of the tile table
+        self.offset = offset
+        self.rowlen = header['NAXIS1']
+        self.heap = offset + header.get('THEAP',
+                                        self.rowlen * header['NAXIS2'])
+        self.columns = []
+        pos = 0
+        for i in xrange(header['TFIELDS']):
+            match = tform_re.match(header['TFORM%d' % (i+1)])
+            repeat, code = match.group(1), match.group(2)
+            if repeat == '':
+                repeat = 1
+            else:
+                repeat = int(repeat)
+            if code in ('P', 'Q'):
+                elsize = tform_sizes[match.group(3)]
+                self.columns.append((pos, code, elsize))
+                size = tform_sizes[code] * repeat
+            elif code == 'X':
+                size = (repeat + 7) // 8
+            else:
+                size = tform_sizes[code] * repeat
+            pos += size
+
+        # Header of the primary HDU of the FITS files made for pyfits
+        phdr = pyfits.Header([('SIMPLE', True), ('BITPIX', 8),
+                              ('NAXIS', 0), ('EXTEND', True)])
+        self.primary = phdr.tostring()
+
+        block_bytes = self.block_rows * self.block_cols * self.itemsize
+        self.cache_blocks = max(1, cache_bytes // block_bytes)
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.RLock()
+        self.filepath = filepath
+        self.in_f = open(filepath, 'rb')
+
+    def _read(self, pos, length):
+        with self.lock:
+            if self.in_f == None:
+                # reopened after close()
+                self.in_f = open(self.filepath, 'rb')
+            self.in_f.seek(pos)
+            return self.in_f.read(length)
+
+    def _make_hdu(self, by1, by2, bx1, bx2):
+        """Returns a FITS file (as a string) holding the tiles of blocks
+        in rows [by1:by2] and columns [bx1:bx2] of the block grid, which
+        must be consecutive in the tile table.
+        """
+        ty1, ty2 = by1 * self.band, min(by2 * self.band, self.nty)
+        tx1, tx2 = bx1, bx2
+        first = self.tile0 + ty1 * self.ntx + tx1
+        count = (ty2 - ty1 - 1) * self.ntx + (tx2 - tx1)
+        rows = numpy.fromstring(self._read(self.offset + first * self.rowlen,
+                                           count * self.rowlen),
+                                dtype='u1').reshape((count, self.rowlen))
+
+        # Find the span of the heap holding the compressed bytes of
+        # these tiles, and make the array descriptors relative to it
+        descs = []
+        lo, hi = None, 0
+        for pos, code, elsize in self.columns:
+            if code == 'P':
+                dtype, size = numpy.dtype('>i4'), 8
+            else:
+                dtype, size = numpy.dtype('>i8'), 16
+            desc = rows[:, pos:pos+size].copy().view(dtype).astype('int64')
+            used = desc[:, 0] > 0
+            if numpy.any(used):
+                start = desc[used, 1]
+                end = start + desc[used, 0] * elsize
+                if lo == None:
+                    lo = start.min()
+                lo, hi = min(start.min(), lo), max(end.max(), hi)
+            descs.append((pos, size, dtype, desc, used))
+        if lo == None:
+            lo = 0
+        heap = self._read(self.heap + lo, hi - lo)
+        for pos, size, dtype, desc, used in descs:
+            desc[used, 1] -= lo
+            desc[~used, 1] = 0
+            rows[:, pos:pos+size] = desc.astype(dtype).view('u1').reshape(
+                (count, size))
+
+        height, width = self.shape
+        hdr = self.header.copy()
+        hdr['NAXIS2'] = count
+        hdr['PCOUNT'] = len(heap)
+        for kwd in ('THEAP', 'CHECKSUM', 'DATASUM', 'ZHECKSUM', 'ZDATASUM'):
+            if kwd in hdr:
+                del hdr[kwd]
+        for i in xrange(3, hdr['ZNAXIS'] + 1):
+            for kwd in ('ZNAXIS%d' % i, 'ZTILE%d' % i):
+                if kwd in hdr:
+                    del hdr[kwd]
+        hdr['ZNAXIS'] = 2
+        hdr['ZNAXIS1'] = min(tx2 * self.tile_cols, width) - tx1 * self.tile_cols
+        hdr['ZNAXIS2'] = min(ty2 * self.tile_rows, height) - ty1 * self.tile_rows
+        hdr['ZTILE1'] = self.tile_cols
+        hdr['ZTILE2'] = self.tile_rows
+        # the dither of a tile is seeded by its row in the table
+        if 'ZDITHER0' in hdr:
+            hdr['ZDITHER0'] = hdr['ZDITHER0'] + first
+
+        return ''.join([self.primary, hdr.tostring(),
+                        _pad(rows.tostring() + heap, '\0')])
+
+    def _runs(self, bys, bx1, bx2):
+        """Divides the blocks in rows _bys_ and columns [bx1:bx2] of the
+        block grid into runs that are consecutive in the tile table,
+        about one per worker.  Returns a list of (by1, by2, bx1, bx2).
+        """
+        runs = []
+        if (bx1 == 0) and (bx2 == self.ntx):
+            # whole rows of blocks--consecutive rows make up a run
+            start = prev = bys[0]
+            for by in bys[1:]:
+                if by != prev + 1:
+                    runs.append((start, prev + 1))
+                    start = by
+                prev = by
+            runs.append((start, prev + 1))
+            nblocks = len(bys) * self.ntx
+            chunk = max(1, (nblocks + self.numworkers - 1) // self.numworkers)
+            chunk = (chunk + self.ntx - 1) // self.ntx
+            res = []
+            for by1, by2 in runs:
+                for by in xrange(by1, by2, chunk):
+                    res.append((by, min(by + chunk, by2), bx1, bx2))
+            return res
+
+        nblocks = len(bys) * (bx2 - bx1)
+        chunk = max(1, (nblocks + self.numworkers - 1) // self.numworkers)
+        for by in bys:
+            for bx in xrange(bx1, bx2, chunk):
+                runs.append((by, by + 1, bx, min(bx + chunk, bx2)))
+        return runs
+
+    def _get_blocks(self, bys, bx1, bx2):
+        """Returns a dict of the blocks in rows _bys_ and columns [bx1:bx2]
+        of the block grid, decompressing those not in the cache.
+        """
+        blocks = {}
+        missing = set()
+        with self.lock:
+            for by in bys:
+                for bx in xrange(bx1, bx2):
+                    key = (by, bx)
+                    try:
+                        block = self.cache.pop(key)
+                        self.cache[key] = block
+                        blocks[key] = block
+                        self.hits += 1
+                    except KeyError:
+                        missing.add(key)
+                        self.misses += 1
+        if len(missing) == 0:
+            return blocks
+
+        # decompress the rows of blocks that have any block missing
+        mbys = sorted(set([ by for by, bx in missing ]))
+        mbxs = [ bx for by, bx in missing ]
+        runs = self._runs(mbys, min(mbxs), max(mbxs) + 1)
+        bufs = map(lambda run: self._make_hdu(*run), runs)
+        pool = get_pool(min(self.numworkers, len(bufs)))
+        if pool == None:
+            results = map(decompress, bufs)
+        else:
+            results = pool.map(decompress, bufs)
+
+        br, bc = self.block_rows, self.block_cols
+        with self.lock:
+            for (by1, by2, rx1, rx2), data in zip(runs, results):
+                data = data.astype(self.dtype, copy=False)
+                for by in xrange(by1, by2):
+                    for bx in xrange(rx1, rx2):
+                        key = (by, bx)
+                        y, x = (by - by1) * br, (bx - rx1) * bc
+                        block = data[y:y+br, x:x+bc]
+                        blocks[key] = block
+                        self.cache[key] = block
+            while len(self.cache) > self.cache_blocks:
+                self.cache.popitem(last=False)
+        return blocks
+
+    def _read_rows(self, rows, x1, x2):
+        """Read columns [x1:x2] of the (increasing) _rows_."""
+        if len(rows) == 0 or x2 <= x1:
+            return numpy.zeros((len(rows), max(0, x2 - x1)), dtype=self.dtype)
+        data = numpy.empty((len(rows), x2 - x1), dtype=self.dtype)
+        br, bc = self.block_rows, self.block_cols
+        rows = numpy.asarray(rows)
+        byrows = rows // br
+        bys = list(numpy.unique(byrows))
+        bx1, bx2 = x1 // bc, (x2 - 1) // bc + 1
+        blocks = self._get_blocks(bys, bx1, bx2)
+
+        # rows are increasing, so those in each row of blocks are a slice
+        starts = numpy.searchsorted(byrows, bys, side='left')
+        stops = numpy.searchsorted(byrows, bys, side='right')
+        for by, i1, i2 in zip(bys, starts, stops):
+            sel = slice(i1, i2)
+            brows = rows[sel] - by * br
+            if brows[-1] - brows[0] + 1 == len(brows):
+                brows = slice(brows[0], brows[-1] + 1)
+            for bx in xrange(bx1, bx2):
+                block = blocks[(by, bx)]
+                b1, b2 = max(x1, bx * bc), min(x2, (bx + 1) * bc)
+                data[sel, b1-x1:b2-x1] = block[brows, b1-bx*bc:b2-bx*bc]
+        return data
+
+#END
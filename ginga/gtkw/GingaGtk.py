@@ -330,6 +330,7 @@ class GingaView(GtkMain.GtkMain):
         fi.add_callback('key-press', self.keypress)
         fi.add_callback('drag-drop', self.dragdrop)
         fi.add_callback('cut-set', self.change_range_cb, self.colorbar)
+        fi.add_callback('load-full', self.load_full_cb)
 
         # these are now set in the base class
         # cmap_name = settings.get('color_map', "ramp")
@@ -520,7 +521,7 @@ class GingaView(GtkMain.GtkMain):
         
     def gui_load_file(self, initialdir=None):
         #self.start_operation('FBrowser')
-        self.filesel.popup("Load FITS file", self.load_file,
+        self.filesel.popup("Load FITS file", self.load_file_async,
                            initialdir=initialdir)
         
     def statusMsg(self, format, *args):
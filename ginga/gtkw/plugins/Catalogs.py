@@ -9,10 +9,10 @@
 #
 from ginga.misc import Bunch, Future
 from ginga.gtkw import FitsImageCanvasTypesGtk as CanvasTypes
-from ginga.gtkw import ColorBar
+from ginga.gtkw import ColorBar, FileSelection
 from ginga import GingaPlugin
 from ginga import cmap, imap
-from ginga import wcs
+from ginga import wcs, Catalog
 
 import gobject
 import gtk
@@ -55,6 +55,7 @@ class Catalogs(GingaPlugin.LocalPlugin):
 
         self.catalog_server_options = []
         self.catalog_server_params = None
+        self.filesel = None
 
         self.tooltips = self.fv.w.tooltips
 
@@ -134,9 +135,13 @@ class Catalogs(GingaPlugin.LocalPlugin):
         captions = (('Server', 'xlabel'),
                     ('@Server', 'combobox'),
                     ('Limit stars to area', 'checkbutton'),
-                    ('Search', 'button'))
+                    ('Search', 'button'),
+                    ('Load Table', 'button'))
         w, self.w2 = GtkHelp.build_info(captions)
         self.w2.search.connect('clicked', lambda w: self.getcatalog_cb())
+        self.w2.load_table.connect('clicked', lambda w: self.loadtable_cb())
+        self.tooltips.set_tip(self.w2.load_table,
+                              "Load a catalog from a FITS table")
         self.w2.limit_stars_to_area.set_active(self.limit_stars_to_area)
         self.w2.limit_stars_to_area.connect('toggled', self.limit_area_cb)
 
@@ -361,6 +366,7 @@ class Catalogs(GingaPlugin.LocalPlugin):
             self.table.close()
         except:
             pass
+        self.close_table()
         self.fv.showStatus("")
         
     def redo(self):
@@ -548,16 +554,7 @@ class Catalogs(GingaPlugin.LocalPlugin):
         index = self.w2.server.get_active()
         server = self.catalog_server_options[index]
 
-        obj = None
-        if self.limit_stars_to_area:
-            # Look for the defining object to filter stars
-            # If none, then use the visible image area
-            try:
-                obj = self.canvas.getObjectByTag(self.areatag)
-            
-            except KeyError:
-                pass
-            
+        obj = self.get_filter_obj()
         self.reset()
         self.fitsimage.onscreen_message("Querying catalog db...",
                                         delay=1.0)
@@ -573,7 +570,57 @@ class Catalogs(GingaPlugin.LocalPlugin):
         # Update the GUI
         self.fv.gui_do(self.update_catalog, starlist, info)
         
+    def loadtable_cb(self):
+        if self.filesel == None:
+            self.filesel = FileSelection.FileSelection()
+        self.filesel.popup("Load FITS catalog table", self.loadtable_path)
+
+    def loadtable_path(self, filepath):
+        obj = self.get_filter_obj()
+        self.reset()
+        self.fitsimage.onscreen_message("Loading catalog table...",
+                                        delay=1.0)
+        self.fv.nongui_do(self.loadtable, filepath, obj)
+
+    def loadtable(self, filepath, obj):
+        starlist = None
+        try:
+            starlist, info = Catalog.load_table(filepath, logger=self.logger)
+            starlist = self.filter_results(starlist, obj)
+
+        except Exception, e:
+            if starlist != None:
+                starlist.close()
+            errmsg = "Failed to load catalog table '%s': %s" % (
+                filepath, str(e))
+            self.logger.error(errmsg)
+            self.fv.gui_do(self.fv.show_error, errmsg)
+            return
+
+        # Update the GUI
+        self.fv.gui_do(self.update_catalog, starlist, info)
+
+    def get_filter_obj(self):
+        obj = None
+        if self.limit_stars_to_area:
+            # Look for the defining object to filter stars
+            # If none, then use the visible image area
+            try:
+                obj = self.canvas.getObjectByTag(self.areatag)
+            
+            except KeyError:
+                pass
+        return obj
+
+    def close_table(self):
+        # release the file of a catalog loaded from a FITS table
+        if isinstance(self.starlist, Catalog.TableStarList):
+            self.starlist.close()
+        self.starlist = []
+
     def update_catalog(self, starlist, info):
+        # done with the table of any catalog shown before
+        self.close_table()
         self.starlist = starlist
         self.table.show_table(self, info, starlist)
 
@@ -587,7 +634,11 @@ class Catalogs(GingaPlugin.LocalPlugin):
         image = self.fitsimage.get_image()
 
         # Filter starts by a containing object, if provided
-        if filter_obj:
+        if filter_obj and isinstance(starlist, Catalog.TableStarList):
+            # converted all at once, rather than star by star
+            starlist = starlist.select_within(image, filter_obj)
+
+        elif filter_obj:
             stars = []
             for star in starlist:
                 x, y = image.radectopix(star['ra_deg'], star['dec_deg'])
@@ -608,6 +659,7 @@ class Catalogs(GingaPlugin.LocalPlugin):
         #self.clear()
         self.clearAll()
         self.table.clear()
+        self.close_table()
        
     def plot_star(self, obj, image=None):
         if not image:
@@ -692,6 +744,9 @@ class CatalogListing(object):
 
         self.mag_max = 25.0
         self.mag_min = 0.0
+        # Most stars shown in the table (all are plotted, a subset at
+        # a time)
+        self.max_listing = 5000
 
         # keys: are name, ra, dec, mag, flag, b_r, preference, priority, dst
         # TODO: automate this generation
@@ -819,9 +874,9 @@ class CatalogListing(object):
 
         # Update the starlist info
         listmodel = gtk.ListStore(object)
-        for star in starlist:
+        for i in xrange(min(len(starlist), self.max_listing)):
             # TODO: find mag range
-            listmodel.append([star])
+            listmodel.append([starlist[i]])
 
         self.treeview.set_model(listmodel)
 
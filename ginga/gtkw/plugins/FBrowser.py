@@ -11,10 +11,9 @@ import os, glob
 import stat, time
 
 from ginga.misc import Bunch
-from ginga import GingaPlugin
+from ginga import GingaPlugin, AstroImage
 
 import gtk
-import pyfits
 
 #icon_ext = '.svg'
 icon_ext = '.png'
@@ -187,7 +186,7 @@ class FBrowser(GingaPlugin.LocalPlugin):
             self.browse(path)
 
         elif os.path.exists(path):
-            self.fv.load_file(path)
+            self.fv.load_file_async(path)
 
         else:
             self.browse(path)
@@ -247,21 +246,20 @@ class FBrowser(GingaPlugin.LocalPlugin):
         self.treeview.set_fixed_height_mode(True)
             
     def scan_fits(self):
+        # Read just the primary headers of the files not yet scanned,
+        # several at a time
+        paths = [ bnch.path for bnch in self.jumpinfo
+                  if (bnch.type == 'fits') and not bnch.has_key('kwds') ]
+        headers = AstroImage.scan_headers(paths, numhdu=0,
+                                          logger=self.logger)
         for bnch in self.jumpinfo:
-            if not bnch.type == 'fits':
+            header = headers.get(bnch.path, None)
+            if header == None:
                 continue
-            if not bnch.has_key('kwds'):
-                try:
-                    in_f = pyfits.open(bnch.path, 'readonly')
-                    try:
-                        kwds = {}
-                        for kwd in self.keywords:
-                            kwds[kwd] = in_f[0].header.get(kwd, 'N/A')
-                        bnch.kwds = kwds
-                    finally:
-                        in_f.close()
-                except Exception, e:
-                    continue
+            kwds = {}
+            for kwd in self.keywords:
+                kwds[kwd] = header.get(kwd, 'N/A')
+            bnch.kwds = kwds
 
     def refresh(self):
         self.browse(self.curpath)
@@ -12,7 +12,7 @@ import gtk
 import pango
 
 from ginga.gtkw import FitsImageCanvasTypesGtk as CanvasTypes
-from ginga import GingaPlugin
+from ginga import GingaPlugin, IntegralHistogram
 from ginga.gtkw import GtkHelp
 from ginga.gtkw import Plot
 
@@ -37,6 +37,13 @@ class Histogram(GingaPlugin.LocalPlugin):
         canvas.setSurface(self.fitsimage)
         self.canvas = canvas
 
+        prefs = self.fv.get_preferences()
+        self.settings = prefs.createCategory('plugin_Histogram')
+        self.settings.load()
+        # With an integral histogram the region histogram is cheap enough
+        # to be updated continuously as the region is dragged
+        self.settings.setDefaults(use_integral_histogram=False)
+
         self.w.tooltips = self.fv.w.tooltips
         self.gui_up = False
 
@@ -133,6 +140,7 @@ class Histogram(GingaPlugin.LocalPlugin):
             self.fitsimage.add(self.canvas, tag=self.layertag)
 
         #self.canvas.deleteAllObjects()
+        self.build_integral_histogram()
         self.resume()
 
     def pause(self):
@@ -172,17 +180,34 @@ class Histogram(GingaPlugin.LocalPlugin):
                                                linestyle='dash'))
         self.draw_cb(canvas, tag)
         
-    def redo(self):
+    def build_integral_histogram(self):
+        if not self.settings.get('use_integral_histogram', False):
+            return
+        image = self.fitsimage.get_image()
+        if (image == None) or (len(image.get_data().shape) != 2):
+            return
+        # takes a while for a large image; until it is ready the plot
+        # is only updated when the region is released
+        self.fv.nongui_do(image.get_integral_histogram)
+
+    def redo(self, use_integral=False):
         obj = self.canvas.getObjectByTag(self.histtag)
-        if obj.kind != 'compound':
+        if obj.kind == 'compound':
+            bbox = obj.objects[0]
+        elif obj.kind == 'rectangle':
+            # region is being dragged
+            bbox = obj
+        else:
             return True
-        bbox = obj.objects[0]
         
         # Do histogram on the points within the rect
         image = self.fitsimage.get_image()
+        if use_integral:
+            numbins = IntegralHistogram.default_inthist_bins
+        else:
+            numbins = 2048
         self.plot.clear()
 
-        numbins = 2048
         ## pct = 1.0
         ## i = int(numbins * (1.0 - pct))
         ## j = int(numbins * pct)
@@ -191,7 +216,8 @@ class Histogram(GingaPlugin.LocalPlugin):
         if depth != 3:
             res = image.histogram(int(bbox.x1), int(bbox.y1),
                                   int(bbox.x2), int(bbox.y2),
-                                  pct=1.0, numbins=numbins)
+                                  pct=1.0, numbins=numbins,
+                                  use_integral=use_integral)
             y, x = res.dist, res.bins
             x = x[:-1]
             ## y, x = y[i:j+1], x[i:j+1]
@@ -303,6 +329,12 @@ class Histogram(GingaPlugin.LocalPlugin):
             bbox.x1, bbox.y1, bbox.x2, bbox.y2 = x1, y1, x2, y2
             canvas.redraw(whence=3)
 
+        if self.settings.get('use_integral_histogram', False):
+            # continuous updates only once the table is built
+            image = self.fitsimage.get_image()
+            if image.get_integral_histogram(build=False) != None:
+                self.redo(use_integral=True)
+
     
     def draw_cb(self, canvas, tag):
         obj = canvas.getObjectByTag(tag)
@@ -10,12 +10,12 @@
 import pyfits
 import gtk
 import pango
+import gobject
 from ginga.gtkw import GtkHelp
 
-from ginga.AstroImage import AstroImage
 
 from ginga.gtkw import GtkHelp
-from ginga import GingaPlugin
+from ginga import GingaPlugin, CubeStats, SliceCache, CubePlayer
 
 class MultiDim(GingaPlugin.LocalPlugin):
 
@@ -25,6 +25,31 @@ class MultiDim(GingaPlugin.LocalPlugin):
 
         self.curhdu = 0
         self.naxispath = []
+        self.fits_f = None
+
+        prefs = self.fv.get_preferences()
+        self.settings = prefs.createCategory('plugin_MultiDim')
+        self.settings.load()
+        self.settings.setDefaults(global_cube_cuts=True,
+                                  cache_bytes=SliceCache.default_cache_bytes,
+                                  prefetch_slices=SliceCache.default_prefetch_slices,
+                                  playback_fps=CubePlayer.default_fps,
+                                  playback_buffer=CubePlayer.default_ring_slices)
+
+        # images of the HDUs and cube slices of the file
+        self.slice_cache = None
+
+        # for cut levels calculated over the whole cube
+        self.cubestats = None
+        self.cube_stats_cache = {}
+        self._save_autocuts = None
+
+        # for playing back a cube along one of its axes
+        self.player = None
+        self.play_image = None
+        self.play_axis = None
+        self.play_index = None
+        self.playtask = None
 
     def build_gui(self, container):
         vbox1 = gtk.VBox()
@@ -69,6 +94,26 @@ class MultiDim(GingaPlugin.LocalPlugin):
         self.naxisfr = fr
         vbox1.pack_start(fr, padding=4, fill=True, expand=False)
 
+        fr = gtk.Frame("Playback")
+        fr.set_shadow_type(gtk.SHADOW_ETCHED_IN)
+        fr.set_label_align(0.5, 0.5)
+
+        captions = [("Frame rate", 'entry'),
+                    ("Play", 'button', "Stop", 'button'),
+                    ("Achieved", 'label')]
+        w, b = GtkHelp.build_info(captions)
+        self.w.update(b)
+        self.w.tooltips = self.fv.w.tooltips
+        b.frame_rate.set_text(str(self.settings.get('playback_fps')))
+        self.w.tooltips.set_tip(b.frame_rate, "Target frames per second")
+        self.w.tooltips.set_tip(b.play,
+                                "Play back the cube along the last axis stepped")
+        b.play.connect('clicked', lambda w: self.play_start())
+        b.stop.connect('clicked', lambda w: self.play_stop())
+
+        fr.add(w)
+        vbox1.pack_start(fr, padding=4, fill=True, expand=False)
+
         btns = gtk.HButtonBox()
         btns.set_layout(gtk.BUTTONBOX_START)
         btns.set_spacing(3)
@@ -116,6 +161,7 @@ class MultiDim(GingaPlugin.LocalPlugin):
         captions = [("NAXIS1", 'label'), ("NAXIS2", 'label')]
 
         self.naxispath = []
+        self.play_axis = None
         for n in xrange(2, len(dims)):
             self.naxispath.append(0)
             key = 'naxis%d' % (n+1)
@@ -125,6 +171,8 @@ class MultiDim(GingaPlugin.LocalPlugin):
             if maxn <= 1:
                 captions.append((title, 'label'))
             else:
+                if self.play_axis == None:
+                    self.play_axis = len(dims) - (n+1)
                 captions.append((title, 'label',
                                  "Choose %s" % (title), 'spinbutton'))
 
@@ -147,6 +195,7 @@ class MultiDim(GingaPlugin.LocalPlugin):
                 slider.set_snap_to_ticks(True)
                 slider.connect('value-changed', self.set_naxis_cb, n)
                 slider.set_update_policy(gtk.UPDATE_DISCONTINUOUS)
+        self.w.naxis = b
 
         # Add vbox of naxis controls to gui
         try:
@@ -178,25 +227,104 @@ class MultiDim(GingaPlugin.LocalPlugin):
         self.redo()
         
     def stop(self):
-        try:
-            self.fits_f.close()
-        except:
-            pass
+        self.play_stop(restore=False)
+        self.stop_cube_stats()
+        self.restore_autocuts()
+        self.close_file()
         self.fv.showStatus("")
+
+    def close_file(self):
+        # the prefetches of the slice cache read the file, so they must
+        # be finished before it is closed
+        if self.slice_cache != None:
+            self.slice_cache.close()
+            self.slice_cache = None
+        if self.fits_f != None:
+            try:
+                self.fits_f.close()
+            except Exception, e:
+                self.logger.warn("Error closing %s: %s" % (
+                    self.path, str(e)))
+            self.fits_f = None
+
+    def start_cube_stats(self, idx):
+        """Start calculating cut levels over all planes of HDU _idx_."""
+        self.stop_cube_stats()
+        if not self.settings.get('global_cube_cuts', True):
+            return
+        key = (self.path, idx)
+        if self.cube_stats_cache.has_key(key):
+            self.apply_cube_stats(self.cube_stats_cache[key])
+            return
+
+        t_ = self.fitsimage.get_settings()
+        cubestats = CubeStats.CubeStats(self.path, idx, logger=self.logger,
+                                        numbins=t_['autocut_bins'],
+                                        pct=t_['autocut_hist_pct'])
+        cubestats.add_callback('progress', self._cube_stats_progress_cb)
+        cubestats.add_callback('done', self._cube_stats_done_cb)
+        self.cubestats = cubestats
+        self.fv.nongui_do(cubestats.calc)
+
+    def stop_cube_stats(self):
+        if self.cubestats != None:
+            self.cubestats.stop()
+            self.cubestats = None
+
+    def _cube_stats_progress_cb(self, cubestats, res):
+        # called from a non-gui thread
+        self.fv.gui_do(self.fv.showStatus,
+                       "Calculating cube cut levels: %d%%" % (
+            int(res.fraction * 100)))
+
+    def _cube_stats_done_cb(self, cubestats, res):
+        # called from a non-gui thread
+        self.fv.gui_do(self._cube_stats_done, cubestats, res)
+
+    def _cube_stats_done(self, cubestats, res):
+        self.cube_stats_cache[(res.path, res.numhdu)] = res
+        if cubestats is not self.cubestats:
+            # stopped after the result was queued (e.g. the plugin was
+            # closed, which has already restored the autocuts)
+            return
+        self.apply_cube_stats(res)
+
+    def apply_cube_stats(self, res):
+        self.cube_stats_cache[(res.path, res.numhdu)] = res
+        if (res.path != self.path) or (res.numhdu != self.curhdu):
+            # user has moved on to another HDU
+            return
+
+        # These levels hold for every plane of the cube, so turn off
+        # the autocuts that would otherwise be done for each plane
+        if self._save_autocuts == None:
+            t_ = self.fitsimage.get_settings()
+            self._save_autocuts = t_['autocuts']
+            self.fitsimage.enable_autocuts('off')
+        self.fitsimage.cut_levels(res.loval, res.hival, no_reset=True)
+        self.fv.showStatus("Cube cut levels: %.4g to %.4g" % (
+            res.loval, res.hival))
+
+    def restore_autocuts(self):
+        if self._save_autocuts != None:
+            self.fitsimage.enable_autocuts(self._save_autocuts)
+            self._save_autocuts = None
         
     def set_hdu(self, idx):
         self.logger.debug("Loading fits hdu #%d" % (idx))
-        image = AstroImage()
-        image.set(path=self.path)
+        self.play_stop(restore=False)
         try:
-            hdu = self.fits_f[idx-1]
-            dims = list(hdu.data.shape)
-            dims.reverse()
-            image.load_hdu(hdu)
+            dims = self.slice_cache.get_dims(idx-1)
+            image = self.slice_cache.get(idx-1)
 
+            self.restore_autocuts()
             self.fitsimage.set_image(image)
             self.build_naxis(dims)
             self.curhdu = idx-1
+            if len(dims) > 2:
+                self.start_cube_stats(idx-1)
+            else:
+                self.stop_cube_stats()
             self.logger.debug("hdu #%d loaded." % (idx))
         except Exception, e:
             errmsg = "Error loading fits hdu #%d: %s" % (
@@ -206,25 +334,31 @@ class MultiDim(GingaPlugin.LocalPlugin):
 
     def set_naxis_cb(self, w, n):
         idx = int(w.get_value()) - 1
+        self.play_stop(restore=False)
         self.logger.debug("naxis %d index is %d" % (n+1, idx+1))
 
-        image = AstroImage()
-        image.set(path=self.path)
         try:
-            hdu = self.fits_f[self.curhdu]
-            data = hdu.data
+            dims = self.slice_cache.get_dims(self.curhdu)
             self.logger.debug("HDU #%d has naxis=%s" % (
-                self.curhdu+1, str(data.shape)))
+                self.curhdu+1, str(dims)))
 
             # invert index
-            m = len(data.shape) - (n+1)
+            m = len(dims) - (n+1)
+            step = self.get_step(self.naxispath[m], idx, dims[n])
             self.naxispath[m] = idx
+            self.play_axis = m
             self.logger.debug("m=%d naxispath=%s" % (m, str(self.naxispath)))
         
-            image.load_hdu(hdu, naxispath=self.naxispath)
+            image = self.slice_cache.get(self.curhdu, self.naxispath)
 
             self.fitsimage.set_image(image)
             self.logger.debug("NAXIS%d slice %d loaded." % (n+1, idx+1))
+
+            # get the next slices ready in case the user keeps going
+            self.fv.nongui_do(self.slice_cache.prefetch, self.curhdu,
+                              list(self.naxispath), m, step=step,
+                              count=self.settings.get('prefetch_slices'),
+                              prepare=self.prepare_slice)
         except Exception, e:
             errmsg = "Error loading NAXIS%d slice %d: %s" % (
                 n+1, idx+1, str(e))
@@ -232,14 +366,133 @@ class MultiDim(GingaPlugin.LocalPlugin):
             self.fv.error(errmsg)
 
         
+    def get_step(self, oldidx, idx, dim):
+        """Returns the direction (1 or -1) of a step along an axis of
+        length _dim_ from _oldidx_ to _idx_, allowing for wrap-around.
+        """
+        if (oldidx == dim - 1) and (idx == 0):
+            return 1
+        if (oldidx == 0) and (idx == dim - 1):
+            return -1
+        if idx < oldidx:
+            return -1
+        return 1
+
+    def prepare_slice(self, image):
+        # called on a non-gui thread for each prefetched slice; the cut
+        # levels are cached on the image for when it is shown
+        t_ = self.fitsimage.get_settings()
+        if t_['autocuts'] != 'off':
+            self.fitsimage.autocuts.calc_cut_levels(
+                image, method=t_['autocut_method'],
+                pct=t_['autocut_hist_pct'], numbins=t_['autocut_bins'])
+
+    def play_start(self):
+        """Play back the current HDU along the last axis stepped."""
+        self.play_stop()
+        if self.play_axis == None:
+            self.fv.showStatus("No axis to play back")
+            return
+        try:
+            fps = float(self.w.frame_rate.get_text())
+            if fps <= 0.0:
+                raise ValueError("frame rate must be positive")
+        except ValueError, e:
+            self.fv.error("Bad frame rate: %s" % (str(e)))
+            return
+
+        hdu = self.fits_f[self.curhdu]
+        player = CubePlayer.CubePlayer(hdu.data, self.naxispath,
+                                       self.play_axis, fps=fps,
+                                       bufsize=self.settings.get('playback_buffer'),
+                                       header=hdu.header,
+                                       logger=self.logger)
+        player.add_callback('fps', self._play_fps_cb)
+        self.player = player
+        self.play_index = self.naxispath[self.play_axis]
+
+        # frames are shown by replacing the data of a copy of the current
+        # image, so the header, WCS and cut levels carry over
+        image = self.fitsimage.get_image()
+        play_image = image.copy()
+        play_image.wcs = image.wcs
+        play_image.cutcache.update(image.cutcache)
+        self.play_image = play_image
+        self.fitsimage.set_image(play_image)
+
+        self.fv.nongui_do(player.produce)
+        # poll at twice the frame rate, so frames are shown close to time
+        self.playtask = gobject.timeout_add(max(5, int(500.0 / fps)),
+                                            self.play_tick)
+
+    def play_stop(self, restore=True):
+        if self.player == None:
+            return
+        if self.playtask != None:
+            gobject.source_remove(self.playtask)
+            self.playtask = None
+        # (the producer reads the file, which may be closed next)
+        self.player.stop(wait=True)
+        stats = self.player.get_stats()
+        self.logger.info("playback: %d frames shown, %d dropped" % (
+            stats.shown, stats.dropped))
+        self.player = None
+        self.play_image = None
+        if not restore:
+            return
+
+        # go back to normal viewing at the last slice shown
+        m = self.play_axis
+        dims = self.slice_cache.get_dims(self.curhdu)
+        n = len(dims) - (m+1)
+        slider = self.w.naxis['choose_naxis%d' % (n+1)]
+        if int(slider.get_value()) != self.play_index + 1:
+            # callback loads the slice
+            slider.set_value(self.play_index + 1)
+        else:
+            self.set_naxis_cb(slider, n)
+
+    def play_tick(self):
+        player = self.player
+        if player == None:
+            return False
+        if player.is_stopped():
+            # producer died
+            self.playtask = None
+            self.play_stop()
+            return False
+        frame = player.get_frame()
+        if frame != None:
+            self.play_index = frame.index
+            self.play_image.set_data(frame.data)
+        return True
+
+    def _play_fps_cb(self, player, fps):
+        stats = player.get_stats()
+        self.w.achieved.set_text("%.1f fps (%d dropped)" % (
+            fps, stats.dropped))
+        self.fv.showStatus("Playing NAXIS%d slice %d" % (
+            len(player.data.shape) - player.m, self.play_index + 1))
+
     def redo(self):
         image = self.fitsimage.get_image()
         md = image.get_metadata()
         path = md.get('path', 'NO PATH')
         #print "path=%s metadata: %s" % (path, str(md))
 
+        # done with any file opened before
+        self.play_stop(restore=False)
+        self.close_file()
+
         self.path = path
-        self.fits_f = pyfits.open(path, 'readonly')
+        # (pyfits cannot memory-map scaled data, so it is left unscaled
+        # and each slice scaled as it is made)
+        self.fits_f = pyfits.open(path, 'readonly', memmap=True,
+                                  do_not_scale_image_data=True)
+        self.slice_cache = SliceCache.SliceCache(
+            self.fits_f, path, maxbytes=self.settings.get('cache_bytes'),
+            logger=self.logger)
+        self.cube_stats_cache = {}
 
         lower = 1
         upper = len(self.fits_f)
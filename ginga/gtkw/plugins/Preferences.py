@@ -329,7 +329,7 @@ class Preferences(GingaPlugin.LocalPlugin):
         b.hist_pct.set_digits(5)
         b.hist_pct.set_numeric(True)
         b.hist_pct.sconnect('value-changed', lambda w: self.set_autocut_params())
-        b.hist_pct.set_sensitive(method == 'histogram')
+        b.hist_pct.set_sensitive(method in ('histogram', 'percentile'))
         self.w.tooltips.set_tip(b.hist_pct,
                                 "Percentage of image to save for Histogram algorithm")
 
@@ -595,7 +595,7 @@ class Preferences(GingaPlugin.LocalPlugin):
         index = self.autocut_methods.index(method)
         self.w.auto_method.set_active(index)
         self.w.hist_pct.set_value(pct)
-        if method != 'histogram':
+        if method not in ('histogram', 'percentile'):
             self.w.hist_pct.set_sensitive(False)
         else:
             self.w.hist_pct.set_sensitive(True)
@@ -611,7 +611,7 @@ class Preferences(GingaPlugin.LocalPlugin):
         pct = self.w.hist_pct.get_value()
         idx = self.w.auto_method.get_active()
         method = self.autocut_methods[idx]
-        self.w.hist_pct.set_sensitive(method == 'histogram')
+        self.w.hist_pct.set_sensitive(method in ('histogram', 'percentile'))
         self.fitsimage.set_autocut_params(method, pct=pct)
         self.t_.set(autocut_method=method, autocut_hist_pct=pct)
         
@@ -8,11 +8,12 @@
 # Please see the file LICENSE.txt for details.
 #
 from ginga.gtkw import FitsImageGtk as FitsImageGtk
-from ginga import GingaPlugin
+from ginga import GingaPlugin, ThumbGen, ThumbStore
 
 import os
 import time
 import hashlib
+import numpy
 import gtk
 import gobject
 
@@ -40,6 +41,9 @@ class Thumbs(GingaPlugin.GlobalPlugin):
         self.settings = prefs.createCategory('plugin_Thumbs')
         self.settings.load()
 
+        # packed stores of saved thumbnails, by source directory
+        self.thumbstores = {}
+
         self.thmbtask = None
         self.lagtime = 4000
 
@@ -111,10 +115,23 @@ class Thumbs(GingaPlugin.GlobalPlugin):
         for kwd in self.keywords:
             metadata[kwd] = header.get(kwd, 'N/A')
 
-        #self.thumb_generator.set_data(data)
-        self.thumb_generator.set_image(image)
-        self.copy_attrs(chinfo.fitsimage)
-        imgwin = self.thumb_generator.get_image_as_widget()
+        # Use the thumbnail made when the image was ingested, if it was
+        # made with the current view settings
+        thumb = None
+        res = image.ingest
+        if (res != None) and (res.thumb is not None):
+            params = ThumbGen.get_view_params(chinfo.fitsimage,
+                                              width=self.thumbWidth)
+            if res.thumb_params == params:
+                thumb = res.thumb
+
+        if thumb is not None:
+            imgwin = self._get_thumb_widget(thumb)
+        else:
+            #self.thumb_generator.set_data(data)
+            self.thumb_generator.set_image(image)
+            self.copy_attrs(chinfo.fitsimage)
+            imgwin = self.thumb_generator.get_image_as_widget()
 
         imgwin.set_property("has-tooltip", True)
         imgwin.connect("query-tooltip", self._mktt(thumbkey, name, metadata))
@@ -329,10 +346,16 @@ class Thumbs(GingaPlugin.GlobalPlugin):
 
         # Save a thumbnail for future browsing
         if save_thumb:
-            thumbpath = self.get_thumbpath(path)
-            if thumbpath != None:
-                self.thumb_generator.save_image_as_file(thumbpath,
-                                                        format='jpeg')
+            dirpath, filename = os.path.split(path)
+            store = self.get_thumbstore(dirpath)
+            if store != None:
+                rgbobj = self.thumb_generator.get_rgb_object()
+                rgb = numpy.dstack((rgbobj.r, rgbobj.g, rgbobj.b))
+                params = ThumbGen.get_view_params(fitsimage,
+                                                  width=self.thumbWidth)
+                store.add([(filename, rgb, metadata)],
+                          ThumbStore.get_params_key(params))
+                store.save()
 
         imgwin = self.thumb_generator.get_image_as_widget()
 
@@ -361,28 +384,36 @@ class Thumbs(GingaPlugin.GlobalPlugin):
         self.thumbList = newThumbList
         self.reorder_thumbs()
 
-    def _make_thumb(self, chname, image, path, thumbkey,
-                    save_thumb=False, thumbpath=None):
-        # This is called by the make_thumbs() as a gui thread
-        self.thumb_generator.set_image(image)
-        # Save a thumbnail for future browsing
-        if save_thumb and (thumbpath != None):
-            self.thumb_generator.save_image_as_file(thumbpath,
-                                                    format='jpeg')
-        
-        imgwin = self.thumb_generator.get_image_as_widget()
-
-        # Get metadata for mouse-over tooltip
-        image = self.thumb_generator.get_image()
-        header = image.get_header()
-        metadata = {}
-        for kwd in self.keywords:
-            metadata[kwd] = header.get(kwd, 'N/A')
-
+    def _get_thumb_widget(self, rgb):
+        try:
+            pixbuf = gtk.gdk.pixbuf_new_from_array(rgb, gtk.gdk.COLORSPACE_RGB,
+                                                   8)
+        except Exception, e:
+            # pygtk might have been compiled without numpy support
+            daht, dawd, depth = rgb.shape
+            rgb_buf = self.thumb_generator._get_rgbbuf(rgb)
+            pixbuf = gtk.gdk.pixbuf_new_from_data(rgb_buf, gtk.gdk.COLORSPACE_RGB,
+                                                  False, 8, dawd, daht, dawd*3)
+        image = gtk.Image()
+        image.set_from_pixbuf(pixbuf)
+        image.show()
+        return image
+
+    def _make_thumb(self, chname, res):
+        # This is called by make_thumbs() as a gui thread
+        if res.rgb is None:
+            # TODO: generate "broken thumb"?
+            return
+        path = res.path
+        thumbkey = (chname.lower(), path)
+        if self.thumbDict.has_key(thumbkey):
+            return
         dirname, name = os.path.split(path)
 
+        imgwin = self._get_thumb_widget(res.rgb)
         imgwin.set_property("has-tooltip", True)
-        imgwin.connect("query-tooltip", self._mktt(thumbkey, name, metadata))
+        imgwin.connect("query-tooltip", self._mktt(thumbkey, name,
+                                                   res.metadata))
 
         thumbname = name
         if '.' in thumbname:
@@ -390,55 +421,82 @@ class Thumbs(GingaPlugin.GlobalPlugin):
 
         self.insert_thumbnail(imgwin, thumbkey, thumbname,
                               chname, name, path)
-        self.fv.update_pending(timeout=0.001)
-        
+
+    def _make_thumbs(self, chname, reslist):
+        # This is called by make_thumbs() as a gui thread
+        for res in reslist:
+            self._make_thumb(chname, res)
+
     def make_thumbs(self, chname, filelist):
         # This is called by the FBrowser plugin, as a non-gui thread!
         lcname = chname.lower()
 
         cacheThumbs = self.settings.get('cacheThumbs', False)
 
-        for path in filelist:
-            self.logger.info("generating thumb for %s..." % (
-                path))
+        chinfo = self.fv.get_channelInfo(chname)
+        params = ThumbGen.get_view_params(chinfo.fitsimage,
+                                          width=self.thumbWidth)
+        paramskey = ThumbStore.get_params_key(params)
 
-            # Do we already have this thumb loaded?
+        # Sort out the files we don't already have thumbs loaded for
+        # by directory
+        dirs = {}
+        for path in filelist:
             path = os.path.abspath(path)
             thumbkey = (lcname, path)
             if self.thumbDict.has_key(thumbkey):
                 continue
-
-            # Is there a cached thumbnail image on disk we can use?
-            save_thumb = cacheThumbs
-            image = None
-            thumbpath = self.get_thumbpath(path)
-            if (thumbpath != None) and os.path.exists(thumbpath):
-                save_thumb = False
-                try:
-                    image = self.fv.load_image(thumbpath)
-                except Exception, e:
-                    pass
-
-            try:
-                if image == None:
-                    image = self.fv.load_image(path)
-                self.fv.gui_do(self._make_thumb, chname, image, path,
-                               thumbkey, save_thumb=save_thumb,
-                               thumbpath=thumbpath)
-                
-            except Exception, e:
-                self.logger.error("Error generating thumbnail for '%s': %s" % (
-                    path, str(e)))
-                continue
-                # TODO: generate "broken thumb"?
-
+            dirpath, name = os.path.split(path)
+            dirs.setdefault(dirpath, []).append(name)
+
+        # Look up the saved thumbs of each directory in one go
+        stores = {}
+        found = []
+        paths = []
+        for dirpath, names in dirs.items():
+            store = self.get_thumbstore(dirpath, makedir=cacheThumbs)
+            thumbs = {}
+            if store != None:
+                stores[dirpath] = store
+                thumbs = store.lookup(names, paramskey)
+            for name in names:
+                path = os.path.join(dirpath, name)
+                if thumbs.has_key(name):
+                    rgb, metadata = thumbs[name]
+                    found.append(Bunch.Bunch(path=path, rgb=rgb,
+                                             metadata=metadata, errmsg=None))
+                else:
+                    paths.append(path)
+        if len(found) > 0:
+            self.logger.info("loaded %d saved thumbs" % (len(found)))
+            self.fv.gui_do(self._make_thumbs, chname, found)
+
+        # The rest are loaded and rendered, with the view settings of the
+        # channel, in worker processes; only the finished thumbnails come
+        # back here, to be added in the gui thread
+        def thumb_cb(res):
+            dirpath, name = os.path.split(res.path)
+            if cacheThumbs and (res.rgb is not None) and stores.has_key(dirpath):
+                stores[dirpath].add([(name, res.rgb, res.metadata)],
+                                    paramskey)
+            self.fv.gui_do(self._make_thumb, chname, res)
+
+        if len(paths) > 0:
+            self.logger.info("generating %d thumbs..." % (len(paths)))
+            numworkers = self.settings.get('thumbWorkers',
+                                           ThumbGen.default_thumb_workers)
+            thumbgen = ThumbGen.ThumbGenerator(numworkers=numworkers,
+                                               logger=self.logger)
+            thumbgen.generate(paths, params, thumb_cb,
+                              keywords=self.keywords)
+
+        for store in stores.values():
+            store.save()
 
     def _gethex(self, s):
         return hashlib.sha1(s).hexdigest()
     
-    def get_thumbpath(self, path, makedir=True):
-        path = os.path.abspath(path)
-        dirpath, filename = os.path.split(path)
+    def get_thumbdir(self, dirpath, makedir=True):
         # Get thumb directory
         cacheLocation = self.settings.get('cacheLocation', 'local')
         if cacheLocation == 'ginga':
@@ -452,12 +510,12 @@ class Thumbs(GingaPlugin.GlobalPlugin):
 
         if not os.path.exists(thumbdir):
             if not makedir:
-                self.logger.error("Thumb directory does not exist: %s" % (
+                self.logger.debug("Thumb directory does not exist: %s" % (
                     thumbdir))
                 return None
             
             try:
-                os.mkdir(thumbdir)
+                os.makedirs(thumbdir)
                 # Write meta file
                 metafile = os.path.join(thumbdir, "meta")
                 with open(metafile, 'w') as out_f:
@@ -467,13 +525,22 @@ class Thumbs(GingaPlugin.GlobalPlugin):
                 self.logger.error("Could not make thumb directory '%s': %s" % (
                     thumbdir, str(e)))
                 return None
-
-        # Get location of thumb
-        modtime = os.stat(path).st_mtime
-        thumbkey = self._gethex("%s.%s" % (filename, modtime))
-        thumbpath = os.path.join(thumbdir, thumbkey + ".jpg")
-        self.logger.debug("thumb path is '%s'" % (thumbpath))
-        return thumbpath
+        return thumbdir
+
+    def get_thumbstore(self, dirpath, makedir=True):
+        """Returns the store of saved thumbs of directory _dirpath_, or
+        None if there is none (and _makedir_ is False or it can't be made).
+        """
+        dirpath = os.path.abspath(dirpath)
+        thumbdir = self.get_thumbdir(dirpath, makedir=makedir)
+        if thumbdir == None:
+            return None
+        store = self.thumbstores.get(thumbdir, None)
+        if store == None:
+            store = ThumbStore.ThumbStore(dirpath, thumbdir,
+                                          logger=self.logger)
+            self.thumbstores[thumbdir] = store
+        return store
                                  
     def __str__(self):
         return 'thumbs'
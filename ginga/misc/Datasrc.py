@@ -7,27 +7,58 @@
 #
 import threading
 
+import Callback
+import Bunch
+
 class TimeoutError(Exception):
     pass
 
-class Datasrc(object):
+class Datasrc(Callback.Callbacks):
+    """Keyed buffer of at most _length_ datums.  If _maxbytes_ is given
+    the datums are also limited to that total size, as measured by
+    _sizefn_ (a function of a datum that returns its size in bytes).
+
+    When over either limit, the least recently used datums--setting or
+    getting a datum counts as use--are ejected (though never the last
+    one), and an 'evicted' callback is made with the key and value of
+    each.  The callback is also made for a datum replaced by another
+    value under the same key.
+    """
+
+    def __init__(self, length=20, maxbytes=None, sizefn=None):
+        Callback.Callbacks.__init__(self)
 
-    def __init__(self, length=20):
         self.length = length
+        self.maxbytes = maxbytes
+        self.sizefn = sizefn
         self.cursor = -1
         self.datums = {}
         self.history = []
         self.sortedkeys = []
+        # keys in order of use, least recent first, and sizes of datums
+        self.lru = []
+        self.sizes = {}
+        self.totalbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
         self.cond = threading.Condition()
         self.newdata = threading.Event()
 
+        self.enable_callback('evicted')
 
     def __getitem__(self, key):
         with self.cond:
             if isinstance(key, int):
-                return self.datums[self.sortedkeys[key]]
-            else:
-                return self.datums[key]
+                key = self.sortedkeys[key]
+            try:
+                value = self.datums[key]
+            except KeyError:
+                self.misses += 1
+                raise
+            self.hits += 1
+            self._touch(key)
+            return value
 
         
     def __setitem__(self, key, value):
@@ -37,7 +68,18 @@ class Datasrc(object):
 
             self.history.append(key)
 
+            replaced = self.datums.get(key, value)
             self.datums[key] = value
+            self._touch(key)
+            if self.sizefn != None:
+                size = self.sizefn(value)
+            else:
+                size = 0
+            self.totalbytes += size - self.sizes.get(key, 0)
+            self.sizes[key] = size
+            if replaced is not value:
+                self.evictions += 1
+                self.make_callback('evicted', key, replaced)
             self._eject_old()
             
             self.newdata.set()
@@ -49,10 +91,26 @@ class Datasrc(object):
             return len(self.sortedkeys)
 
 
+    def _touch(self, key):
+        if key in self.lru:
+            self.lru.remove(key)
+        self.lru.append(key)
+
+    def _over_limit(self):
+        if len(self.datums) > self.length:
+            return True
+        return ((self.maxbytes != None) and (len(self.datums) > 1) and
+                (self.totalbytes > self.maxbytes))
+
     def _eject_old(self):
-        while len(self.history) > self.length:
-            oldest = self.history.pop(0)
+        while self._over_limit():
+            oldest = self.lru.pop(0)
+            self.history.remove(oldest)
+            value = self.datums[oldest]
             del self.datums[oldest]
+            self.totalbytes -= self.sizes.pop(oldest)
+            self.evictions += 1
+            self.make_callback('evicted', oldest, value)
 
         self.sortedkeys = self.datums.keys()
         self.sortedkeys.sort()
@@ -106,5 +164,22 @@ class Datasrc(object):
             self.length = length
             self._eject_old()
 
+    def get_maxbytes(self):
+        with self.cond:
+            return self.maxbytes
+
+    def set_maxbytes(self, maxbytes):
+        with self.cond:
+            self.maxbytes = maxbytes
+            self._eject_old()
+
+    def get_stats(self):
+        """Returns a bunch of statistics on the use of the buffer."""
+        with self.cond:
+            return Bunch.Bunch(count=len(self.datums), length=self.length,
+                               totalbytes=self.totalbytes,
+                               maxbytes=self.maxbytes, hits=self.hits,
+                               misses=self.misses, evictions=self.evictions)
+
         
 #END
@@ -16,11 +16,13 @@ class Future(Callback.Callbacks):
         Callback.Callbacks.__init__(self)
 
         self.evt = threading.Event()
+        self.ev_cancel = threading.Event()
         self.res = None
         # User can attach some arbitrary data if desired
         self.data = data
 
         self.enable_callback('resolved')
+        self.enable_callback('progress')
 
     def get_data(self):
         return self.data
@@ -44,6 +46,21 @@ class Future(Callback.Callbacks):
         self.resolve(res)
         return res
         
+    def cancel(self):
+        """Ask whatever is computing the value to abandon it.  It is up
+        to that code to check is_cancelled() and stop.
+        """
+        self.ev_cancel.set()
+
+    def is_cancelled(self):
+        return self.ev_cancel.isSet()
+
+    def progress(self, *args):
+        """Report progress on computing the value (e.g. amount done and
+        amount to do) to the 'progress' callbacks.
+        """
+        self.make_callback('progress', *args)
+
     def has_value(self):
         return self.evt.isSet()
     
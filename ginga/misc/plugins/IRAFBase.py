@@ -342,6 +342,9 @@ class IRAFBase(GingaPlugin.GlobalPlugin):
             self.logger.error(errmsg)
             raise GingaPlugin.PluginError(errmsg)
 
+        # Precompute the statistics etc. while still off the gui thread
+        self.fv.ingest_image(image, chname)
+
         # Do the GUI bits as the GUI thread
         self.fv.gui_do(self._gui_display_image, fitsname, image, chname)
 
@@ -107,6 +107,9 @@ class GingaWrapper(object):
             self.logger.error(errmsg)
             raise GingaPlugin.PluginError(errmsg)
 
+        # Precompute the statistics etc. while still off the gui thread
+        self.fv.ingest_image(image, chname)
+
         # Enqueue image to display datasrc
         self.fv.gui_do(self.fv.add_image, fitsname, image,
                             chname=chname)
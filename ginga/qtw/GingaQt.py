@@ -372,6 +372,7 @@ class GingaView(QtMain.QtMain):
         fi.add_callback('key-press', self.keypress)
         fi.add_callback('drag-drop', self.dragdrop)
         fi.add_callback('cut-set', self.change_range_cb, self.colorbar)
+        fi.add_callback('load-full', self.load_full_cb)
 
         # these are now set in the base class
         ## cmap_name = settings.get('color_map', "ramp")
@@ -524,7 +525,7 @@ class GingaView(QtMain.QtMain):
     def gui_load_file(self, initialdir=None):
         if self.filesel.exec_():
             fileNames = map(str, list(self.filesel.selectedFiles()))
-            self.load_file(fileNames[0])
+            self.load_file_async(fileNames[0])
         #self.start_operation('FBrowser')
         
     # def build_dialogpane(self):
@@ -14,7 +14,7 @@ from ginga.qtw import FitsImageCanvasTypesQt as CanvasTypes
 from ginga import GingaPlugin
 from ginga.qtw import ColorBar
 from ginga import cmap, imap
-from ginga import wcs
+from ginga import wcs, Catalog
 
 from ginga.misc import Bunch, Future
 
@@ -32,6 +32,9 @@ class Catalogs(GingaPlugin.LocalPlugin):
         self.plot_limit = 100
         self.plot_start = 0
 
+        # star list
+        self.starlist = []
+
         canvas = CanvasTypes.DrawingCanvas()
         canvas.enable_draw(True)
         canvas.set_drawtype('rectangle', color='cyan', linestyle='dash',
@@ -118,9 +121,12 @@ class Catalogs(GingaPlugin.LocalPlugin):
         captions = (('Server', 'xlabel'),
                     ('@Server', 'combobox'),
                     ('Limit stars to area', 'checkbutton'),
-                    ('Search', 'button'))
+                    ('Search', 'button'),
+                    ('Load Table', 'button'))
         w, self.w2 = QtHelp.build_info(captions)
         self.w2.search.clicked.connect(self.getcatalog_cb)
+        self.w2.load_table.clicked.connect(self.loadtable_cb)
+        self.w2.load_table.setToolTip("Load a catalog from a FITS table")
         self.w2.limit_stars_to_area.setChecked(self.limit_stars_to_area)
         self.w2.limit_stars_to_area.stateChanged.connect(self.limit_area_cb)
 
@@ -337,6 +343,7 @@ class Catalogs(GingaPlugin.LocalPlugin):
             self.table.close()
         except:
             pass
+        self.close_table()
         self.fv.showStatus("")
         
     def redo(self):
@@ -521,16 +528,7 @@ class Catalogs(GingaPlugin.LocalPlugin):
         index = self.w2.server.currentIndex()
         server = self.catalog_server_options[index]
 
-        obj = None
-        if self.limit_stars_to_area:
-            # Look for the defining object to filter stars
-            # If none, then use the visible image area
-            try:
-                obj = self.canvas.getObjectByTag(self.areatag)
-            
-            except KeyError:
-                pass
-            
+        obj = self.get_filter_obj()
         self.reset()
         self.fitsimage.onscreen_message("Querying catalog db...",
                                         delay=1.0)
@@ -546,7 +544,57 @@ class Catalogs(GingaPlugin.LocalPlugin):
         # Update the GUI
         self.fv.gui_do(self.update_catalog, starlist, info)
         
+    def loadtable_cb(self):
+        filepath = str(QtGui.QFileDialog.getOpenFileName(
+            self.w.params, "Load FITS catalog table"))
+        if len(filepath) == 0:
+            return
+
+        obj = self.get_filter_obj()
+        self.reset()
+        self.fitsimage.onscreen_message("Loading catalog table...",
+                                        delay=1.0)
+        self.fv.nongui_do(self.loadtable, filepath, obj)
+
+    def loadtable(self, filepath, obj):
+        starlist = None
+        try:
+            starlist, info = Catalog.load_table(filepath, logger=self.logger)
+            starlist = self.filter_results(starlist, obj)
+
+        except Exception, e:
+            if starlist != None:
+                starlist.close()
+            errmsg = "Failed to load catalog table '%s': %s" % (
+                filepath, str(e))
+            self.logger.error(errmsg)
+            self.fv.gui_do(self.fv.show_error, errmsg)
+            return
+
+        # Update the GUI
+        self.fv.gui_do(self.update_catalog, starlist, info)
+
+    def get_filter_obj(self):
+        obj = None
+        if self.limit_stars_to_area:
+            # Look for the defining object to filter stars
+            # If none, then use the visible image area
+            try:
+                obj = self.canvas.getObjectByTag(self.areatag)
+            
+            except KeyError:
+                pass
+        return obj
+
+    def close_table(self):
+        # release the file of a catalog loaded from a FITS table
+        if isinstance(self.starlist, Catalog.TableStarList):
+            self.starlist.close()
+        self.starlist = []
+
     def update_catalog(self, starlist, info):
+        # done with the table of any catalog shown before
+        self.close_table()
         self.starlist = starlist
         self.table.show_table(self, info, starlist)
         # Raise the listing tab
@@ -559,7 +607,11 @@ class Catalogs(GingaPlugin.LocalPlugin):
         image = self.fitsimage.get_image()
 
         # Filter starts by a containing object, if provided
-        if filter_obj:
+        if filter_obj and isinstance(starlist, Catalog.TableStarList):
+            # converted all at once, rather than star by star
+            starlist = starlist.select_within(image, filter_obj)
+
+        elif filter_obj:
             stars = []
             for star in starlist:
                 x, y = image.radectopix(star['ra_deg'], star['dec_deg'])
@@ -581,6 +633,7 @@ class Catalogs(GingaPlugin.LocalPlugin):
         #self.clear()
         self.clearAll()
         self.table.clear()
+        self.close_table()
        
     def plot_star(self, obj, image=None):
         if not image:
@@ -657,6 +710,9 @@ class CatalogListing(object):
 
         self.mag_max = 25.0
         self.mag_min = 0.0
+        # Most stars shown in the table (all are plotted, a subset at
+        # a time)
+        self.max_listing = 5000
 
         # keys: are name, ra, dec, mag, flag, b_r, preference, priority, dst
         # TODO: automate this generation
@@ -738,9 +794,11 @@ class CatalogListing(object):
         table.setSortingEnabled(False)
         # Update the starlist info
         row = 0
-        table.setRowCount(len(starlist))
+        numrows = min(len(starlist), self.max_listing)
+        table.setRowCount(numrows)
         
-        for star in starlist:
+        for i in xrange(numrows):
+            star = starlist[i]
             col = 0
             for hdr, kwd in self.columns:
                 val = str(star.starInfo.get(kwd, ''))
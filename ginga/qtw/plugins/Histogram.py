@@ -12,7 +12,7 @@ from ginga.qtw import QtHelp
 
 from ginga.qtw import FitsImageCanvasTypesQt as CanvasTypes
 from ginga.qtw import Plot
-from ginga import GingaPlugin
+from ginga import GingaPlugin, IntegralHistogram
 
 class Histogram(GingaPlugin.LocalPlugin):
 
@@ -35,6 +35,13 @@ class Histogram(GingaPlugin.LocalPlugin):
         canvas.setSurface(self.fitsimage)
         self.canvas = canvas
 
+        prefs = self.fv.get_preferences()
+        self.settings = prefs.createCategory('plugin_Histogram')
+        self.settings.load()
+        # With an integral histogram the region histogram is cheap enough
+        # to be updated continuously as the region is dragged
+        self.settings.setDefaults(use_integral_histogram=False)
+
         self.gui_up = False
 
         fitsimage.set_callback('cut-set', self.cutset_ext_cb)
@@ -125,6 +132,7 @@ class Histogram(GingaPlugin.LocalPlugin):
             self.fitsimage.add(self.canvas, tag=self.layertag)
 
         #self.canvas.deleteAllObjects()
+        self.build_integral_histogram()
         self.resume()
 
     def pause(self):
@@ -166,21 +174,39 @@ class Histogram(GingaPlugin.LocalPlugin):
                                                linestyle='dash'))
         self.draw_cb(canvas, tag)
         
-    def redo(self):
+    def build_integral_histogram(self):
+        if not self.settings.get('use_integral_histogram', False):
+            return
+        image = self.fitsimage.get_image()
+        if (image == None) or (len(image.get_data().shape) != 2):
+            return
+        # takes a while for a large image; until it is ready the plot
+        # is only updated when the region is released
+        self.fv.nongui_do(image.get_integral_histogram)
+
+    def redo(self, use_integral=False):
         obj = self.canvas.getObjectByTag(self.histtag)
-        if obj.kind != 'compound':
+        if obj.kind == 'compound':
+            bbox = obj.objects[0]
+        elif obj.kind == 'rectangle':
+            # region is being dragged
+            bbox = obj
+        else:
             return True
-        bbox = obj.objects[0]
         
         # Do histogram on the points within the rect
         image = self.fitsimage.get_image()
+        if use_integral:
+            numbins = IntegralHistogram.default_inthist_bins
+        else:
+            numbins = 2048
         self.plot.clear()
 
         depth = image.get_depth()
         if depth != 3:
             res = image.histogram(int(bbox.x1), int(bbox.y1),
                                   int(bbox.x2), int(bbox.y2),
-                                  numbins=2048)
+                                  numbins=numbins, use_integral=use_integral)
             y, x = res.dist, res.bins
             ymax = y.max()
             x = x[:-1]
@@ -193,7 +219,7 @@ class Histogram(GingaPlugin.LocalPlugin):
             for z in xrange(depth):
                 res = image.histogram(int(bbox.x1), int(bbox.y1),
                                       int(bbox.x2), int(bbox.y2),
-                                      z=z, numbins=2048)
+                                      z=z, numbins=numbins)
                 y, x = res.dist, res.bins
                 ymax = max(ymax, y.max())
                 x = x[:-1]
@@ -290,6 +316,12 @@ class Histogram(GingaPlugin.LocalPlugin):
             bbox.x1, bbox.y1, bbox.x2, bbox.y2 = x1, y1, x2, y2
             canvas.redraw(whence=3)
 
+        if self.settings.get('use_integral_histogram', False):
+            # continuous updates only once the table is built
+            image = self.fitsimage.get_image()
+            if image.get_integral_histogram(build=False) != None:
+                self.redo(use_integral=True)
+
     
     def draw_cb(self, canvas, tag):
         obj = canvas.getObjectByTag(tag)
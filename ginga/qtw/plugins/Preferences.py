@@ -292,7 +292,7 @@ class Preferences(GingaPlugin.LocalPlugin):
         b.hist_pct.setSingleStep(0.001)
         b.hist_pct.setDecimals(5)
         b.hist_pct.valueChanged.connect(lambda w: self.set_autocut_params())
-        b.hist_pct.setEnabled(method == 'histogram')
+        b.hist_pct.setEnabled(method in ('histogram', 'percentile'))
 
         fr.layout().addWidget(w, stretch=1, alignment=QtCore.Qt.AlignLeft)
         vbox.addWidget(fr, stretch=0, alignment=QtCore.Qt.AlignTop)
@@ -545,7 +545,7 @@ class Preferences(GingaPlugin.LocalPlugin):
         index = self.autocut_methods.index(method)
         self.w.auto_method.setCurrentIndex(index)
         self.w.hist_pct.setValue(pct)
-        if method != 'histogram':
+        if method not in ('histogram', 'percentile'):
             self.w.hist_pct.setEnabled(False)
         else:
             self.w.hist_pct.setEnabled(True)
@@ -561,7 +561,7 @@ class Preferences(GingaPlugin.LocalPlugin):
         pct = self.w.hist_pct.value()
         idx = self.w.auto_method.currentIndex()
         method = self.autocut_methods[idx]
-        self.w.hist_pct.setEnabled(method == 'histogram')
+        self.w.hist_pct.setEnabled(method in ('histogram', 'percentile'))
         self.fitsimage.set_autocut_params(method, pct=pct)
         self.t_.set(autocut_method=method, autocut_hist_pct=pct)
 
@@ -0,0 +1,569 @@
+#
+# test_AstroImage.py -- tests of loading FITS files into AstroImages
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import os
+import gzip
+import pickle
+import shutil
+import tempfile
+import logging
+import threading
+import unittest
+import warnings
+
+import numpy
+import pyfits
+
+from ginga import AstroImage, BaseImage, wcs
+from ginga.tests import test_ImageRegistry
+
+
+def write_uint16(path, shape=(60, 50)):
+    # stored as int16 with BZERO=32768, as cameras write them
+    data = (numpy.arange(shape[0] * shape[1]).reshape(shape) * 7 %
+            65536).astype(numpy.uint16)
+    pyfits.PrimaryHDU(data).writeto(path)
+    return path
+
+def write_bscaled(path, shape=(60, 50), blank=None):
+    data = (numpy.arange(numpy.prod(shape)).reshape(shape) %
+            3000).astype(numpy.int16)
+    hdu = pyfits.PrimaryHDU(data)
+    hdu.header['BSCALE'] = 0.5
+    hdu.header['BZERO'] = 10.0
+    if blank != None:
+        hdu.header['BLANK'] = blank
+    hdu.writeto(path)
+    return path
+
+def write_blank(path, shape=(60, 50)):
+    data = (numpy.arange(shape[0] * shape[1]).reshape(shape) %
+            3000).astype(numpy.int16)
+    hdu = pyfits.PrimaryHDU(data)
+    hdu.header['BLANK'] = 5
+    hdu.writeto(path)
+    return path
+
+def write_float(path, shape=(60, 50)):
+    data = numpy.arange(shape[0] * shape[1]).reshape(shape).astype('float32')
+    pyfits.PrimaryHDU(data).writeto(path)
+    return path
+
+
+class FileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.logger = logging.getLogger('test_AstroImage')
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, name):
+        return os.path.join(self.tmpdir, name)
+
+    def load(self, path, **kwdargs):
+        image = AstroImage.AstroImage(logger=self.logger)
+        image.load_file(path, **kwdargs)
+        return image
+
+    def assertSameData(self, data, ref):
+        self.assertEqual(data.shape, ref.shape)
+        self.assertTrue(numpy.array_equal(numpy.isnan(data),
+                                          numpy.isnan(ref)))
+        self.assertTrue(numpy.array_equal(numpy.nan_to_num(data),
+                                          numpy.nan_to_num(ref)))
+
+
+class LoadTestCase(FileTestCase):
+
+    def check_modes(self, path):
+        ref = pyfits.getdata(path)
+        for kwdargs in (dict(), dict(memmap=True), dict(native=True),
+                        dict(memmap=True, native=True),
+                        dict(ondemand=True)):
+            image = self.load(path, **kwdargs)
+            data = image.get_data()[:, :]
+            self.assertEqual(data.dtype.newbyteorder('='),
+                             ref.dtype.newbyteorder('='))
+            self.assertSameData(data, ref)
+            image.close()
+
+    def test_uint16(self):
+        self.check_modes(write_uint16(self.path('u16.fits')))
+
+    def test_bscaled(self):
+        self.check_modes(write_bscaled(self.path('bscale.fits')))
+
+    def test_bscaled_blank(self):
+        self.check_modes(write_bscaled(self.path('bscale.fits'), blank=5))
+
+    def test_blank(self):
+        self.check_modes(write_blank(self.path('blank.fits')))
+
+    def test_memmap_unscaled(self):
+        path = write_float(self.path('float.fits'))
+        image = self.load(path, memmap=True)
+        self.assertTrue(image.get('memmap'))
+        self.assertTrue(AstroImage.is_memmap(image.get_data()))
+        image.close()
+
+    def test_memmap_scaled(self):
+        # scaled data cannot stay memory-mapped
+        path = write_bscaled(self.path('bscale.fits'))
+        image = self.load(path, memmap=True)
+        self.assertFalse(image.get('memmap'))
+        self.assertEqual(image.get_header().get('BSCALE', 1), 1)
+
+
+class NativeTestCase(FileTestCase):
+
+    def test_native(self):
+        path = write_float(self.path('float.fits'))
+        ref = pyfits.getdata(path)
+        self.assertFalse(ref.dtype.isnative)
+        image = self.load(path, native=True)
+        data = image.get_data()
+        self.assertTrue(data.dtype.isnative)
+        self.assertEqual(data.dtype, numpy.dtype('float32'))
+        self.assertSameData(data, ref)
+
+    def test_in_place(self):
+        # data read into memory is swapped where it is, not copied
+        path = write_float(self.path('float.fits'))
+        fits_f = pyfits.open(path, memmap=False)
+        raw = fits_f[0].data
+        image = AstroImage.AstroImage(logger=self.logger)
+        image.load_hdu(fits_f[0], native=True)
+        data = image.get_data()
+        fits_f.close()
+        self.assertTrue(data.dtype.isnative)
+        self.assertTrue(numpy.may_share_memory(data, raw))
+        self.assertSameData(data, pyfits.getdata(path))
+
+    def test_chunks(self):
+        # memory-mapped data is copied a few rows at a time
+        self.addCleanup(setattr, AstroImage, 'default_native_chunk',
+                        AstroImage.default_native_chunk)
+        AstroImage.default_native_chunk = 1000
+        path = write_float(self.path('float.fits'))
+        image = self.load(path, memmap=True, native=True)
+        data = image.get_data()
+        self.assertFalse(AstroImage.is_memmap(data))
+        self.assertTrue(data.dtype.isnative)
+        self.assertSameData(data, pyfits.getdata(path))
+        image.close()
+
+    def test_bytes_mapped(self):
+        # 8-bit data needs no conversion, so stays mapped
+        path = self.path('u8.fits')
+        data = (numpy.arange(60 * 50).reshape((60, 50)) %
+                256).astype(numpy.uint8)
+        pyfits.PrimaryHDU(data).writeto(path)
+        image = self.load(path, memmap=True, native=True)
+        self.assertTrue(AstroImage.is_memmap(image.get_data()))
+        self.assertSameData(image.get_data(), data)
+        image.close()
+
+    def test_cube_plane(self):
+        # only the plane used is scaled
+        path = write_bscaled(self.path('cube.fits'), shape=(3, 20, 10))
+        ref = pyfits.getdata(path)
+        image = self.load(path, naxispath=[1], native=True)
+        data = image.get_data()
+        self.assertEqual(data.dtype, numpy.dtype('float32'))
+        self.assertSameData(data, ref[1])
+        header = image.get_header()
+        self.assertFalse('BSCALE' in header)
+        self.assertFalse('BZERO' in header)
+
+
+class CountingHeader(dict):
+    """A header that counts the times all of its cards are read."""
+
+    def __init__(self, cards):
+        dict.__init__(self, cards)
+        self.cards = cards
+        self.reads = 0
+
+    def items(self):
+        self.reads += 1
+        return list(self.cards)
+
+
+class CountingWCS(wcs.WCS):
+
+    def __init__(self):
+        wcs.WCS.__init__(self)
+        self.loads = 0
+
+    def load_header(self, header, fobj=None):
+        self.loads += 1
+        return wcs.WCS.load_header(self, header, fobj=fobj)
+
+
+class LazyHeaderTestCase(unittest.TestCase):
+
+    def make_header(self):
+        return CountingHeader([('SIMPLE', True), ('NAXIS', 2),
+                               ('OBJECT', 'M31'), ('COMMENT', 'one'),
+                               ('EXPTIME', 10.0)])
+
+    def test_peek(self):
+        # single keywords are looked up without copying the cards
+        header = self.make_header()
+        hdr = AstroImage.LazyHeader(header)
+        self.assertEqual(hdr['OBJECT'], 'M31')
+        self.assertEqual(hdr.get('EXPTIME'), 10.0)
+        self.assertEqual(hdr.get('MISSING', 5), 5)
+        self.assertTrue('NAXIS' in hdr)
+        self.assertFalse(hdr.has_key('MISSING'))
+        self.assertRaises(KeyError, hdr.__getitem__, 'MISSING')
+        self.assertEqual(header.reads, 0)
+
+    def test_fill(self):
+        header = self.make_header()
+        hdr = AstroImage.LazyHeader(header)
+        # in the order of the file
+        self.assertEqual(hdr.keys(), ['SIMPLE', 'NAXIS', 'OBJECT',
+                                      'COMMENT', 'EXPTIME'])
+        self.assertEqual(len(hdr), 5)
+        self.assertEqual(hdr['COMMENT'], 'one')
+        self.assertEqual(header.reads, 1)
+
+        hdr['FILTER'] = 'V'
+        del hdr['NAXIS']
+        hdr['NAXIS'] = 3
+        self.assertEqual(hdr.keys(), ['SIMPLE', 'OBJECT', 'COMMENT',
+                                      'EXPTIME', 'FILTER', 'NAXIS'])
+        self.assertEqual(hdr['NAXIS'], 3)
+        self.assertEqual(header.reads, 1)
+
+    def test_fill_on_change(self):
+        header = self.make_header()
+        hdr = AstroImage.LazyHeader(header)
+        hdr['OBJECT'] = 'M32'
+        self.assertEqual(header.reads, 1)
+        self.assertEqual(hdr['OBJECT'], 'M32')
+        self.assertEqual(hdr.keys()[2], 'OBJECT')
+
+    def test_copy(self):
+        header = self.make_header()
+        hdr = AstroImage.LazyHeader(header)
+        other = hdr.copy()
+        self.assertEqual(header.reads, 0)
+        other['OBJECT'] = 'M32'
+        self.assertEqual(hdr['OBJECT'], 'M31')
+        self.assertEqual(other.keys(), hdr.keys())
+        # and once filled
+        other = hdr.copy()
+        self.assertEqual(other, hdr)
+        self.assertEqual(other.keys(), hdr.keys())
+
+    def test_pickle(self):
+        hdr = AstroImage.LazyHeader(self.make_header())
+        other = pickle.loads(pickle.dumps(hdr))
+        self.assertTrue(isinstance(other, AstroImage.LazyHeader))
+        self.assertEqual(other.items(), hdr.items())
+
+
+class LazyWCSTestCase(FileTestCase):
+
+    def setUp(self):
+        FileTestCase.setUp(self)
+        data = numpy.zeros((40, 30), dtype='float32')
+        self.imagepath = test_ImageRegistry.write_image(
+            self.path('image.fits'), data, crpix=(15.0, 20.0))
+
+    def load(self, path, **kwdargs):
+        image = AstroImage.AstroImage(wcsclass=CountingWCS,
+                                      logger=self.logger)
+        image.load_file(path, **kwdargs)
+        return image
+
+    def test_first_use(self):
+        image = self.load(self.imagepath)
+        self.assertEqual(image._wcs.loads, 0)
+        ra, dec = image.pixtoradec(14.0, 19.0)
+        self.assertEqual(image._wcs.loads, 1)
+        self.assertAlmostEqual(ra, 10.0, 6)
+        self.assertAlmostEqual(dec, 20.0, 6)
+        image.radectopix(ra, dec)
+        self.assertEqual(image._wcs.loads, 1)
+
+    def test_update(self):
+        # the WCS is remade from the changed keywords when next used
+        image = self.load(self.imagepath)
+        image.pixtoradec(14.0, 19.0)
+        image.update_keywords(dict(CRVAL1=11.0))
+        image.update_metadata(dict(name='image'))
+        self.assertEqual(image._wcs.loads, 1)
+        ra, dec = image.pixtoradec(14.0, 19.0)
+        self.assertEqual(image._wcs.loads, 2)
+        self.assertAlmostEqual(ra, 11.0, 6)
+
+    def test_share(self):
+        image = self.load(self.imagepath)
+        other = image.share()
+        ra, dec = other.pixtoradec(14.0, 19.0)
+        self.assertAlmostEqual(ra, 10.0, 6)
+        self.assertEqual(image._wcs.loads, 0)
+        self.assertAlmostEqual(image.pixtoradec(14.0, 19.0)[0], 10.0, 6)
+
+    def test_set_wcs(self):
+        image = self.load(self.imagepath)
+        wcsobj = CountingWCS()
+        image.wcs = wcsobj
+        # not replaced by the header still pending
+        self.assertTrue(image.wcs is wcsobj)
+        self.assertEqual(wcsobj.loads, 0)
+
+    def test_fobj(self):
+        # distortions looked up in other HDUs are read while the file
+        # is open
+        image = AstroImage.AstroImage(wcsclass=CountingWCS,
+                                      logger=self.logger)
+        header = pyfits.getheader(self.imagepath)
+        image.set_wcs_header(header, fobj=object())
+        self.assertEqual(image._wcs.loads, 0)
+        header['CPDIS1'] = 'Lookup'
+        image.set_wcs_header(header, fobj=object())
+        self.assertEqual(image._wcs.loads, 1)
+
+
+class HeaderTestCase(FileTestCase):
+
+    def write_mef(self, path):
+        # an empty primary HDU and two image extensions
+        primary = pyfits.PrimaryHDU()
+        primary.header['OBSERVER'] = 'Jeschke'
+        ext1 = pyfits.ImageHDU(numpy.zeros((30, 21), dtype='int16'))
+        ext1.header['EXPTIME'] = 12.5
+        ext1.header['FLAG'] = True
+        ext1.header['HIERARCH ESO DET NAME'] = 'ccd'
+        ext1.header['LONGSTR'] = 'x' * 100
+        ext1.header['COMMENT'] = 'a comment'
+        ext2 = pyfits.ImageHDU(numpy.zeros((5, 7), dtype='float64'))
+        ext2.header['EXTNAME'] = 'SECOND'
+        pyfits.HDUList([primary, ext1, ext2]).writeto(path)
+        return path
+
+    def test_first_data(self):
+        path = self.write_mef(self.path('mef.fits'))
+        header = AstroImage.read_header(path)
+        self.assertEqual(header['_numhdu'], 1)
+        self.assertEqual(header['NAXIS1'], 21)
+        self.assertEqual(header['EXPTIME'], 12.5)
+        self.assertEqual(header['FLAG'], True)
+        self.assertEqual(header['ESO DET NAME'], 'ccd')
+        self.assertEqual(header['LONGSTR'], 'x' * 100)
+        self.assertFalse(header.has_key('COMMENT'))
+
+        # the same keywords, in the same order, as pyfits reads
+        ref = pyfits.getheader(path, 1)
+        keys = [ kwd for kwd in ref.keys()
+                 if kwd not in ('COMMENT', 'HISTORY', '') ]
+        self.assertEqual(header['_keyorder'], keys)
+        for kwd in keys:
+            self.assertEqual(header[kwd], ref[kwd])
+
+    def test_numhdu(self):
+        path = self.write_mef(self.path('mef.fits'))
+        header = AstroImage.read_header(path, numhdu=0)
+        self.assertEqual(header['OBSERVER'], 'Jeschke')
+        header = AstroImage.read_header(path, numhdu=2)
+        self.assertEqual(header['EXTNAME'], 'SECOND')
+        self.assertRaises(AstroImage.ImageError, AstroImage.read_header,
+                          path, numhdu=3)
+
+    def test_gzip(self):
+        path = self.write_mef(self.path('mef.fits'))
+        with open(path, 'rb') as in_f:
+            with gzip.open(path + '.gz', 'wb') as out_f:
+                out_f.write(in_f.read())
+        header = AstroImage.read_header(path + '.gz', numhdu=2)
+        self.assertEqual(header['EXTNAME'], 'SECOND')
+
+    def test_bad(self):
+        path = self.path('bad.fits')
+        with open(path, 'wb') as out_f:
+            out_f.write('not a FITS file'.ljust(2880))
+        self.assertRaises(AstroImage.ImageError, AstroImage.read_header,
+                          path)
+        # truncated
+        good = write_float(self.path('float.fits'))
+        with open(good, 'rb') as in_f:
+            text = in_f.read(1000)
+        with open(path, 'wb') as out_f:
+            out_f.write(text)
+        self.assertRaises(AstroImage.ImageError, AstroImage.read_header,
+                          path)
+
+    def test_scan(self):
+        paths = [ write_float(self.path('float%d.fits' % i))
+                  for i in xrange(5) ]
+        paths.append(self.path('missing.fits'))
+        res = AstroImage.scan_headers(paths, numthreads=3)
+        self.assertEqual(sorted(res.keys()), sorted(paths))
+        self.assertEqual(res[paths[-1]], None)
+        for path in paths[:-1]:
+            self.assertEqual(res[path]['NAXIS2'], 60)
+
+
+class ProgressTestCase(FileTestCase):
+
+    def test_progress_file(self):
+        path = self.path('bytes')
+        with open(path, 'wb') as out_f:
+            out_f.write('0123456789' * 100)
+        calls = []
+        def _progress(nread, total):
+            calls.append((nread, total))
+        in_f = BaseImage.ProgressFile(path, progress_cb=_progress,
+                                      chunk_size=64)
+        self.assertEqual(in_f.read(10), '0123456789')
+        in_f.seek(5)
+        # a large read is made in chunks
+        self.assertEqual(str(in_f.read(500)), ('5678901234' * 50))
+        self.assertEqual(calls[0], (10, 1000))
+        self.assertEqual(len(calls), 1 + 8)
+        self.assertEqual(calls[-1], (510, 1000))
+        self.assertEqual(len(in_f.read()), 495)
+        self.assertEqual(in_f.read(), '')
+        in_f.close()
+        self.assertTrue(in_f.closed)
+
+    def test_progress(self):
+        # (over 4 MB, so that the data is read in several chunks)
+        path = write_float(self.path('float.fits'), shape=(3000, 1000))
+        calls = []
+        def _progress(nread, total):
+            calls.append((nread, total))
+        image = self.load(path, progress_cb=_progress, verify=False)
+        self.assertSameData(image.get_data(), pyfits.getdata(path))
+        self.assertTrue(len(calls) >= 3)
+        total = os.path.getsize(path)
+        self.assertEqual(calls[-1][1], total)
+        nreads = [ nread for nread, total in calls ]
+        self.assertEqual(nreads, sorted(nreads))
+
+    def test_abandon(self):
+        path = write_float(self.path('float.fits'), shape=(3000, 1000))
+        class Cancelled(Exception):
+            pass
+        calls = []
+        def _progress(nread, total):
+            calls.append(nread)
+            if len(calls) > 1:
+                raise Cancelled("cancelled")
+        # the load is not retried (e.g. after verifying the file)
+        self.assertRaises(Cancelled, self.load, path,
+                          progress_cb=_progress, verify=False)
+        self.assertEqual(len(calls), 2)
+
+
+class VerifyTestCase(FileTestCase):
+
+    def setUp(self):
+        FileTestCase.setUp(self)
+        # count the verify passes
+        self.passes = []
+        verify = pyfits.HDUList.verify
+        def _verify(fits_f, option='warn'):
+            self.passes.append(option)
+            return verify(fits_f, option)
+        pyfits.HDUList.verify = _verify
+        self.addCleanup(setattr, pyfits.HDUList, 'verify', verify)
+
+    def write_bad(self, path):
+        # a lower case keyword, which verify fixes
+        cards = ['SIMPLE  =                    T',
+                 'BITPIX  =                  -32',
+                 'NAXIS   =                    2',
+                 'NAXIS1  =                    4',
+                 'NAXIS2  =                    3',
+                 'test    =                    1',
+                 'END']
+        header = ''.join(map(lambda card: card.ljust(80), cards))
+        data = numpy.arange(12, dtype='>f4').tostring()
+        with open(path, 'wb') as out_f:
+            out_f.write(header.ljust(2880))
+            out_f.write(data.ljust(2880, '\0'))
+        return path
+
+    def test_clean(self):
+        path = write_float(self.path('float.fits'))
+        # (pyfits verifies the files it writes)
+        del self.passes[:]
+        self.load(path)
+        self.assertEqual(self.passes, ['exception'])
+        self.assertTrue(AstroImage.verified_clean(path))
+        # skipped for a file known to be clean
+        self.load(path)
+        self.assertEqual(self.passes, ['exception'])
+
+        # until it changes
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime + 10))
+        self.assertFalse(AstroImage.verified_clean(path))
+        self.load(path)
+        self.assertEqual(self.passes, ['exception', 'exception'])
+
+    def test_fixed(self):
+        path = self.write_bad(self.path('bad.fits'))
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            image = self.load(path)
+        # checked, then fixed, and not remembered as clean
+        self.assertEqual(self.passes, ['exception', 'fix'])
+        self.assertFalse(AstroImage.verified_clean(path))
+        self.assertEqual(image.get_header()['TEST'], 1)
+        # with warnings of what was fixed
+        self.assertTrue(any(map(lambda w: issubclass(
+            w.category, pyfits.verify.VerifyWarning), caught)))
+
+    def test_concurrent(self):
+        paths = [ write_float(self.path('float%d.fits' % i))
+                  for i in (1, 2) ]
+        # the first verification waits until the second is done
+        verify = pyfits.HDUList.verify
+        first = threading.Event()
+        second = threading.Event()
+        waited = []
+        def _verify(fits_f, option='warn'):
+            if not first.isSet():
+                first.set()
+                waited.append(second.wait(5.0))
+            else:
+                second.set()
+            return verify(fits_f, option)
+        pyfits.HDUList.verify = _verify
+
+        thread = threading.Thread(target=self.load, args=(paths[0],))
+        thread.start()
+        first.wait()
+        self.load(paths[1])
+        thread.join()
+        # (rather than timing out)
+        self.assertEqual(waited, [True])
+        for path in paths:
+            self.assertTrue(AstroImage.verified_clean(path))
+
+    def test_noverify(self):
+        path = write_float(self.path('float.fits'))
+        del self.passes[:]
+        self.load(path, verify=False)
+        self.assertEqual(self.passes, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
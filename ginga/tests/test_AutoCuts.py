@@ -0,0 +1,167 @@
+#
+# test_AutoCuts.py -- tests of the histograms behind the cut levels
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import logging
+import unittest
+
+import numpy
+
+from ginga import AutoCuts
+
+
+class StreamingHistogramTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_AutoCuts')
+        numpy.random.seed(0)
+        data = numpy.random.normal(100.0, 10.0, (300, 200))
+        self.data = data.astype(numpy.float32)
+
+    def make_streamer(self, numbins=256):
+        # (small blocks, so that the data is read in several)
+        return AutoCuts.StreamingHistogram(numbins=numbins,
+                                           block_bytes=10000,
+                                           logger=self.logger)
+
+    def test_calc(self):
+        data = self.data.copy()
+        data[3, 4] = numpy.nan
+        data[5, 6] = numpy.inf
+        finite = data[numpy.isfinite(data)]
+
+        fractions = []
+        def _progress(dist, bins, fraction):
+            fractions.append(fraction)
+        dist, bins = self.make_streamer().calc(data, callback=_progress)
+
+        # the same as the histogram of the finite values in one go
+        refdist, refbins = numpy.histogram(finite, bins=256)
+        self.assertTrue(numpy.array_equal(bins, refbins))
+        self.assertTrue(numpy.array_equal(dist, refdist))
+        self.assertEqual(dist.sum(), data.size - 2)
+
+        self.assertTrue(len(fractions) > 1)
+        self.assertEqual(fractions, sorted(fractions))
+        self.assertEqual(fractions[-1], 1.0)
+
+    def test_constant(self):
+        data = numpy.zeros((30, 20), dtype=numpy.float32)
+        data.fill(5.0)
+        dist, bins = self.make_streamer(numbins=10).calc(data)
+        self.assertEqual(dist.sum(), data.size)
+        self.assertEqual(bins[0], 5.0)
+        self.assertTrue(numpy.all(numpy.diff(bins) > 0))
+
+    def test_not_finite(self):
+        data = numpy.zeros((30, 20), dtype=numpy.float32)
+        data.fill(numpy.nan)
+        streamer = self.make_streamer()
+        self.assertEqual(streamer.find_range(data), (0.0, 0.0))
+        dist, bins = streamer.calc(data)
+        self.assertEqual(dist.sum(), 0)
+
+    def test_stop(self):
+        streamer = self.make_streamer()
+        streamer.stop()
+        self.assertTrue(streamer.is_stopped())
+        self.assertEqual(streamer.calc(self.data), None)
+
+    def test_cuts(self):
+        autocuts = AutoCuts.AutoCuts(self.logger)
+        res = autocuts.calc_histogram_streaming(self.data, pct=0.99,
+                                                numbins=256,
+                                                block_bytes=10000)
+        ref = autocuts.calc_histogram(self.data, pct=0.99, numbins=256)
+        self.assertTrue(numpy.array_equal(res.dist, ref.dist))
+        self.assertAlmostEqual(res.loval, ref.loval, 4)
+        self.assertAlmostEqual(res.hival, ref.hival, 4)
+
+
+class PercentileCutsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_AutoCuts')
+        self.autocuts = AutoCuts.AutoCuts(self.logger)
+
+    def test_cuts(self):
+        values = numpy.arange(10.0)
+        numpy.random.seed(0)
+        data = numpy.random.permutation(values).reshape((2, 5))
+        self.assertEqual(self.autocuts.calc_percentile_cuts(data, pct=0.8),
+                         (values[1], values[8]))
+        self.assertEqual(self.autocuts.calc_percentile_cuts(data, pct=1.0),
+                         (values[0], values[9]))
+        # the median, at the most
+        median = numpy.median(data[0])
+        self.assertEqual(self.autocuts.calc_percentile_cuts(data[0], pct=0.0),
+                         (median, median))
+
+    def test_not_finite(self):
+        data = numpy.array([[numpy.nan, 3.0, 1.0],
+                            [numpy.inf, 2.0, -numpy.inf]])
+        self.assertEqual(self.autocuts.calc_percentile_cuts(data),
+                         (1.0, 3.0))
+        data.fill(numpy.nan)
+        self.assertEqual(self.autocuts.calc_percentile_cuts(data),
+                         (0.0, 0.0))
+
+    def test_samples(self):
+        data = numpy.arange(1000.0).reshape((20, 50))
+        # every 10th value
+        self.assertEqual(self.autocuts.calc_percentile_cuts(data, pct=0.8,
+                                                            maxsamples=100),
+                         (100.0, 890.0))
+
+
+class MedianCutsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_AutoCuts')
+        self.autocuts = AutoCuts.AutoCuts(self.logger)
+        self.have_scipy = AutoCuts.have_scipy
+
+    def tearDown(self):
+        AutoCuts.have_scipy = self.have_scipy
+
+    def test_blocks(self):
+        data = numpy.arange(30 * 45, dtype=numpy.float32).reshape((30, 45))
+        # a hot pixel is rejected
+        data[10, 10] = 1.0e6
+        xout = self.autocuts.calc_median_blocks(data, length=7)
+        self.assertEqual(xout.shape, (4, 6))
+        self.assertEqual(xout[0, 0], numpy.median(data[:7, :7]))
+        self.assertEqual(xout[1, 1], numpy.median(data[7:14, 7:14]))
+        self.assertTrue(xout.max() < 1.0e6)
+
+    def test_one_tile(self):
+        numpy.random.seed(0)
+        data = numpy.random.normal(100.0, 10.0, (10, 10))
+        # only one 7x7 tile: its median alone would give loval == hival
+        loval, hival = self.autocuts.calc_data_cut_levels(data,
+                                                          method='median')
+        self.assertTrue(loval < hival)
+        if self.have_scipy:
+            xout = self.autocuts.calc_median_blocks(data, length=7)
+            self.assertEqual(xout.shape, data.shape)
+
+    def test_smaller_tiles(self):
+        AutoCuts.have_scipy = False
+        data = numpy.arange(100.0).reshape((10, 10))
+        # 2x2 is the largest of which 16 fit
+        xout = self.autocuts.calc_median_blocks(data, length=7)
+        self.assertEqual(xout.shape, (5, 5))
+        self.assertEqual(xout[0, 0], numpy.median(data[:2, :2]))
+        xout = self.autocuts.calc_median_blocks(data[:3, :3], length=7)
+        self.assertEqual(xout.shape, (3, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
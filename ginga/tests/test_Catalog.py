@@ -0,0 +1,134 @@
+#
+# test_Catalog.py -- tests of catalogs loaded from FITS tables
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import os
+import shutil
+import tempfile
+import logging
+import unittest
+import warnings
+
+import numpy
+import pyfits
+
+from ginga.misc import Bunch
+from ginga import Catalog, FitsTable, AstroImage, wcs
+from ginga.tests import test_ImageRegistry
+
+
+class CatalogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.logger = logging.getLogger('test_Catalog')
+        self.tmpdir = tempfile.mkdtemp()
+        self.starlists = []
+
+        # an image with a TAN projection around (10, 20)
+        data = numpy.zeros((100, 100), dtype='float32')
+        path = test_ImageRegistry.write_image(
+            os.path.join(self.tmpdir, 'image.fits'), data,
+            crpix=(50.0, 50.0))
+        self.image = AstroImage.AstroImage(logger=self.logger)
+        self.image.load_file(path)
+
+        # stars scattered over (and beyond) the image
+        numpy.random.seed(0)
+        num = 200
+        self.ra = 10.0 + numpy.random.uniform(-0.1, 0.1, num)
+        self.dec = 20.0 + numpy.random.uniform(-0.1, 0.1, num)
+        self.mag = numpy.random.uniform(5.0, 20.0, num)
+        self.names = numpy.array([ 'star%03d' % i for i in xrange(num) ])
+        cols = [pyfits.Column(name='RA', format='D', array=self.ra),
+                pyfits.Column(name='DEC', format='D', array=self.dec),
+                pyfits.Column(name='MAG', format='E', array=self.mag),
+                pyfits.Column(name='NAME', format='10A', array=self.names)]
+        self.tablepath = os.path.join(self.tmpdir, 'table.fits')
+        hdulist = pyfits.HDUList([pyfits.PrimaryHDU(),
+                                  pyfits.BinTableHDU.from_columns(cols)])
+        hdulist.writeto(self.tablepath)
+
+    def tearDown(self):
+        for starlist in self.starlists:
+            starlist.close()
+        shutil.rmtree(self.tmpdir)
+
+    def load(self):
+        starlist, info = Catalog.load_table(self.tablepath,
+                                            logger=self.logger)
+        self.starlists.append(starlist)
+        return starlist, info
+
+    def test_load(self):
+        starlist, info = self.load()
+        self.assertEqual(len(starlist), 200)
+        self.assertEqual(info, ["%s[1]: 200 rows" % (self.tablepath)])
+        star = starlist[7]
+        self.assertEqual(star['name'], 'star007')
+        self.assertEqual(star['ra_deg'], self.ra[7])
+        self.assertAlmostEqual(star['mag'], self.mag[7], 4)
+        self.assertTrue(starlist[-193] is star)
+        self.assertEqual(starlist.index(star), 7)
+        # only the columns used were read
+        self.assertEqual(sorted(starlist.table.columns.keys()),
+                         ['DEC', 'MAG', 'NAME', 'RA'])
+
+    def test_radectopix_arrays(self):
+        x, y = self.image.radectopix_arrays(self.ra, self.dec)
+        for i in xrange(len(self.ra)):
+            ref_x, ref_y = self.image.radectopix(self.ra[i], self.dec[i])
+            self.assertAlmostEqual(x[i], ref_x, 6)
+            self.assertAlmostEqual(y[i], ref_y, 6)
+        # and as the scalar version of the base class does
+        x, y = wcs.BaseWCS.radectopix_arrays(self.image.wcs, self.ra,
+                                             self.dec, coords='fits')
+        ref_x, ref_y = self.image.radectopix(self.ra[3], self.dec[3],
+                                             coords='fits')
+        self.assertAlmostEqual(x[3], ref_x, 6)
+        self.assertAlmostEqual(y[3], ref_y, 6)
+
+    def test_select_within(self):
+        starlist, info = self.load()
+        obj = Bunch.Bunch(kind='rectangle', x1=80.0, y1=10.0,
+                          x2=20.0, y2=60.0)
+        inside = starlist.select_within(self.image, obj)
+        rows = []
+        for i in xrange(len(self.ra)):
+            x, y = self.image.radectopix(self.ra[i], self.dec[i])
+            if (20.0 <= x <= 80.0) and (10.0 <= y <= 60.0):
+                rows.append(i)
+        self.assertTrue(len(rows) > 0)
+        self.assertEqual(list(inside.rows), rows)
+        self.assertEqual(inside[0]['name'], self.names[rows[0]])
+
+        # other shapes test each position
+        obj = Bunch.Bunch(kind='circle',
+                          contains=lambda x, y: (20.0 <= x <= 80.0) and
+                                                (10.0 <= y <= 60.0))
+        self.assertEqual(list(starlist.select_within(self.image, obj).rows),
+                         rows)
+
+    def test_close(self):
+        starlist, info = self.load()
+        star = starlist[3]
+        starlist.close()
+        self.assertEqual(starlist.table.fits_f, None)
+        # stars and columns already read remain usable
+        self.assertTrue(starlist[3] is star)
+        self.assertEqual(starlist[4]['name'], 'star004')
+        table = FitsTable.FitsTable(logger=self.logger)
+        table.load_file(self.tablepath)
+        table.close()
+        self.assertRaises(FitsTable.TableError, table.get_column, 'RA')
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
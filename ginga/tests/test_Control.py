@@ -0,0 +1,260 @@
+#
+# test_Control.py -- tests of loading images into the channels of the viewer
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import os
+import time
+import shutil
+import tempfile
+import threading
+import logging
+import unittest
+import warnings
+
+import numpy
+import pyfits
+
+from ginga import Control, AstroImage, AutoCuts
+from ginga.misc import Task, Bunch
+
+
+class ViewerStub(object):
+
+    def onscreen_message(self, text, **kwdargs):
+        pass
+
+    def get_image(self):
+        return None
+
+
+class PrefetchViewerStub(ViewerStub):
+
+    def __init__(self, logger):
+        self.image = None
+        self.autocuts = AutoCuts.AutoCuts(logger)
+        self.settings = dict(autocuts='on', autocut_method='histogram',
+                             autocut_hist_pct=0.999, autocut_bins=2048)
+
+    def get_settings(self):
+        return self.settings
+
+    def get_image(self):
+        return self.image
+
+
+class TestControl(Control.GingaControl):
+    """The viewer without a gui: gui calls are made right away, on the
+    calling thread.
+    """
+
+    def getPluginManager(self, *args):
+        return None
+
+    def gui_do(self, method, *args, **kwdargs):
+        method(*args, **kwdargs)
+
+    def nongui_do(self, method, *args, **kwdargs):
+        task = Task.FuncTask(method, args, kwdargs, logger=self.logger)
+        task.init_and_start(self)
+        return task
+
+    def show_error(self, errmsg):
+        self.errors.append(errmsg)
+
+
+class ControlTestCase(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.logger = logging.getLogger('test_Control')
+        self.tmpdir = tempfile.mkdtemp()
+        self.threadPool = Task.ThreadPool(8, self.logger)
+        self.threadPool.startall(wait=True)
+        self.fv = TestControl(self.logger, self.threadPool, None, None)
+        self.fv.errors = []
+        self.fv.ingestImages(False)
+        self.added = []
+        self.fv.add_callback('add-image',
+                             lambda fv, chname, image: self.added.append(
+                                 image.get('name')))
+
+    def tearDown(self):
+        self.threadPool.stopall(wait=True)
+        shutil.rmtree(self.tmpdir)
+
+    def add_channel(self, chname, num_images=20):
+        chinfo = self.fv.add_channel_internal(chname, num_images=num_images)
+        chinfo.fitsimage = ViewerStub()
+        chinfo.prefs = dict(switchnew=False, raisenew=False)
+        return chinfo
+
+    def write_files(self, count):
+        paths = []
+        for i in xrange(count):
+            path = os.path.join(self.tmpdir, 'image%02d.fits' % i)
+            data = numpy.zeros((10, 10), dtype='float32')
+            data.fill(i)
+            pyfits.PrimaryHDU(data).writeto(path)
+            paths.append(path)
+        return paths
+
+
+class LoadFilesTestCase(ControlTestCase):
+
+    def test_order(self):
+        chinfo = self.add_channel('Image')
+        paths = self.write_files(6)
+        paths.insert(2, os.path.join(self.tmpdir, 'missing.fits'))
+        names = self.fv.load_files(paths, chname='Image').wait(timeout=30)
+        expected = map(os.path.basename, paths)
+        expected[2] = None
+        self.assertEqual(names, expected)
+        self.assertEqual(self.added, filter(None, expected))
+        self.assertEqual(len(self.fv.errors), 1)
+        self.assertEqual(chinfo.datasrc.keys(sort='time'),
+                         filter(None, expected))
+        image = chinfo.datasrc['image03.fits']
+        self.assertEqual(image.get_data()[0, 0], 3.0)
+
+    def test_held(self):
+        # later files are read faster, so are read ahead of the first
+        self.add_channel('Image')
+        paths = self.write_files(12)
+        self.fv.setLoadThreads(2)
+        load_image = self.fv.load_image
+        state = Bunch.Bunch(loaded=0, maxheld=0, lock=threading.Lock())
+        def _load_image(filepath, **kwdargs):
+            i = paths.index(filepath)
+            time.sleep(0.2 if i == 0 else 0.01)
+            image = load_image(filepath, **kwdargs)
+            with state.lock:
+                state.loaded += 1
+                state.maxheld = max(state.maxheld,
+                                    state.loaded - len(self.added))
+            return image
+        self.fv.load_image = _load_image
+
+        names = self.fv.load_files(paths, chname='Image').wait(timeout=30)
+        self.assertEqual(names, map(os.path.basename, paths))
+        self.assertEqual(self.added, names)
+        # no more than twice the number of loading threads
+        self.assertTrue(state.maxheld <= 4, state.maxheld)
+
+    def test_evicted(self):
+        # only the images still in the channel are announced
+        chinfo = self.add_channel('Image', num_images=2)
+        paths = self.write_files(4)
+        self.fv.setLoadThreads(1)
+        self.fv.bulk_add_images([ (os.path.basename(path),
+                                   self.fv.load_image(path))
+                                  for path in paths ], 'Image')
+        self.assertEqual(self.added, ['image02', 'image03'])
+        self.assertEqual(sorted(chinfo.evicted.keys()),
+                         ['image00.fits', 'image01.fits'])
+
+    def test_cancel(self):
+        self.add_channel('Image')
+        paths = self.write_files(6)
+        self.fv.setLoadThreads(1)
+        load_image = self.fv.load_image
+        def _load_image(filepath, **kwdargs):
+            future.cancel()
+            return load_image(filepath, **kwdargs)
+        self.fv.load_image = _load_image
+        future = self.fv.load_files(paths, chname='Image')
+        names = future.wait(timeout=30)
+        self.assertEqual(names, ['image00.fits'] + [ None ] * 5)
+        self.assertEqual(self.added, ['image00.fits'])
+
+
+class PrefetchTestCase(ControlTestCase):
+
+    def setUp(self):
+        super(PrefetchTestCase, self).setUp()
+        # the prefetches are run when the test says so
+        self.calls = []
+        self.fv.nongui_do = lambda method, *args: self.calls.append(
+            (method, args))
+
+    def add_channel(self, chname, num_images=3, prefetch=1):
+        chinfo = self.fv.add_channel_internal(chname, num_images=num_images)
+        chinfo.fitsimage = PrefetchViewerStub(self.logger)
+        chinfo.prefs = dict(switchnew=False, raisenew=False,
+                            prefetch=prefetch, prefetchcuts=True)
+        return chinfo
+
+    def add_images(self, chinfo, count):
+        images = []
+        for i, path in enumerate(self.write_files(count)):
+            image = self.fv.load_image(path)
+            image.set(name='image%02d' % i)
+            images.append((image.get('name'), image))
+        self.fv.bulk_add_images(images, chinfo.name)
+
+    def run_calls(self):
+        calls, self.calls = self.calls, []
+        for method, args in calls:
+            method(*args)
+
+    def test_prefetch(self):
+        # (the 2 asked for are cut down to what the buffer can hold)
+        chinfo = self.add_channel('Image', prefetch=2)
+        self.add_images(chinfo, 5)
+        self.assertEqual(sorted(chinfo.evicted.keys()),
+                         ['image00', 'image01'])
+        image = chinfo.datasrc['image02']
+        chinfo.fitsimage.image = image
+        self.fv.prefetch_neighbors(chinfo, image)
+        self.assertEqual(len(self.calls), 1)
+        self.run_calls()
+
+        # the neighbor evicted is brought back, in place of the image
+        # that is neither current nor a neighbor
+        self.assertEqual(chinfo.datasrc.keys(),
+                         ['image01', 'image02', 'image03'])
+        self.assertEqual(sorted(chinfo.evicted.keys()),
+                         ['image00', 'image04'])
+        self.assertEqual(chinfo.cursor, chinfo.datasrc.index('image02'))
+        restored = chinfo.datasrc['image01']
+        self.assertEqual(restored.get_data()[0, 0], 1.0)
+        self.assertEqual(restored.get('chname'), 'Image')
+
+        # with the cut levels ready for it
+        t_ = chinfo.fitsimage.settings
+        key = chinfo.fitsimage.autocuts.get_cache_key(
+            method=t_['autocut_method'], pct=t_['autocut_hist_pct'],
+            numbins=t_['autocut_bins'])
+        self.assertTrue(restored.cutcache.has_key(key))
+
+    def test_superseded(self):
+        chinfo = self.add_channel('Image')
+        self.add_images(chinfo, 5)
+        image = chinfo.datasrc['image02']
+        chinfo.fitsimage.image = image
+        self.fv.prefetch_neighbors(chinfo, image)
+        self.fv.prefetch_neighbors(chinfo, image)
+        # the first prefetch gives way to the second
+        method, args = self.calls.pop(0)
+        method(*args)
+        self.assertFalse(chinfo.datasrc.has_key('image01'))
+        self.run_calls()
+        self.assertTrue(chinfo.datasrc.has_key('image01'))
+
+    def test_small_buffer(self):
+        # no room for a neighbor next to the current image
+        chinfo = self.add_channel('Image', num_images=2)
+        self.add_images(chinfo, 4)
+        image = chinfo.datasrc['image02']
+        self.fv.prefetch_neighbors(chinfo, image)
+        self.assertEqual(self.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
@@ -0,0 +1,108 @@
+#
+# test_CubePlayer.py -- tests of the playback of the slices of data cubes
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import logging
+import threading
+import unittest
+
+import numpy
+
+from ginga.misc import Bunch
+from ginga import CubePlayer
+
+
+class CubePlayerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_CubePlayer')
+        self.data = numpy.arange(4 * 5 * 3 * 2).reshape((4, 5, 3, 2))
+        self.data = self.data.astype('>f4')
+
+    def make_player(self, **kwds):
+        # starts at slice 3 of the second axis
+        return CubePlayer.CubePlayer(self.data, [1, 3], 1,
+                                     logger=self.logger, **kwds)
+
+    def test_slice(self):
+        player = self.make_player()
+        data = player.get_slice(2)
+        self.assertTrue(data.dtype.isnative)
+        self.assertTrue(numpy.array_equal(data, self.data[1, 2]))
+
+    def test_produce(self):
+        player = self.make_player(bufsize=4)
+        thread = threading.Thread(target=player.produce)
+        thread.start()
+        try:
+            frames = []
+            for i in xrange(6):
+                frames.append(player.ring.get(timeout=5.0))
+        finally:
+            player.stop(wait=True)
+        self.assertFalse(player.producing)
+        thread.join()
+        # wraps around at the end of the axis
+        self.assertEqual([frame.index for frame in frames],
+                         [3, 4, 0, 1, 2, 3])
+        self.assertEqual([frame.seq for frame in frames], range(6))
+        for frame in frames:
+            self.assertTrue(numpy.array_equal(frame.data,
+                                              self.data[1, frame.index]))
+
+    def test_stop_wait(self):
+        player = self.make_player()
+        decoding = threading.Event()
+        release = threading.Event()
+        get_slice = player.get_slice
+
+        def slow_get_slice(index):
+            decoding.set()
+            release.wait()
+            return get_slice(index)
+
+        player.get_slice = slow_get_slice
+        thread = threading.Thread(target=player.produce)
+        thread.start()
+        decoding.wait()
+        stopped = threading.Event()
+
+        def stop():
+            player.stop(wait=True)
+            stopped.set()
+
+        threading.Thread(target=stop).start()
+        # waits for the slice being decoded
+        self.assertFalse(stopped.wait(0.2))
+        release.set()
+        self.assertTrue(stopped.wait(5.0))
+        thread.join()
+
+    def test_stopped_before_run(self):
+        player = self.make_player()
+        player.stop(wait=True)
+        player.produce()
+        self.assertTrue(player.ring.empty())
+
+    def test_drop(self):
+        player = self.make_player(fps=10.0)
+        for seq in xrange(4):
+            player.ring.put(Bunch.Bunch(seq=seq, index=seq, data=None))
+        player.get_frame()
+        player.t0 -= 0.25
+        # frame 1 is skipped for frame 2, and 3 is not due yet
+        frame = player.get_frame()
+        self.assertEqual(frame.seq, 2)
+        stats = player.get_stats()
+        self.assertEqual((stats.shown, stats.dropped), (2, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
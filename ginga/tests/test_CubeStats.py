@@ -0,0 +1,88 @@
+#
+# test_CubeStats.py -- tests of the global statistics of data cubes
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import os
+import shutil
+import tempfile
+import logging
+import unittest
+import warnings
+
+import numpy
+import pyfits
+
+from ginga import CubeStats
+
+
+class CubeStatsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.logger = logging.getLogger('test_CubeStats')
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_cube(self, name, data, **kwds):
+        path = os.path.join(self.tmpdir, name)
+        hdu = pyfits.PrimaryHDU(data)
+        for kwd, value in kwds.items():
+            hdu.header[kwd] = value
+        hdu.writeto(path)
+        return path
+
+    def calc(self, path, chunk_bytes=1000):
+        # (a small chunk size, so that the cube is read in several chunks)
+        stats = CubeStats.CubeStats(path, 0, logger=self.logger,
+                                    numbins=256, chunk_bytes=chunk_bytes)
+        results = []
+        stats.add_callback('done', lambda obj, res: results.append(res))
+        res = stats.calc()
+        self.assertEqual(results, [res])
+        return res
+
+    def test_range(self):
+        data = numpy.arange(4 * 30 * 20).reshape((4, 30, 20)).astype('float32')
+        data[1, 2, 3] = numpy.nan
+        res = self.calc(self.write_cube('cube.fits', data))
+        self.assertEqual(res.minval, 0.0)
+        self.assertEqual(res.maxval, data.size - 1)
+        self.assertEqual(res.dist.sum(), data.size - 1)
+        self.assertTrue(res.minval <= res.loval <= res.hival <= res.maxval)
+
+    def test_scaled(self):
+        raw = (numpy.arange(4 * 30 * 20).reshape((4, 30, 20)) %
+               1000).astype(numpy.int16)
+        path = self.write_cube('scaled.fits', raw, BSCALE=0.5, BZERO=10.0,
+                               BLANK=7)
+        res = self.calc(path)
+
+        # same as the statistics of the data scaled by pyfits
+        ref = pyfits.getdata(path)
+        stats = CubeStats.CubeStats(path, 0, logger=self.logger,
+                                    numbins=256, chunk_bytes=1000)
+        refres = stats.calc_data(ref)
+        self.assertEqual(res.minval, numpy.nanmin(ref))
+        self.assertEqual(res.maxval, numpy.nanmax(ref))
+        self.assertTrue(numpy.array_equal(res.dist, refres.dist))
+        self.assertEqual((res.loval, res.hival), (refres.loval, refres.hival))
+
+    def test_stop(self):
+        data = numpy.zeros((4, 30, 20), dtype='float32')
+        path = self.write_cube('cube.fits', data)
+        stats = CubeStats.CubeStats(path, 0, logger=self.logger)
+        stats.stop()
+        self.assertEqual(stats.calc(), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
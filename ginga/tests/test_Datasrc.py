@@ -0,0 +1,98 @@
+#
+# test_Datasrc.py -- tests of the keyed buffer of datums
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import unittest
+
+from ginga.misc import Datasrc
+
+
+class DatasrcTestCase(unittest.TestCase):
+
+    def make_datasrc(self, **kwdargs):
+        datasrc = Datasrc.Datasrc(**kwdargs)
+        self.evicted = []
+        def _evicted(obj, key, value):
+            self.evicted.append((key, value))
+        datasrc.add_callback('evicted', _evicted)
+        return datasrc
+
+    def test_length(self):
+        datasrc = self.make_datasrc(length=3)
+        for key in ('a', 'b', 'c'):
+            datasrc[key] = key.upper()
+        # getting a datum makes it the most recently used
+        self.assertEqual(datasrc['a'], 'A')
+        datasrc['d'] = 'D'
+        self.assertEqual(self.evicted, [('b', 'B')])
+        self.assertEqual(datasrc.keys(), ['a', 'c', 'd'])
+        # the history is still in order of insertion
+        self.assertEqual(datasrc.keys(sort='time'), ['a', 'c', 'd'])
+        self.assertEqual(datasrc.oldest(), 'A')
+        self.assertEqual(datasrc.youngest(), 'D')
+
+        datasrc.set_bufsize(1)
+        self.assertEqual(self.evicted, [('b', 'B'), ('c', 'C'), ('a', 'A')])
+        self.assertEqual(len(datasrc), 1)
+
+    def test_maxbytes(self):
+        datasrc = self.make_datasrc(length=10, maxbytes=100, sizefn=len)
+        datasrc['a'] = 'x' * 40
+        datasrc['b'] = 'x' * 40
+        datasrc['a']
+        datasrc['c'] = 'x' * 40
+        self.assertEqual([key for key, value in self.evicted], ['b'])
+        self.assertEqual(datasrc.get_stats().totalbytes, 80)
+
+        # replacing a datum counts only its new size
+        datasrc['c'] = 'x' * 10
+        self.assertEqual(self.evicted[-1], ('c', 'x' * 40))
+        self.assertEqual(datasrc.get_stats().totalbytes, 50)
+
+        # the last datum is kept even when over the budget
+        datasrc['d'] = 'x' * 500
+        self.assertEqual([key for key, value in self.evicted],
+                         ['b', 'c', 'a', 'c'])
+        self.assertEqual(datasrc.keys(), ['d'])
+        self.assertEqual(datasrc.get_stats().totalbytes, 500)
+
+        datasrc.set_maxbytes(None)
+        datasrc['e'] = 'x' * 500
+        self.assertEqual(len(datasrc), 2)
+        datasrc.set_maxbytes(600)
+        self.assertEqual(datasrc.keys(), ['e'])
+
+    def test_replace(self):
+        datasrc = self.make_datasrc(length=3, maxbytes=100, sizefn=len)
+        datasrc['a'] = 'x' * 40
+        value = 'y' * 40
+        datasrc['a'] = value
+        self.assertEqual(self.evicted, [('a', 'x' * 40)])
+        self.assertTrue(datasrc['a'] is value)
+        self.assertEqual(datasrc.get_stats().totalbytes, 40)
+        # setting the same value again is only a use of it
+        datasrc['a'] = value
+        self.assertEqual(len(self.evicted), 1)
+
+    def test_stats(self):
+        datasrc = self.make_datasrc(length=1, maxbytes=1000, sizefn=len)
+        datasrc['a'] = 'abc'
+        datasrc['a']
+        self.assertRaises(KeyError, datasrc.__getitem__, 'b')
+        datasrc['b'] = 'de'
+        stats = datasrc.get_stats()
+        self.assertEqual((stats.count, stats.length, stats.totalbytes,
+                          stats.maxbytes), (1, 1, 2, 1000))
+        self.assertEqual((stats.hits, stats.misses, stats.evictions),
+                         (1, 1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
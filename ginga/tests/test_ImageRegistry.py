@@ -0,0 +1,135 @@
+#
+# test_ImageRegistry.py -- tests of sharing the data of images loaded twice
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import os
+import gc
+import shutil
+import tempfile
+import logging
+import unittest
+import warnings
+
+import numpy
+import pyfits
+
+from ginga import ImageRegistry, AstroImage
+
+
+def write_image(path, data, crval=(10.0, 20.0), crpix=(1.0, 1.0)):
+    hdu = pyfits.PrimaryHDU(data)
+    for kwd, value in (('CTYPE1', 'RA---TAN'), ('CTYPE2', 'DEC--TAN'),
+                       ('CRVAL1', crval[0]), ('CRVAL2', crval[1]),
+                       ('CRPIX1', crpix[0]), ('CRPIX2', crpix[1]),
+                       ('CD1_1', -0.001), ('CD1_2', 0.0),
+                       ('CD2_1', 0.0), ('CD2_2', 0.001)):
+        hdu.header[kwd] = value
+    hdu.writeto(path, clobber=True)
+    return path
+
+
+class ImageRegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.logger = logging.getLogger('test_ImageRegistry')
+        self.tmpdir = tempfile.mkdtemp()
+        data = numpy.arange(40 * 30).reshape((40, 30)).astype('float32')
+        self.path = write_image(os.path.join(self.tmpdir, 'image.fits'),
+                                data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def load(self, memmap=None):
+        key = ImageRegistry.get_key(self.path, memmap=memmap)
+        image = ImageRegistry.lookup(key)
+        if image != None:
+            return image
+        image = AstroImage.AstroImage(logger=self.logger)
+        image.load_file(self.path, memmap=memmap)
+        ImageRegistry.register(key, image)
+        return image
+
+    def test_share(self):
+        image = self.load()
+        self.assertFalse(ImageRegistry.is_shared(image))
+        image.set(name='image1')
+        image.get_minmax()
+        other = self.load()
+        self.assertFalse(other is image)
+        self.assertTrue(other.get_data() is image.get_data())
+        self.assertTrue(ImageRegistry.is_shared(image))
+        self.assertTrue(ImageRegistry.is_shared(other))
+        # the shared data is read-only
+        self.assertFalse(image.get_data().flags.writeable)
+        self.assertEqual(other.get_minmax(), image.get_minmax())
+
+        # but the header, metadata, WCS and cut levels are its own
+        ra, dec = image.pixtoradec(5, 5)
+        self.assertEqual(other.pixtoradec(5, 5), (ra, dec))
+        other.set(name='image2')
+        other.update_keywords({'CRVAL1': 11.0})
+        other.cutcache['key'] = (1.0, 2.0)
+        self.assertEqual(image.get('name'), 'image1')
+        self.assertEqual(image.get_keyword('CRVAL1'), 10.0)
+        self.assertEqual(image.pixtoradec(5, 5), (ra, dec))
+        self.assertNotEqual(other.pixtoradec(5, 5)[0], ra)
+        self.assertFalse(image.cutcache.has_key('key'))
+
+        # options that change the data make another key
+        self.assertEqual(self.load(memmap=True).get_data().flags.writeable,
+                         False)
+        self.assertFalse(self.load(memmap=True).get_data() is
+                         image.get_data())
+
+    def test_release(self):
+        image = self.load()
+        other = self.load()
+        del other
+        gc.collect()
+        # the registry does not hold images by itself
+        self.assertFalse(ImageRegistry.is_shared(image))
+        del image
+        gc.collect()
+        key = ImageRegistry.get_key(self.path, memmap=None)
+        self.assertEqual(ImageRegistry.lookup(key), None)
+
+    def test_changed(self):
+        image = self.load()
+        st = os.stat(self.path)
+        os.utime(self.path, (st.st_atime, st.st_mtime + 10))
+        self.assertFalse(self.load().get_data() is image.get_data())
+
+    def test_close(self):
+        # the file of mapped data is held by all images sharing it
+        image = self.load(memmap=True)
+        other = self.load(memmap=True)
+        self.assertTrue(other.fits_f is image.fits_f)
+        image.close()
+        self.assertTrue(numpy.array_equal(other.get_data()[:, :],
+                                          pyfits.getdata(self.path)))
+        other.close()
+
+    def test_mosaic(self):
+        # writing into shared data makes a copy first
+        image = self.load()
+        other = self.load()
+        data = numpy.zeros((5, 5), dtype='float32')
+        piece = AstroImage.AstroImage(data_np=data, logger=self.logger)
+        piece.update_keywords(dict(image.get_header().items()))
+        piece.update_keywords({'CRPIX1': -2.0, 'CRPIX2': -2.0})
+        image.mosaic_inline([piece])
+        self.assertEqual(image.get_data()[3:8, 3:8].sum(), 0.0)
+        self.assertNotEqual(other.get_data()[3:8, 3:8].sum(), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
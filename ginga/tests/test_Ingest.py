@@ -0,0 +1,102 @@
+#
+# test_Ingest.py -- tests of precomputing the products of new images
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import logging
+import unittest
+
+import numpy
+
+from ginga import Ingest, AstroImage, AutoCuts, SpillCache
+from ginga.tests import test_ThumbGen
+
+cutparams = dict(method='histogram', pct=0.999, numbins=2048)
+
+
+class IngestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_Ingest')
+        numpy.random.seed(0)
+        data = numpy.random.normal(100.0, 10.0, (1300, 1100))
+        data = data.astype(numpy.float32)
+        data[5, 5] = numpy.inf
+        data[7, 7] = -numpy.inf
+        data[9, 9] = numpy.nan
+        self.data = data
+        # (small blocks, so that the data is read in several)
+        self.ingester = Ingest.Ingester(logger=self.logger,
+                                        overview_size=200,
+                                        block_bytes=1024*1024)
+
+    def make_image(self):
+        return AstroImage.AstroImage(data_np=self.data, logger=self.logger)
+
+    def test_products(self):
+        image = self.make_image()
+        res = self.ingester.ingest(image, cutparams=cutparams,
+                                   thumbparams=test_ThumbGen.thumb_params)
+        self.assertTrue(image.ingest is res)
+        self.assertFalse(image.get_metadata().has_key('ingest'))
+
+        # the same as calculated when the image is shown
+        ref = AstroImage.AstroImage(data_np=self.data.copy(),
+                                    logger=self.logger)
+        self.assertEqual(image.get_minmax(), ref.get_minmax())
+        self.assertEqual(image.get_minmax(noinf=True),
+                         ref.get_minmax(noinf=True))
+        autocuts = AutoCuts.AutoCuts(self.logger)
+        cuts = autocuts.calc_cut_levels(ref, **cutparams)
+        self.assertEqual(res.cuts, cuts)
+        self.assertEqual(autocuts.calc_cut_levels(image, **cutparams), cuts)
+
+        self.assertEqual(res.stride, 7)
+        self.assertTrue(numpy.array_equal(res.overview,
+                                          self.data[::7, ::7]))
+        self.assertEqual(res.thumb.shape, (50, 42, 3))
+
+        # done already
+        self.assertTrue(self.ingester.ingest(image, cutparams=cutparams,
+                                             thumbparams=test_ThumbGen.thumb_params)
+                        is res)
+
+    def test_stale(self):
+        image = self.make_image()
+        self.ingester.ingest(image, cutparams=cutparams)
+        other = image.share()
+        self.assertTrue(other.ingest is image.ingest)
+        image.set_data(self.data[:100, :100])
+        self.assertEqual(image.ingest, None)
+
+    def test_spill(self):
+        image = self.make_image()
+        image.set(name='image')
+        self.ingester.ingest(image, cutparams=cutparams,
+                             thumbparams=test_ThumbGen.thumb_params)
+        cache = SpillCache.SpillCache(logger=self.logger)
+        try:
+            cache.spill('chan', 'image', image)
+            other = cache.restore('chan', 'image', logger=self.logger)
+        finally:
+            cache.clear()
+        self.assertEqual(other.get('name'), 'image')
+        self.assertEqual(other.ingest, None)
+        # the cut levels carry over
+        key = AutoCuts.AutoCuts(self.logger).get_cache_key(**cutparams)
+        self.assertEqual(other.cutcache[key], image.ingest.cuts)
+
+    def test_not_array(self):
+        image = self.make_image()
+        image.set_data(numpy.arange(10.0))
+        self.assertEqual(self.ingester.ingest(image), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
@@ -0,0 +1,126 @@
+#
+# test_IntegralHistogram.py -- tests of the summed-area region histograms
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import logging
+import unittest
+
+import numpy
+
+from ginga import IntegralHistogram, AstroImage
+
+
+class IntegralHistogramTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_IntegralHistogram')
+        numpy.random.seed(0)
+        # integer values, so that no value falls near a bin edge
+        data = numpy.random.randint(0, 256, (70, 90)).astype(numpy.float32)
+        data[0, 0], data[0, 1] = 0.0, 255.0
+        self.data = data
+
+    def make_inthist(self, data):
+        return IntegralHistogram.IntegralHistogram(data, numbins=256,
+                                                   cellsize=16,
+                                                   logger=self.logger)
+
+    def reference(self, inthist, x1, y1, x2, y2):
+        dist, bins = numpy.histogram(self.data[y1:y2, x1:x2],
+                                     bins=inthist.bins)
+        return dist
+
+    def test_regions(self):
+        inthist = self.make_inthist(self.data)
+        # on the cell grid, across it, to the edges, and inside one cell
+        for (x1, y1, x2, y2) in ((16, 16, 64, 48), (5, 3, 77, 61),
+                                 (0, 0, 90, 70), (33, 20, 90, 70),
+                                 (18, 18, 25, 29), (-10, -10, 200, 200)):
+            res = inthist.histogram(x1, y1, x2, y2)
+            x1, y1 = max(0, x1), max(0, y1)
+            self.assertTrue(numpy.array_equal(
+                res.dist, self.reference(inthist, x1, y1, x2, y2)))
+            self.assertEqual(res.dist.sum(),
+                             self.data[y1:y2, x1:x2].size)
+
+    def test_cells(self):
+        inthist = self.make_inthist(self.data)
+        # enlarged to the enclosing cells
+        res = inthist.histogram(5, 3, 40, 20, exact=False)
+        self.assertTrue(numpy.array_equal(
+            res.dist, self.reference(inthist, 0, 0, 48, 32)))
+
+    def test_nonfinite(self):
+        data = self.data.copy()
+        data[10, 10] = numpy.nan
+        data[20, 30] = numpy.inf
+        inthist = self.make_inthist(data)
+        res = inthist.histogram(0, 0, 90, 70)
+        self.assertEqual(res.dist.sum(), data.size - 2)
+        self.assertEqual((inthist.minval, inthist.maxval), (0.0, 255.0))
+
+    def test_empty(self):
+        inthist = self.make_inthist(self.data)
+        res = inthist.histogram(50, 50, 50, 60)
+        self.assertEqual(res.dist.sum(), 0)
+
+
+class ImageHistogramTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_IntegralHistogram')
+        numpy.random.seed(0)
+        data = numpy.random.randint(0, 256, (300, 200)).astype(numpy.float32)
+        self.image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+
+    def test_use_integral(self):
+        image = self.image
+        # not used (nor built) until it has been built
+        self.assertEqual(image.get_integral_histogram(build=False), None)
+        res = image.histogram(10, 20, 150, 250, numbins=256,
+                              use_integral=True)
+        self.assertEqual(image.get_integral_histogram(build=False), None)
+        exact = image.histogram(10, 20, 150, 250, numbins=256)
+        self.assertTrue(numpy.array_equal(res.dist, exact.dist))
+
+        inthist = image.get_integral_histogram()
+        res = image.histogram(10, 20, 150, 250, numbins=256,
+                              use_integral=True)
+        ref = inthist.histogram(10, 20, 150, 250)
+        self.assertTrue(numpy.array_equal(res.dist, ref.dist))
+        self.assertTrue(numpy.array_equal(res.bins, inthist.bins))
+
+    def test_other_bins(self):
+        image = self.image
+        image.get_integral_histogram()
+        # the table has 256 bins: binned from the data instead
+        res = image.histogram(10, 20, 150, 250, numbins=2048,
+                              use_integral=True)
+        exact = image.histogram(10, 20, 150, 250, numbins=2048)
+        self.assertEqual(len(res.dist), len(exact.dist))
+        self.assertTrue(numpy.array_equal(res.dist, exact.dist))
+
+    def test_rgb(self):
+        data = numpy.zeros((30, 20, 3), dtype=numpy.uint8)
+        data[:, :, 1] = 7
+        image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+        res = image.histogram(0, 0, 20, 30, z=1, numbins=256,
+                              use_integral=True)
+        self.assertEqual(res.dist.sum(), 30 * 20)
+
+    def test_stale(self):
+        image = self.image
+        image.get_integral_histogram()
+        image.set_data(image.get_data()[:100, :100])
+        self.assertEqual(image.get_integral_histogram(build=False), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
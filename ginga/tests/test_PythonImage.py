@@ -0,0 +1,124 @@
+#
+# test_PythonImage.py -- tests of loading JPEG/PNG etc. images as proxies
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import os
+import shutil
+import tempfile
+import logging
+import unittest
+
+import numpy
+
+from ginga import PythonImage, ThumbGen
+
+
+class ProxyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_PythonImage')
+        self.tmpdir = tempfile.mkdtemp()
+        numpy.random.seed(0)
+        self.data = numpy.random.randint(0, 256, (32, 40, 3)).astype('uint8')
+        # (a PPM file is read without PIL)
+        self.path = os.path.join(self.tmpdir, 'image.ppm')
+        with open(self.path, 'wb') as out_f:
+            out_f.write("P6\n40 32\n255\n")
+            out_f.write(self.data.tostring())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_proxy(self):
+        # as loaded by load_file(maxsize=10) with PIL
+        image = PythonImage.PythonImage(logger=self.logger)
+        image.set_data(self.data[::4, ::4].copy(),
+                       metadata=dict(path=self.path))
+        image.set(proxy=True, full_size=(40, 32))
+        return image
+
+    def make_viewer(self, image):
+        viewer = ThumbGen.FitsImageHeadless(logger=self.logger)
+        viewer.t_.set(load_full_on_zoom=True, autozoom='off')
+        viewer.set_image(image)
+        viewer.scale_to(0.5, 0.5)
+        viewer.set_pan(3.5, 2.5)
+        return viewer
+
+    def test_load_file(self):
+        image = PythonImage.PythonImage(logger=self.logger)
+        image.load_file(self.path)
+        self.assertTrue(numpy.array_equal(image.get_data(), self.data))
+        self.assertEqual(image.get('full_size'), (40, 32))
+        self.assertFalse(image.is_proxy())
+
+    def test_read_full(self):
+        image = self.make_proxy()
+        res = image.read_full()
+        # not swapped in yet
+        self.assertEqual(image.get_size(), (10, 8))
+        self.assertTrue(image.is_proxy())
+        image.set_full(res)
+        self.assertTrue(numpy.array_equal(image.get_data(), self.data))
+        self.assertFalse(image.is_proxy())
+        self.assertEqual(image.get('path'), self.path)
+
+    def test_zoom(self):
+        # with no 'load-full' handler, it is loaded when zoomed in on
+        image = self.make_proxy()
+        viewer = self.make_viewer(image)
+        viewer.scale_to(2.0, 2.0)
+        self.assertEqual(image.get_size(), (40, 32))
+        self.assertEqual(viewer.get_scale_xy(), (0.5, 0.5))
+        self.assertEqual(viewer.get_pan(), (12.5, 8.5))
+
+    def test_load_full_cb(self):
+        image = self.make_proxy()
+        viewer = self.make_viewer(image)
+        requests = []
+
+        def load_full_cb(viewer, image):
+            requests.append(image)
+            return True
+
+        viewer.add_callback('load-full', load_full_cb)
+        viewer.scale_to(2.0, 2.0)
+        viewer.scale_to(4.0, 4.0)
+        # requested once, and left to the handler
+        self.assertEqual(requests, [image])
+        self.assertEqual(image.get_size(), (10, 8))
+
+        views = []
+
+        def modified_cb(image):
+            views.append((viewer.get_pan(), viewer.get_scale_xy()))
+
+        image.add_callback('modified', modified_cb)
+        viewer.set_full_image(image, image.read_full())
+        self.assertEqual(image.get_size(), (40, 32))
+        # the view was fixed up before the data was replaced
+        self.assertEqual(views, [((12.5, 8.5), (1.0, 1.0))])
+
+    def test_load_full_failed(self):
+        image = self.make_proxy()
+        viewer = self.make_viewer(image)
+        requests = []
+        viewer.add_callback('load-full',
+                            lambda viewer, image: requests.append(image) or True)
+        viewer.scale_to(2.0, 2.0)
+        viewer.set_full_image(image, None)
+        self.assertTrue(image.is_proxy())
+        # and is tried again
+        viewer.scale_to(3.0, 3.0)
+        self.assertEqual(len(requests), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
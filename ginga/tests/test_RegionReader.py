@@ -0,0 +1,194 @@
+#
+# test_RegionReader.py -- tests of reading regions of FITS images on demand
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import os
+import shutil
+import tempfile
+import logging
+import unittest
+import warnings
+
+import numpy
+import pyfits
+
+from ginga import RegionReader, AstroImage
+
+
+class RegionReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.logger = logging.getLogger('test_RegionReader')
+        self.tmpdir = tempfile.mkdtemp()
+        self.readers = []
+
+    def tearDown(self):
+        for reader in self.readers:
+            reader.close()
+        shutil.rmtree(self.tmpdir)
+
+    def open_reader(self, data, naxispath=None, **kwds):
+        path = os.path.join(self.tmpdir, 'image.fits')
+        hdu = pyfits.PrimaryHDU(data)
+        for kwd, value in kwds.items():
+            hdu.header[kwd] = value
+        hdu.writeto(path, clobber=True)
+        fits_f = pyfits.open(path, 'readonly')
+        try:
+            offset = fits_f.fileinfo(0)['datLoc']
+            # (before pyfits scales the data and changes the header)
+            header = fits_f[0].header.copy()
+            ref = fits_f[0].data
+        finally:
+            fits_f.close()
+        # (small blocks, so that regions span several)
+        reader = RegionReader.RegionReader(path, offset, header,
+                                           naxispath=naxispath,
+                                           block_rows=8, block_cols=16,
+                                           logger=self.logger)
+        self.readers.append(reader)
+        return reader, ref
+
+    def make_data(self, shape=(50, 70), dtype='float32'):
+        size = numpy.prod(shape)
+        return numpy.arange(size).reshape(shape).astype(dtype)
+
+    def test_index(self):
+        reader, ref = self.open_reader(self.make_data())
+        self.assertEqual(reader.shape, (50, 70))
+        self.assertEqual(reader.dtype, numpy.dtype('float32'))
+        for key in [(slice(None), slice(None)),
+                    (slice(3, 20), slice(10, 45)),
+                    (slice(None, None, 3), slice(5, None, 7)),
+                    (slice(None, None, -2), slice(40, 2, -3)),
+                    (slice(-10, None), slice(None, -60)),
+                    (slice(20, 10), slice(None)),
+                    (7, slice(2, 30)),
+                    (slice(2, 30), -7),
+                    ]:
+            data = reader[key]
+            self.assertEqual(data.dtype, ref.dtype.newbyteorder('='))
+            self.assertTrue(numpy.array_equal(data, ref[key]), key)
+        self.assertEqual(reader[4, 9], ref[4, 9])
+        self.assertTrue(numpy.array_equal(reader[12], ref[12]))
+        self.assertRaises(IndexError, reader.__getitem__, (50, 0))
+        self.assertRaises(IndexError, reader.__getitem__, (0, 0, 0))
+        self.assertTrue(numpy.array_equal(numpy.asarray(reader), ref))
+
+    def test_outer(self):
+        reader, ref = self.open_reader(self.make_data())
+        # sparse and dense rows, repeated and unordered indices
+        for rows, cols in [([0, 20, 45], [3, 3, 60, 1]),
+                           ([5, 6, 7, 9], range(10, 30)),
+                           ([-1, 2], [-2, 0])]:
+            idx = numpy.ix_(rows, cols)
+            self.assertTrue(numpy.array_equal(reader[idx], ref[idx]))
+        self.assertRaises(IndexError, reader.__getitem__,
+                          (numpy.arange(3), numpy.arange(3)))
+
+    def test_cache(self):
+        reader, ref = self.open_reader(self.make_data())
+        reader[0:8, 0:16]
+        stats = reader.get_stats()
+        self.assertEqual((stats.blocks, stats.hits, stats.misses), (1, 0, 1))
+        # the same block again, and a region spanning four blocks
+        reader[2:5, 3:9]
+        reader[4:12, 10:20]
+        stats = reader.get_stats()
+        self.assertEqual((stats.blocks, stats.hits, stats.misses), (4, 2, 4))
+
+        # read again after closing
+        reader.close()
+        self.assertEqual(reader.get_stats().blocks, 0)
+        self.assertTrue(numpy.array_equal(reader[10:20, 30:40],
+                                          ref[10:20, 30:40]))
+
+    def test_cache_bytes(self):
+        path = os.path.join(self.tmpdir, 'image.fits')
+        reader, ref = self.open_reader(self.make_data())
+        # room for two blocks of 8x16 float32
+        reader = RegionReader.RegionReader(reader.filepath, reader.offset,
+                                           pyfits.getheader(path),
+                                           block_rows=8, block_cols=16,
+                                           cache_bytes=2 * 8 * 16 * 4,
+                                           logger=self.logger)
+        self.readers.append(reader)
+        reader[0:8, 0:48]
+        stats = reader.get_stats()
+        self.assertEqual((stats.blocks, stats.maxblocks), (2, 2))
+        # the least recently used (first) block was dropped
+        self.assertEqual(sorted(reader.cache.keys()), [(0, 1), (0, 2)])
+
+    def test_scaled_cutout(self):
+        reader, ref = self.open_reader(self.make_data())
+        image = AstroImage.AstroImage(logger=self.logger)
+        # (the data of an image read on demand)
+        image.set_data(reader)
+        res = image.get_scaled_cutout_wdht(10, 5, 49, 34, 20, 10)
+        self.assertTrue(numpy.array_equal(res.data, ref[5:35:3, 10:50:2]))
+        self.assertEqual((res.scale_x, res.scale_y), (0.5, 1.0 / 3))
+        # the same as at the equivalent scale
+        ref = image.get_scaled_cutout_basic(10, 5, 49, 34, 0.5, 1.0 / 3)
+        self.assertTrue(numpy.array_equal(res.data, ref.data))
+
+    def test_cube(self):
+        data = self.make_data(shape=(3, 4, 20, 30))
+        reader, ref = self.open_reader(data, naxispath=[2, 1])
+        self.assertEqual(reader.shape, (20, 30))
+        self.assertTrue(numpy.array_equal(reader[:, :], ref[2, 1]))
+
+    def test_scaled(self):
+        raw = (self.make_data() % 3000).astype('int16')
+        reader, ref = self.open_reader(raw, BSCALE=0.5, BZERO=10.0,
+                                       BLANK=5)
+        self.assertEqual(reader.dtype, ref.dtype.newbyteorder('='))
+        data = reader[:, :]
+        self.assertTrue(numpy.isnan(data[0, 5]))
+        self.assertTrue(numpy.array_equal(numpy.isnan(data),
+                                          numpy.isnan(ref)))
+        self.assertTrue(numpy.array_equal(numpy.nan_to_num(data),
+                                          numpy.nan_to_num(ref)))
+
+    def test_uint16(self):
+        data = (self.make_data() * 13 % 65536).astype('uint16')
+        reader, ref = self.open_reader(data)
+        self.assertEqual(reader.dtype, numpy.dtype('uint16'))
+        self.assertTrue(numpy.array_equal(reader[::2, 3:], ref[::2, 3:]))
+
+    def test_scaled_dtype(self):
+        for filedtype, bscale, bzero, blank, dtype in [
+            ('>f4', 1, 0, None, 'float32'),
+            ('>i2', 1, 0, None, 'int16'),
+            ('>i2', 1, 0, 7, 'float32'),
+            ('>f8', 1, 0, 7, 'float64'),
+            ('>i2', 1, 32768, None, 'uint16'),
+            ('>i4', 1, 2**31, None, 'uint32'),
+            ('>i2', 2.0, 0, None, 'float32'),
+            ('>i4', 1, 10, None, 'float64'),
+            ]:
+            self.assertEqual(RegionReader.scaled_dtype(
+                numpy.dtype(filedtype), bscale, bzero, blank=blank),
+                             numpy.dtype(dtype))
+
+    def test_scaled_array(self):
+        raw = (self.make_data(shape=(3, 10, 20)) % 3000).astype('>i2')
+        header = pyfits.PrimaryHDU(raw).header
+        self.assertFalse(RegionReader.is_scaled(header))
+        header['BSCALE'] = 0.5
+        self.assertTrue(RegionReader.is_scaled(header))
+        arr = RegionReader.ScaledArray(raw, header)
+        self.assertEqual((len(arr), arr.shape, arr.ndim), (3, raw.shape, 3))
+        self.assertEqual(arr.dtype, numpy.dtype('float32'))
+        self.assertTrue(numpy.array_equal(arr[1], raw[1] * 0.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
@@ -0,0 +1,152 @@
+#
+# test_SliceCache.py -- tests of the cache of the slices of FITS cubes
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import os
+import shutil
+import tempfile
+import logging
+import threading
+import unittest
+import warnings
+
+import numpy
+import pyfits
+
+from ginga import SliceCache, CubePlayer
+
+
+class SliceCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.logger = logging.getLogger('test_SliceCache')
+        self.tmpdir = tempfile.mkdtemp()
+        self.fits_f = None
+
+    def tearDown(self):
+        if self.fits_f != None:
+            self.fits_f.close()
+        shutil.rmtree(self.tmpdir)
+
+    def open_cube(self, data, **kwds):
+        path = os.path.join(self.tmpdir, 'cube.fits')
+        hdu = pyfits.PrimaryHDU(data)
+        for kwd, value in kwds.items():
+            hdu.header[kwd] = value
+        hdu.writeto(path)
+        self.fits_f = pyfits.open(path, 'readonly', memmap=True,
+                                  do_not_scale_image_data=True)
+        return path
+
+    def make_cache(self, path, maxbytes):
+        return SliceCache.SliceCache(self.fits_f, path, maxbytes=maxbytes,
+                                     logger=self.logger)
+
+    def test_get(self):
+        data = numpy.arange(5 * 3 * 4).reshape((5, 3, 4)).astype('>f4')
+        path = self.open_cube(data)
+        cache = self.make_cache(path, 10000)
+        self.assertEqual(cache.get_dims(0), [4, 3, 5])
+        image = cache.get(0, [2])
+        self.assertTrue(image.get_data().dtype.isnative)
+        self.assertTrue(numpy.array_equal(image.get_data(), data[2]))
+        self.assertTrue(cache.get(0, [2]) is image)
+        stats = cache.get_stats()
+        self.assertEqual((stats.hits, stats.misses), (1, 1))
+
+    def test_lru(self):
+        # each slice is 48 bytes: room for three
+        data = numpy.zeros((5, 3, 4), dtype='>f4')
+        path = self.open_cube(data)
+        cache = self.make_cache(path, 150)
+        for i in (0, 1, 2):
+            cache.get(0, [i])
+        cache.get(0, [0])
+        cache.get(0, [3])
+        stats = cache.get_stats()
+        self.assertEqual(stats.count, 3)
+        self.assertEqual(stats.totalbytes, 3 * 48)
+        # slice 1 was the least recently used
+        self.assertEqual(sorted(cache.cache.keys()),
+                         [(0, (0,)), (0, (2,)), (0, (3,))])
+
+    def test_prefetch(self):
+        data = numpy.zeros((5, 3, 4), dtype='>f4')
+        path = self.open_cube(data)
+        cache = self.make_cache(path, 10000)
+        prepared = []
+        cache.prefetch(0, [3], 0, count=3, prepare=prepared.append)
+        # wraps around at the end of the axis
+        self.assertEqual(sorted(cache.cache.keys()),
+                         [(0, (0,)), (0, (1,)), (0, (3,)), (0, (4,))])
+        self.assertEqual(len(prepared), 3)
+
+    def test_close(self):
+        data = numpy.zeros((5, 3, 4), dtype='>f4')
+        path = self.open_cube(data)
+        cache = self.make_cache(path, 10000)
+        started = threading.Event()
+        release = threading.Event()
+        prepared = []
+
+        def prepare(image):
+            prepared.append(image)
+            started.set()
+            release.wait()
+
+        thread = threading.Thread(target=cache.prefetch,
+                                  args=(0, [0], 0),
+                                  kwargs=dict(prepare=prepare))
+        thread.start()
+        started.wait()
+        closed = threading.Event()
+
+        def close():
+            cache.close()
+            closed.set()
+
+        threading.Thread(target=close).start()
+        # waits for the prefetch, which then stops
+        self.assertFalse(closed.wait(0.2))
+        release.set()
+        self.assertTrue(closed.wait(5.0))
+        thread.join()
+        self.assertEqual(len(prepared), 1)
+        self.assertEqual(cache.get_stats().count, 0)
+
+        # and does nothing afterwards
+        cache.prefetch(0, [0], 0)
+        self.assertEqual(cache.get_stats().count, 0)
+
+    def test_scaled(self):
+        raw = (numpy.arange(5 * 3 * 4).reshape((5, 3, 4))).astype('int16')
+        path = self.open_cube(raw, BSCALE=0.5, BZERO=10.0, BLANK=7)
+        ref = pyfits.getdata(path)
+        cache = self.make_cache(path, 10000)
+        image = cache.get(0, [0])
+        data = image.get_data()
+        self.assertEqual(data.dtype, ref.dtype)
+        self.assertTrue(numpy.isnan(data[1, 3]))
+        self.assertTrue(numpy.array_equal(numpy.nan_to_num(data),
+                                          numpy.nan_to_num(ref[0])))
+        # the keywords no longer apply to the data of the image
+        self.assertEqual(image.get_header().get('BSCALE', 1), 1)
+
+        # and the same slices are played back
+        player = CubePlayer.CubePlayer(self.fits_f[0].data, [0], 0,
+                                       header=self.fits_f[0].header,
+                                       logger=self.logger)
+        data = player.get_slice(3)
+        self.assertTrue(numpy.array_equal(data, ref[3]))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
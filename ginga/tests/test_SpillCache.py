@@ -0,0 +1,92 @@
+#
+# test_SpillCache.py -- tests of the disk tier for evicted images
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import os
+import logging
+import unittest
+
+import numpy
+
+from ginga import SpillCache, AstroImage
+
+
+class SpillCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_SpillCache')
+        self.cache = SpillCache.SpillCache(logger=self.logger)
+
+    def tearDown(self):
+        self.cache.clear()
+
+    def make_image(self, value=1.0, shape=(40, 30)):
+        data = numpy.empty(shape, dtype=numpy.float32)
+        data.fill(value)
+        image = AstroImage.AstroImage(data_np=data, logger=self.logger)
+        image.set(name='image%d' % value, path=None, object='M31')
+        return image
+
+    def test_round_trip(self):
+        image = self.make_image(3.0)
+        image.cutcache[('zscale', None)] = (1.0, 5.0)
+        self.assertTrue(self.cache.spill('chan', 'image3', image))
+        self.assertTrue(self.cache.has('chan', 'image3'))
+
+        other = self.cache.restore('chan', 'image3', logger=self.logger)
+        self.assertTrue(isinstance(other, AstroImage.AstroImage))
+        self.assertTrue(numpy.array_equal(other.get_data(),
+                                          image.get_data()))
+        self.assertEqual(other.get('object'), 'M31')
+        self.assertEqual(other.cutcache[('zscale', None)], (1.0, 5.0))
+        # mapped from the spill file, which is not to be written again
+        self.assertTrue(AstroImage.is_memmap(other.get_data()))
+        self.assertTrue(other.get('memmap'))
+        self.assertTrue(other.get('spilled'))
+
+        # copy-on-write: changing the restored data leaves the file be
+        other.get_data()[0, 0] = 0.0
+        again = self.cache.restore('chan', 'image3', logger=self.logger)
+        self.assertEqual(again.get_data()[0, 0], 3.0)
+
+    def test_not_array(self):
+        image = self.make_image()
+        image.set_data([[1, 2], [3, 4]])
+        self.assertFalse(self.cache.spill('chan', 'list', image))
+        self.assertFalse(self.cache.has('chan', 'list'))
+
+    def test_maxbytes(self):
+        image = self.make_image()
+        self.cache.spill('chan', 'a', image)
+        size = self.cache.get_stats().totalbytes
+        self.cache.maxbytes = 2 * size + size // 2
+
+        self.cache.spill('chan', 'b', image)
+        # restoring makes 'a' the most recently used
+        self.cache.restore('chan', 'a')
+        self.cache.spill('chan', 'c', image)
+
+        stats = self.cache.get_stats()
+        self.assertEqual(stats.count, 2)
+        self.assertEqual(stats.totalbytes, 2 * size)
+        self.assertTrue(self.cache.has('chan', 'a'))
+        self.assertFalse(self.cache.has('chan', 'b'))
+        self.assertTrue(self.cache.has('chan', 'c'))
+
+    def test_clear(self):
+        self.cache.spill('chan', 'a', self.make_image())
+        spilldir = self.cache.spilldir
+        self.cache.clear()
+        self.assertFalse(os.path.exists(spilldir))
+        self.assertEqual(self.cache.get_stats().totalbytes, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
@@ -0,0 +1,103 @@
+#
+# test_ThumbGen.py -- tests of making thumbnails
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import os
+import shutil
+import tempfile
+import logging
+import unittest
+import warnings
+
+import numpy
+
+from ginga import ThumbGen
+from ginga.tests import test_AstroImage
+
+# view settings of a thumbnail (as from ThumbGen.get_view_params())
+thumb_params = dict(width=50, color_map='ramp', intensity_map='ramp',
+                    color_algorithm='linear', color_hashsize=65536,
+                    autocut_method='histogram', autocut_hist_pct=0.999,
+                    autocut_bins=2048, flip_x=False, flip_y=False,
+                    swap_xy=False)
+
+
+class ThumbGenTestCase(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.logger = logging.getLogger('test_ThumbGen')
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, name):
+        return os.path.join(self.tmpdir, name)
+
+    def check_thumb(self, path):
+        res = ThumbGen.make_thumb(path, thumb_params, keywords=['NAXIS1'])
+        self.assertEqual(res[0], path)
+        self.assertEqual(res[3], None)
+        rgb = res[1]
+        # long side (the width) fits the thumbnail
+        self.assertEqual(rgb.shape, (50, 42, 3))
+        self.assertEqual(rgb.dtype, numpy.uint8)
+        # not a blank thumbnail
+        self.assertTrue(rgb.max() > rgb.min())
+        self.assertEqual(res[2], dict(NAXIS1=50))
+
+    def test_float(self):
+        self.check_thumb(test_AstroImage.write_float(self.path('f.fits')))
+
+    def test_uint16(self):
+        self.check_thumb(test_AstroImage.write_uint16(self.path('u.fits')))
+
+    def test_bscaled(self):
+        self.check_thumb(test_AstroImage.write_bscaled(self.path('s.fits')))
+
+    def test_error(self):
+        path = self.path('missing.fits')
+        res = ThumbGen.make_thumb(path, thumb_params)
+        self.assertEqual(res[1], None)
+        self.assertNotEqual(res[3], None)
+
+    def generate(self, numworkers):
+        paths = [ test_AstroImage.write_float(self.path('%d.fits' % i))
+                  for i in xrange(3) ]
+        results = []
+        thumbgen = ThumbGen.ThumbGenerator(numworkers=numworkers,
+                                           logger=self.logger)
+        thumbgen.generate(paths, thumb_params, results.append)
+        self.assertEqual([ res.path for res in results ], paths)
+        for res in results:
+            self.assertEqual(res.errmsg, None)
+            self.assertEqual(res.rgb.shape, (50, 42, 3))
+
+    def test_generate(self):
+        self.generate(1)
+
+    def test_no_pool(self):
+        # made in this process if no pool was started
+        self.assertEqual(ThumbGen.get_pool(2), None)
+        self.generate(2)
+
+    def test_pool(self):
+        ThumbGen.start_pool(2)
+        try:
+            self.assertNotEqual(ThumbGen.get_pool(2), None)
+            self.assertEqual(ThumbGen.get_pool(1), None)
+            self.generate(2)
+        finally:
+            ThumbGen.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
@@ -0,0 +1,183 @@
+#
+# test_ThumbStore.py -- tests of the packed store of thumbnails
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import os
+import shutil
+import tempfile
+import logging
+import unittest
+import cPickle as pickle
+
+import numpy
+
+from ginga import ThumbStore
+
+
+class ThumbStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_ThumbStore')
+        self.tmpdir = tempfile.mkdtemp()
+        self.srcdir = os.path.join(self.tmpdir, 'src')
+        self.thumbdir = os.path.join(self.tmpdir, 'thumbs')
+        os.mkdir(self.srcdir)
+        os.mkdir(self.thumbdir)
+        self.key = ThumbStore.get_params_key(dict(width=50,
+                                                  autocuts='histogram'))
+        for name in ('a.fits', 'b.fits', 'c.fits'):
+            self.touch(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def touch(self, name, text='data'):
+        with open(os.path.join(self.srcdir, name), 'wb') as out_f:
+            out_f.write(text)
+
+    def open_store(self):
+        return ThumbStore.ThumbStore(self.srcdir, self.thumbdir,
+                                     logger=self.logger)
+
+    def make_rgb(self, value, shape=(5, 4)):
+        rgb = numpy.empty(shape + (3,), dtype=numpy.uint8)
+        rgb.fill(value)
+        return rgb
+
+    def add(self, store, names):
+        items = [ (name, self.make_rgb(i + 1), dict(name=name))
+                  for i, name in enumerate(names) ]
+        store.add(items, self.key)
+
+    def test_params_key(self):
+        params = dict(width=50, autocuts='histogram')
+        self.assertEqual(ThumbStore.get_params_key(params),
+                         ThumbStore.get_params_key(dict(params)))
+        params['width'] = 60
+        self.assertNotEqual(ThumbStore.get_params_key(params), self.key)
+
+    def test_round_trip(self):
+        store = self.open_store()
+        self.add(store, ['a.fits', 'b.fits'])
+        store.save()
+
+        store = self.open_store()
+        self.assertEqual(store.get_stats().count, 2)
+        res = store.lookup(['a.fits', 'b.fits', 'c.fits'], self.key)
+        self.assertEqual(sorted(res.keys()), ['a.fits', 'b.fits'])
+        rgb, metadata = res['b.fits']
+        self.assertTrue(numpy.array_equal(rgb, self.make_rgb(2)))
+        self.assertEqual(metadata, dict(name='b.fits'))
+
+        # made with other view settings
+        self.assertEqual(store.lookup(['a.fits'], 'other'), {})
+
+    def test_stale(self):
+        store = self.open_store()
+        self.add(store, ['a.fits', 'b.fits', 'c.fits'])
+        store.save()
+
+        # a changed file and a removed one
+        self.touch('a.fits', text='new data')
+        os.remove(os.path.join(self.srcdir, 'c.fits'))
+        store = self.open_store()
+        self.assertEqual(store.get_stats().count, 2)
+        res = store.lookup(['a.fits', 'b.fits'], self.key)
+        self.assertEqual(res.keys(), ['b.fits'])
+        self.assertEqual(store.get_stats().count, 1)
+
+    def test_compact(self):
+        store = self.open_store()
+        self.add(store, ['a.fits', 'b.fits', 'c.fits'])
+        store.save()
+        blobpath = os.path.join(self.thumbdir, ThumbStore.blob_name)
+        size = os.path.getsize(blobpath)
+
+        # replacing two thumbs leaves less than half of the blob dead
+        store.add([('a.fits', self.make_rgb(7), {}),
+                   ('c.fits', self.make_rgb(8), {})], self.key)
+        store.save()
+        self.assertEqual(os.path.getsize(blobpath), size * 5 // 3)
+        # and replacing them again, more
+        store.add([('a.fits', self.make_rgb(7), {}),
+                   ('c.fits', self.make_rgb(9), {})], self.key)
+        store.save()
+        self.assertEqual(os.path.getsize(blobpath), size)
+
+        store = self.open_store()
+        res = store.lookup(['a.fits', 'b.fits', 'c.fits'], self.key)
+        self.assertTrue(numpy.array_equal(res['a.fits'][0],
+                                          self.make_rgb(7)))
+        self.assertTrue(numpy.array_equal(res['b.fits'][0],
+                                          self.make_rgb(2)))
+        self.assertTrue(numpy.array_equal(res['c.fits'][0],
+                                          self.make_rgb(9)))
+
+    def test_compact_failed(self):
+        store = self.open_store()
+        self.add(store, ['a.fits', 'b.fits', 'c.fits'])
+        store.save()
+        store.add([('a.fits', self.make_rgb(7), {}),
+                   ('c.fits', self.make_rgb(8), {})], self.key)
+        store.add([('a.fits', self.make_rgb(7), {}),
+                   ('c.fits', self.make_rgb(9), {})], self.key)
+        blobpath = os.path.join(self.thumbdir, ThumbStore.blob_name)
+        size = os.path.getsize(blobpath)
+
+        # fails to write the index after compacting
+        def dump(info, out_f, protocol):
+            raise IOError("disk full")
+        saved, pickle.dump = pickle.dump, dump
+        try:
+            store.save()
+        finally:
+            pickle.dump = saved
+        # left as it was
+        self.assertEqual(os.path.getsize(blobpath), size)
+        self.assertEqual(os.listdir(self.thumbdir).count(
+            ThumbStore.blob_name + '.tmp'), 0)
+        res = store.lookup(['a.fits', 'b.fits', 'c.fits'], self.key)
+        self.assertTrue(numpy.array_equal(res['c.fits'][0],
+                                          self.make_rgb(9)))
+
+        store.save()
+        self.assertTrue(os.path.getsize(blobpath) < size)
+        store = self.open_store()
+        res = store.lookup(['a.fits', 'b.fits', 'c.fits'], self.key)
+        self.assertTrue(numpy.array_equal(res['c.fits'][0],
+                                          self.make_rgb(9)))
+        self.assertTrue(numpy.array_equal(res['b.fits'][0],
+                                          self.make_rgb(2)))
+
+    def test_bad_index(self):
+        store = self.open_store()
+        self.add(store, ['a.fits'])
+        store.save()
+        indexpath = os.path.join(self.thumbdir, ThumbStore.index_name)
+        with open(indexpath, 'wb') as out_f:
+            pickle.dump(dict(version=ThumbStore.index_version + 1,
+                             entries={}), out_f)
+        store = self.open_store()
+        self.assertEqual(store.get_stats().count, 0)
+
+    def test_truncated(self):
+        store = self.open_store()
+        self.add(store, ['a.fits', 'b.fits'])
+        store.save()
+        blobpath = os.path.join(self.thumbdir, ThumbStore.blob_name)
+        with open(blobpath, 'r+b') as out_f:
+            out_f.truncate(5 * 4 * 3 + 10)
+        store = self.open_store()
+        res = store.lookup(['a.fits', 'b.fits'], self.key)
+        self.assertEqual(res.keys(), ['a.fits'])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
@@ -0,0 +1,132 @@
+#
+# test_TileCompress.py -- tests of reading tile-compressed FITS images
+#
+# Eric Jeschke (eric@naoj.org)
+#
+# Copyright (c) Eric R. Jeschke.  All rights reserved.
+# This is open-source software licensed under a BSD license.
+# Please see the file LICENSE.txt for details.
+#
+import os
+import shutil
+import tempfile
+import logging
+import unittest
+import warnings
+
+import numpy
+import pyfits
+
+from ginga import TileCompress
+
+
+class TileReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        warnings.simplefilter('ignore')
+        self.logger = logging.getLogger('test_TileCompress')
+        self.tmpdir = tempfile.mkdtemp()
+        self.readers = []
+
+    def tearDown(self):
+        for reader in self.readers:
+            reader.close()
+        shutil.rmtree(self.tmpdir)
+
+    def open_reader(self, data, tile_size=None, naxispath=None,
+                    numworkers=1, compression_type='RICE_1'):
+        path = os.path.join(self.tmpdir, 'image.fits')
+        hdu = pyfits.CompImageHDU(data, compression_type=compression_type,
+                                  tile_size=tile_size)
+        pyfits.HDUList([pyfits.PrimaryHDU(), hdu]).writeto(path,
+                                                           clobber=True)
+        fits_f = pyfits.open(path, 'readonly')
+        try:
+            offset = fits_f.fileinfo(1)['datLoc']
+            # (the header of the tile table)
+            header = fits_f[1]._header.copy()
+            ref = fits_f[1].data
+        finally:
+            fits_f.close()
+        reader = TileCompress.TileReader(path, offset, header,
+                                         naxispath=naxispath,
+                                         numworkers=numworkers,
+                                         logger=self.logger)
+        self.readers.append(reader)
+        return reader, ref
+
+    def make_data(self, shape=(300, 70), dtype='int32'):
+        size = numpy.prod(shape)
+        return (numpy.arange(size).reshape(shape) % 1000).astype(dtype)
+
+    def check_reads(self, reader, ref):
+        self.assertEqual(reader.shape, ref.shape[-2:])
+        self.assertEqual(reader.dtype, ref.dtype.newbyteorder('='))
+        for key in [(slice(None), slice(None)),
+                    (slice(150, 290), slice(10, 45)),
+                    (slice(None, None, 40), slice(5, None, 7)),
+                    (slice(None, None, -3), slice(60, 2, -4)),
+                    (17, slice(None)),
+                    ]:
+            self.assertTrue(numpy.array_equal(reader[key], ref[key]), key)
+        idx = numpy.ix_([0, 131, 299], [3, 60, 1])
+        self.assertTrue(numpy.array_equal(reader[idx], ref[idx]))
+
+    def test_rows(self):
+        # tiles of whole rows, as made by fpack
+        reader, ref = self.open_reader(self.make_data())
+        self.assertEqual((reader.ntx, reader.nty), (1, 300))
+        self.check_reads(reader, ref)
+
+    def test_tiles(self):
+        reader, ref = self.open_reader(self.make_data(),
+                                       tile_size=[16, 32])
+        self.assertEqual((reader.ntx, reader.nty), (5, 10))
+        self.check_reads(reader, ref)
+
+    def test_float(self):
+        # quantized, with dithering seeded by the row of each tile
+        data = numpy.random.RandomState(0).normal(100.0, 10.0, (300, 70))
+        reader, ref = self.open_reader(data.astype('float32'),
+                                       tile_size=[70, 20])
+        self.check_reads(reader, ref)
+
+    def test_cube(self):
+        data = self.make_data(shape=(3, 40, 30))
+        reader, ref = self.open_reader(data, tile_size=[30, 8, 1],
+                                       naxispath=[2])
+        self.assertTrue(numpy.array_equal(reader[:, :], ref[2]))
+
+    def test_cache(self):
+        reader, ref = self.open_reader(self.make_data(),
+                                       tile_size=[16, 32])
+        reader[0:10, 0:10]
+        stats = reader.get_stats()
+        self.assertEqual((stats.blocks, stats.hits, stats.misses), (1, 0, 1))
+        # one more tile is decompressed
+        reader[5:40, 2:12]
+        stats = reader.get_stats()
+        self.assertEqual((stats.blocks, stats.hits, stats.misses), (2, 1, 2))
+
+    def test_pool(self):
+        TileCompress.start_pool(2)
+        try:
+            self.assertNotEqual(TileCompress.get_pool(2), None)
+            reader, ref = self.open_reader(self.make_data(),
+                                           tile_size=[16, 32], numworkers=2)
+            self.assertTrue(numpy.array_equal(reader[:, :], ref))
+        finally:
+            TileCompress.shutdown()
+
+    def test_no_pool(self):
+        # decompressed in this process if no pool was started
+        self.assertEqual(TileCompress.get_pool(2), None)
+        reader, ref = self.open_reader(self.make_data(),
+                                       tile_size=[16, 32], numworkers=2)
+        self.assertTrue(numpy.array_equal(reader[:, :], ref))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#END
@@ -211,6 +211,18 @@ class BaseWCS(object):
         """
         pass
 
+    def radectopix_arrays(self, ra_deg, dec_deg, coords='data'):
+        """Convert arrays of ra and dec (in degrees) to arrays of x and y
+        pixel coordinates.  Subclasses can override this with a faster,
+        vectorized conversion.
+        """
+        n = len(ra_deg)
+        x, y = numpy.empty(n), numpy.empty(n)
+        for i in xrange(n):
+            x[i], y[i] = self.radectopix(ra_deg[i], dec_deg[i],
+                                         coords=coords)
+        return (x, y)
+
     
 class BareBonesWCS(BaseWCS):
     """A very basic WCS.  Assumes J2000, units in degrees, projection TAN.
@@ -346,6 +358,32 @@ class BareBonesWCS(BaseWCS):
             x, y = x - 1, y - 1
         return (x, y)
 
+    def radectopix_arrays(self, ra_deg, dec_deg, coords='data'):
+        crpix1, crpix2 = self.get_reference_pixel()
+        crval1, crval2 = self.get_physical_reference_pixel()
+        cd11, cd12, cd21, cd22 = self.get_pixel_coordinates()
+
+        # reverse matrix
+        rmatrix = (cd11 * cd22) - (cd12 * cd21)
+
+        if not cmp(rmatrix, 0.0):
+            raise WCSError("WCS Matrix Error: check values")
+
+        # Adjust RA as necessary
+        dra = numpy.asarray(ra_deg, dtype=numpy.float_) - crval1
+        dra = numpy.where(dra > 180.0, dra - 360.0, dra)
+        dra = numpy.where(dra < -180.0, dra + 360.0, dra)
+        ddec = numpy.asarray(dec_deg, dtype=numpy.float_) - crval2
+
+        cosdec = math.cos(crval2 * math.pi/180.0)
+        x = (cd22 * cosdec * dra - cd12 * ddec) / rmatrix + crpix1
+        y = (cd11 * ddec - cd21 * cosdec * dra) / rmatrix + crpix2
+
+        # account for FITS->DATA space
+        if coords == 'data':
+            x, y = x - 1, y - 1
+        return (x, y)
+
 
 class WcslibWCS(BaseWCS):
     """A WCS interface for pywcs (a wrapper for Mark Calabretta's WCSLIB).
@@ -450,6 +488,24 @@ class WcslibWCS(BaseWCS):
         y = float(pix[0, 1])
         return (x, y)
 
+    def radectopix_arrays(self, ra_deg, dec_deg, coords='data'):
+        if coords == 'data':
+            origin = 0
+        else:
+            origin = 1
+
+        skycrd = numpy.empty((len(ra_deg), 2), numpy.float_)
+        skycrd[:, 0] = ra_deg
+        skycrd[:, 1] = dec_deg
+        try:
+            pix = self.wcs.wcs_sky2pix(skycrd, origin)
+
+        except Exception, e:
+            print ("Error calculating radectopix: %s" % (str(e)))
+            raise WCSError(e)
+
+        return (pix[:, 0], pix[:, 1])
+
 # Supply a WCS depending on what is installed
 if have_pywcs:
     class WCS(WcslibWCS):
@@ -19,6 +19,7 @@ setup(
     url = "http://ejeschke.github.com/ginga",
     packages = ['ginga', 'ginga.gtkw', 'ginga.gtkw.plugins', 'ginga.gtkw.tests',
                 'ginga.qtw', 'ginga.qtw.plugins', 'ginga.qtw.tests',
+                'ginga.tests',
                 'ginga.misc', 'ginga.misc.plugins',
                 'ginga.icons', 'ginga.util',
                 'ginga.doc'],